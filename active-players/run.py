@@ -9,17 +9,20 @@ Output is expectedly a fairly normal distribution
 """
 
 from collections import defaultdict
+from pathlib import Path
 import sys
 import re
 
-from tqdm import tqdm
 import matplotlib.pyplot as plt
 
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from script_utils.progress import progress_stdin  # noqa: E402
+
 
 pattern = re.compile(r'\[(White|Black)Elo "(\d+)"\]')
 totals = defaultdict(int)
 
-for line in tqdm(sys.stdin):
+for line in progress_stdin():
     match = pattern.match(line)
     if match:
         totals[match.group(2)] += 1
@@ -0,0 +1,70 @@
+"""
+PGN input for the analysis scripts, and the evaluations already embedded in it.
+
+Lichess exports and database dumps carry an `[%eval ...]` annotation after every move of each game
+that has had computer analysis, so for those games the engine has nothing left to do.
+`embedded_scores` reads them into python-chess scores (the position before the first move is never
+annotated), and the scripts only send the positions without one to the engine.
+
+`iter_pgn_games` streams games out of a .pgn (or .pgn.gz/.bz2/.zst) file. Games can be filtered on
+their headers before their moves are parsed, which is most of the cost of reading a big database.
+
+Example:
+for game in iter_pgn_games("lichess_db_2024-01.pgn.zst", accept=lambda headers: "Blitz" in headers["Event"]):
+    scores = embedded_scores(game)
+"""
+from typing import Callable, Iterator, List, Optional
+
+import chess
+import chess.engine
+import chess.pgn
+
+from pgn_parser.parse import open_pgn
+
+
+class FilteringGameBuilder(chess.pgn.GameBuilder):
+    """Builds a game only if `accept` likes its headers, and skips the movetext otherwise."""
+
+    def __init__(self, accept: Callable[[chess.pgn.Headers], bool]):
+        super().__init__()
+        self.accept = accept
+        self.skipped = False
+
+    def begin_game(self) -> None:
+        super().begin_game()
+        self.skipped = False
+
+    def end_headers(self) -> Optional[chess.pgn.SkipType]:
+        if self.accept(self.game.headers):
+            return None
+
+        self.skipped = True
+        return chess.pgn.SKIP
+
+
+def iter_pgn_games(
+    path: str, accept: Optional[Callable[[chess.pgn.Headers], bool]] = None
+) -> Iterator[chess.pgn.Game]:
+    """The games in a PGN file whose headers `accept` returns True for (all of them by default)."""
+    builder = FilteringGameBuilder(accept or (lambda headers: True))
+    with open_pgn(path) as pgn:
+        while True:
+            game = chess.pgn.read_game(pgn, Visitor=lambda: builder)
+            if game is None:
+                return
+
+            if not builder.skipped:
+                yield game
+
+
+def embedded_scores(game: chess.pgn.Game) -> List[Optional[chess.engine.PovScore]]:
+    """
+    The annotated evaluation of the position before each move and after the last one,
+    aligned with the game's positions; None where there's no annotation.
+    """
+    return [game.eval()] + [node.eval() for node in game.mainline()]
+
+
+def is_fully_annotated(scores: List[Optional[chess.engine.PovScore]]) -> bool:
+    """Whether every position after the first has an evaluation (the first never does)."""
+    return len(scores) > 1 and all(score is not None for score in scores[1:])
@@ -0,0 +1,140 @@
+"""
+Two-pass engine budgeting: a cheap search for every position, and the full search only where it matters.
+
+Most positions a script looks at aren't close calls: a move that drops a piece isn't brilliant at any
+depth, and a position that's +4 isn't "about +1". TwoPass analyses each position at a shallow limit
+first (by default an eighth of the full one, or half its depth), asks the script whether that verdict
+is near one of its thresholds, and only searches the close calls again at the full limit.
+
+The engine time saved is estimated from the times the searches report: the positions that were
+settled by the shallow pass would each have cost about as much as the average full search did.
+
+Example:
+two_pass = TwoPass(pool, chess.engine.Limit(depth=10))
+info = await two_pass.analyse(board, lambda info: abs(info["score"].relative.score(mate_score=1000) - 100) < 100)
+print(two_pass)
+"""
+from typing import Callable, Iterable, List, Optional
+
+import argparse
+import asyncio
+
+import chess
+import chess.engine
+
+from analysis.pool import Analysis, EnginePool
+
+
+def shallow_limit(limit: chess.engine.Limit, fraction: int = 8) -> chess.engine.Limit:
+    """A cheaper version of `limit`: half the depth, or a `fraction` of the nodes or time."""
+    return chess.engine.Limit(
+        depth=max(1, limit.depth // 2) if limit.depth is not None else None,
+        nodes=max(1, limit.nodes // fraction) if limit.nodes is not None else None,
+        time=limit.time / fraction if limit.time is not None else None,
+    )
+
+
+def search_seconds(result: Analysis) -> float:
+    info = result[0] if isinstance(result, list) else result
+    return info.get("time", 0.0)
+
+
+class TwoPass:
+    def __init__(
+        self,
+        pool: EnginePool,
+        limit: chess.engine.Limit,
+        shallow: Optional[chess.engine.Limit] = None,
+        enabled: bool = True,
+    ):
+        self.pool = pool
+        self.limit = limit
+        self.shallow = (shallow or shallow_limit(limit)) if enabled else None
+        self.positions = 0
+        self.escalated = 0
+        self.shallow_seconds = 0.0
+        self.full_seconds = 0.0
+
+    async def _full(self, board: chess.Board, multipv: Optional[int]) -> Analysis:
+        result = await self.pool.analyse(board, self.limit, multipv)
+        self.full_seconds += search_seconds(result)
+        return result
+
+    async def analyse(
+        self, board: chess.Board, close_call: Callable[[Analysis], bool], multipv: Optional[int] = None
+    ) -> Analysis:
+        """
+        The shallow result when `close_call` says it's clear-cut, and the full one otherwise.
+        Callers should only rely on the shallow result for the decision `close_call` was asked about.
+        """
+        self.positions += 1
+        if self.shallow is None:
+            self.escalated += 1
+            return await self._full(board, multipv)
+
+        result = await self.pool.analyse(board, self.shallow, multipv)
+        self.shallow_seconds += search_seconds(result)
+        if not close_call(result):
+            return result
+
+        self.escalated += 1
+        return await self._full(board, multipv)
+
+    async def analyse_many(
+        self, boards: Iterable[chess.Board], close_call: Callable[[Analysis], bool], multipv: Optional[int] = None
+    ) -> List[Analysis]:
+        return await asyncio.gather(*[self.analyse(board, close_call, multipv) for board in boards])
+
+    async def analyse_game(
+        self,
+        boards: List[chess.Board],
+        close_calls: Callable[[List[Analysis]], Iterable[int]],
+        multipv: Optional[int] = None,
+    ) -> List[Analysis]:
+        """
+        Analyses a game's positions in order (see EnginePool.analyse_game), then searches again at the full
+        limit the positions whose indexes `close_calls` picks out of the shallow results.
+        """
+        self.positions += len(boards)
+        if self.shallow is None:
+            self.escalated += len(boards)
+            results = await self.pool.analyse_game(boards, self.limit, multipv)
+            self.full_seconds += sum(map(search_seconds, results))
+            return results
+
+        results = await self.pool.analyse_game(boards, self.shallow, multipv)
+        self.shallow_seconds += sum(map(search_seconds, results))
+
+        indexes = sorted(set(close_calls(results)))
+        if indexes:
+            full = await self.pool.analyse_game([boards[index] for index in indexes], self.limit, multipv)
+            self.full_seconds += sum(map(search_seconds, full))
+            self.escalated += len(indexes)
+            for index, result in zip(indexes, full):
+                results[index] = result
+
+        return results
+
+    def fixed_budget_seconds(self) -> Optional[float]:
+        """Roughly what searching every position at the full limit would have cost, if any were."""
+        if not self.escalated:
+            return None
+
+        return self.positions * self.full_seconds / self.escalated
+
+    def __str__(self) -> str:
+        spent = self.shallow_seconds + self.full_seconds
+        summary = f"{self.escalated} of {self.positions} positions searched at the full limit"
+        fixed = self.fixed_budget_seconds()
+        if self.shallow is not None and fixed:
+            summary += f", {spent:.0f}s of engine time instead of about {fixed:.0f}s ({1 - spent / fixed:.0%} saved)"
+        elif self.shallow is not None:
+            summary += f", {spent:.0f}s of engine time on the shallow pass"
+
+        return summary
+
+
+def add_budget_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--fixed_budget", action="store_true", help="search every position at the full limit, without a shallow first pass"
+    )
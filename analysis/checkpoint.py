@@ -0,0 +1,89 @@
+"""
+Checkpoints for long analysis runs: each item's result is saved as soon as it's known.
+
+A Checkpoint is a SQLite file of results keyed by item (a game's URL, say) and by the settings that
+produced them (search limit, engine, thresholds...), so a run that's interrupted, by a crash or Ctrl-C,
+loses at most the items it was working on, and a rerun with the same settings skips everything already
+analysed and picks up the old results. Results under other settings are kept but not reused. Whole
+scopes (a finished monthly archive) can be marked done too, so a rerun doesn't even fetch them.
+
+Every write commits on its own, and the file is in WAL mode, so it's safe to read while a run is going.
+
+Example:
+checkpoint = Checkpoint("brilliancies_hikaru.sqlite", {"depth": 18, "engine": "Stockfish 16"})
+if checkpoint.get(url) is None:
+    checkpoint.put(url, {"brilliant": "Rxf7"})
+"""
+from typing import Any, Dict, Optional
+
+import json
+from pathlib import Path
+import sqlite3
+
+
+def settings_key(settings: Dict[str, Any]) -> str:
+    return json.dumps(settings, sort_keys=True, separators=(",", ":"))
+
+
+class Checkpoint:
+    def __init__(self, path: str, settings: Dict[str, Any]):
+        self.path = Path(path)
+        self.settings = settings_key(settings)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS results (
+                item TEXT NOT NULL,
+                settings TEXT NOT NULL,
+                result TEXT NOT NULL,
+                finished REAL NOT NULL DEFAULT (julianday('now')),
+                PRIMARY KEY (item, settings)
+            )
+            """
+        )
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS done (
+                scope TEXT NOT NULL,
+                settings TEXT NOT NULL,
+                PRIMARY KEY (scope, settings)
+            )
+            """
+        )
+
+    def get(self, item: str) -> Optional[Any]:
+        row = self.connection.execute(
+            "SELECT result FROM results WHERE item = ? AND settings = ?", (item, self.settings)
+        ).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def put(self, item: str, result: Any) -> None:
+        self.connection.execute(
+            "INSERT OR REPLACE INTO results (item, settings, result) VALUES (?, ?, ?)",
+            (item, self.settings, json.dumps(result)),
+        )
+
+    def results(self) -> Dict[str, Any]:
+        """Every item's result under these settings, in the order they were finished."""
+        rows = self.connection.execute(
+            "SELECT item, result FROM results WHERE settings = ? ORDER BY finished, rowid", (self.settings,)
+        )
+        return {item: json.loads(result) for item, result in rows}
+
+    def mark_done(self, scope: str) -> None:
+        self.connection.execute("INSERT OR IGNORE INTO done (scope, settings) VALUES (?, ?)", (scope, self.settings))
+
+    def is_done(self, scope: str) -> bool:
+        row = self.connection.execute(
+            "SELECT 1 FROM done WHERE scope = ? AND settings = ?", (scope, self.settings)
+        ).fetchone()
+        return row is not None
+
+    def __len__(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM results WHERE settings = ?", (self.settings,)).fetchone()[0]
+
+    def close(self) -> None:
+        self.connection.close()
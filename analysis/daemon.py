@@ -0,0 +1,421 @@
+"""
+A long-lived analysis service shared by every script on the machine.
+
+The daemon owns one engine pool (analysis.pool) and its evaluation cache, and serves positions to any
+number of clients over a Unix socket. The engines stay warm between scripts (no startup, and their hash
+tables carry over), and scripts running at the same time share the cores instead of each starting an
+engine per core. Jobs are queued by priority (lower first), and each client may have at most --quota
+jobs waiting or being analysed at once (a position, or a whole game, which only ever occupies one engine),
+so one big batch can't crowd out everyone else; a client over its quota waits for its own earlier jobs.
+
+When the daemon is running, the scripts' pool_from_args connects to it automatically (RemotePool has
+the same analyse/analyse_many/analyse_game methods as EnginePool); --daemon off makes a script start
+its own engines. The socket is at ~/.cache/chess-scripts/analysis.sock, or $CHESS_SCRIPTS_DAEMON.
+
+The protocol is one JSON object per line each way. A client says hello first, with its name:
+    {"op": "hello", "client": "find_games.py[1234]"}
+then sends requests tagged with an id, which are answered as they complete, in any order:
+    {"id": 1, "op": "analyse", "positions": [{"fen": ...}], "limit": {"depth": 12}, "multipv": 3, "priority": 0}
+    {"id": 2, "op": "game", "positions": [{"fen": ..., "moves": ["e2e4", ...]}, ...], "limit": {"nodes": 200000}}
+    {"id": 3, "op": "status"}
+"analyse" positions are analysed independently, "game" positions in order as one UCI game. The answer
+holds each position's lines (as stored by analysis.evalcache) or an error:
+    {"id": 1, "results": [[{"depth": 12, "cp": 31, "pv": ["e2e4", ...]}, ...]]}
+    {"id": 1, "error": "..."}
+
+Usage:
+python -m analysis.daemon serve --engine /usr/local/bin/stockfish --engines 8 --hash 256 &
+python -m analysis.daemon status
+"""
+from typing import Any, Dict, Iterable, List, Optional
+
+import argparse
+import asyncio
+from collections import defaultdict
+import itertools
+import json
+import os
+from pathlib import Path
+import signal
+import sys
+import time
+
+import chess
+import chess.engine
+
+from analysis.evalcache import line_records, lines_from_records
+from analysis.pool import (
+    DEFAULT_PRIORITY,
+    Analysis,
+    EnginePool,
+    add_engine_arguments,
+    daemon_is_listening,
+    encode_limit,
+)
+from analysis.shortcuts import Shortcuts, default_shortcuts
+
+
+SOCKET_ENV = "CHESS_SCRIPTS_DAEMON"
+DEFAULT_SOCKET = Path.home() / ".cache" / "chess-scripts" / "analysis.sock"
+# jobs each client may have queued or in analysis, per engine in the pool
+DEFAULT_QUOTA_PER_ENGINE = 8
+# a whole game with its move stacks is a long line
+LINE_LIMIT = 1 << 24
+
+
+def default_socket_path() -> str:
+    return os.environ.get(SOCKET_ENV) or str(DEFAULT_SOCKET)
+
+
+def encode_board(board: chess.Board, stack: bool) -> Dict[str, Any]:
+    if not stack or not board.move_stack:
+        return {"fen": board.fen()}
+
+    return {"fen": board.root().fen(), "moves": [move.uci() for move in board.move_stack]}
+
+
+def decode_board(position: Dict[str, Any]) -> chess.Board:
+    board = chess.Board(position["fen"])
+    for move in position.get("moves", []):
+        board.push_uci(move)
+
+    return board
+
+
+def encode_result(result: Analysis) -> List[Dict[str, Any]]:
+    return line_records(result if isinstance(result, list) else [result])
+
+
+def decode_result(records: List[Dict[str, Any]], board: chess.Board, multipv: Optional[int]) -> Analysis:
+    lines = lines_from_records(records, board)
+    return lines if multipv else lines[0]
+
+
+async def send(writer: asyncio.StreamWriter, message: Dict[str, Any]) -> None:
+    writer.write(json.dumps(message, separators=(",", ":")).encode() + b"\n")
+    await writer.drain()
+
+
+class Quota:
+    """Lets a client have at most `limit` jobs outstanding; a bigger request waits until it's alone."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.outstanding = 0
+        self.changed = asyncio.Condition()
+
+    async def acquire(self, jobs: int) -> None:
+        async with self.changed:
+            await self.changed.wait_for(lambda: self.outstanding == 0 or self.outstanding + jobs <= self.limit)
+            self.outstanding += jobs
+
+    async def release(self, jobs: int) -> None:
+        async with self.changed:
+            self.outstanding -= jobs
+            self.changed.notify_all()
+
+
+class AnalysisDaemon:
+    def __init__(self, pool: EnginePool, path: str, quota: Optional[int] = None):
+        self.pool = pool
+        self.path = path
+        self.quota = quota
+        self.quotas: Dict[str, Quota] = {}
+        self.clients: Dict[str, Dict[str, float]] = defaultdict(
+            lambda: {"connections": 0, "requests": 0, "positions": 0, "outstanding": 0, "errors": 0}
+        )
+        self.connections = 0
+        self._started = time.time()
+        self._numbers = itertools.count(1)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "pid": os.getpid(),
+            "uptime": round(time.time() - self._started),
+            "engine": self.pool.engine_name,
+            "engines": self.pool.size,
+            "threads": self.pool.options["Threads"],
+            "hash_mb": self.pool.options["Hash"],
+            "utilization": round(self.pool.utilization(), 3),
+            "analysed": self.pool.analysed,
+            "queued": self.pool.queued(),
+            "restarts": self.pool.restarts,
+            "quota": self.quota,
+            "connections": self.connections,
+            "cache": self.pool.cache.summary() if self.pool.cache is not None else None,
+            "clients": self.clients,
+        }
+
+    async def _serve(self, request: Dict[str, Any], client: str, writer: asyncio.StreamWriter, lock: asyncio.Lock):
+        """Answers one analysis request; every failure is answered too, so the client never waits forever."""
+        stats = self.clients[client]
+        stats["requests"] += 1
+        request_id = request.get("id")
+        try:
+            op = request["op"]
+            if op not in ("analyse", "game"):
+                raise ValueError(f"unknown op {op!r}")
+            if not isinstance(request_id, int):
+                raise ValueError(f"id must be an integer, not {request_id!r}")
+            boards = [decode_board(position) for position in request["positions"]]
+            limit = chess.engine.Limit(**request["limit"])
+            multipv = request.get("multipv")
+            priority = request.get("priority", DEFAULT_PRIORITY)
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            stats["errors"] += 1
+            async with lock:
+                await send(writer, {"id": request_id, "error": f"bad request: {e!r}"})
+            return
+
+        jobs = 1 if op == "game" else len(boards)
+        quota = self.quotas.setdefault(client, Quota(self.quota))
+        await quota.acquire(jobs)
+        stats["outstanding"] += jobs
+        try:
+            if op == "game":
+                results = await self.pool.analyse_game(boards, limit, multipv, priority)
+            else:
+                results = await self.pool.analyse_many(boards, limit, multipv, priority)
+            response = {"id": request_id, "results": [encode_result(result) for result in results]}
+            stats["positions"] += len(boards)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            stats["errors"] += 1
+            response = {"id": request_id, "error": f"{type(e).__name__}: {e}"}
+        finally:
+            stats["outstanding"] -= jobs
+            await quota.release(jobs)
+
+        async with lock:
+            await send(writer, response)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        client = f"client-{next(self._numbers)}"
+        # responses from concurrent requests mustn't interleave
+        lock = asyncio.Lock()
+        tasks = set()
+        self.connections += 1
+        try:
+            while line := await reader.readline():
+                try:
+                    request = json.loads(line)
+                except json.JSONDecodeError as e:
+                    request = f"bad request: {e}"
+                if not isinstance(request, dict):
+                    # without an id to answer to; the client can only tell from the error
+                    async with lock:
+                        await send(writer, {"id": None, "error": request if isinstance(request, str) else "bad request: not an object"})
+                elif request.get("op") == "hello":
+                    client = request.get("client") or client
+                    self.clients[client]["connections"] += 1
+                    async with lock:
+                        await send(writer, {"id": request.get("id"), "engines": self.pool.size, "engine": self.pool.engine_name})
+                elif request.get("op") == "status":
+                    async with lock:
+                        await send(writer, {"id": request.get("id"), "status": self.status()})
+                else:
+                    task = asyncio.create_task(self._serve(request, client, writer, lock))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+        except ConnectionError:
+            pass
+        finally:
+            self.connections -= 1
+            # a client that goes away takes its queued positions with it
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            writer.close()
+
+    async def run(self) -> None:
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        if daemon_is_listening(self.path):
+            sys.exit(f"an analysis daemon is already listening on {self.path}")
+        # only a stale socket left behind by a daemon that was killed
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in [signal.SIGINT, signal.SIGTERM]:
+            loop.add_signal_handler(signum, stop.set)
+
+        async with self.pool:
+            self.quota = self.quota or self.pool.size * DEFAULT_QUOTA_PER_ENGINE
+            server = await asyncio.start_unix_server(self.handle, self.path, limit=LINE_LIMIT)
+            os.chmod(self.path, 0o600)
+            inode = os.stat(self.path).st_ino
+            print(f"analysis daemon on {self.path}: {self.pool.size} engines, quota {self.quota}", file=sys.stderr)
+            try:
+                await stop.wait()
+            finally:
+                server.close()
+                # the path may have been taken over by another daemon since, whose socket isn't ours to remove
+                try:
+                    if os.stat(self.path).st_ino == inode:
+                        os.unlink(self.path)
+                except FileNotFoundError:
+                    pass
+
+
+class RemotePool:
+    """The EnginePool interface, with the positions analysed by the daemon."""
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        priority: int = DEFAULT_PRIORITY,
+        client: Optional[str] = None,
+        shortcuts: Optional[Shortcuts] = None,
+    ):
+        self.path = path or default_socket_path()
+        self.priority = priority
+        # tablebase positions are answered here without a round trip, and the scripts check the book through it
+        self.shortcuts = shortcuts
+        self.client = client or f"{Path(sys.argv[0]).name}[{os.getpid()}]"
+        self.size = 1
+        self.engine_name = ""
+        self.analysed = 0
+        self._ids = itertools.count(1)
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._listener: Optional[asyncio.Task] = None
+
+    async def _listen(self) -> None:
+        try:
+            while line := await self._reader.readline():
+                response = json.loads(line)
+                future = self._pending.pop(response.get("id"), None)
+                if future is not None and not future.done():
+                    future.set_result(response)
+        finally:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(chess.engine.EngineTerminatedError("the analysis daemon went away"))
+            self._pending.clear()
+
+    async def _request(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        message["id"] = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[message["id"]] = future
+        await send(self._writer, message)
+        response = await future
+        if "error" in response:
+            raise chess.engine.EngineError(response["error"])
+
+        return response
+
+    async def start(self) -> "RemotePool":
+        self._reader, self._writer = await asyncio.open_unix_connection(self.path, limit=LINE_LIMIT)
+        self._listener = asyncio.create_task(self._listen())
+        hello = await self._request({"op": "hello", "client": self.client})
+        self.size = hello["engines"]
+        self.engine_name = hello["engine"]
+        return self
+
+    async def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+        if self._listener is not None:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+        if self.shortcuts is not None:
+            self.shortcuts.close()
+
+    async def __aenter__(self) -> "RemotePool":
+        return await self.start()
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
+
+    async def _analyse(
+        self, op: str, boards: List[chess.Board], limit: chess.engine.Limit, multipv: Optional[int], priority: Optional[int]
+    ) -> List[Analysis]:
+        results = [
+            self.shortcuts.tablebase_analysis(board, multipv) if self.shortcuts is not None else None for board in boards
+        ]
+        missing = [index for index, result in enumerate(results) if result is None]
+        if not missing:
+            return results
+
+        response = await self._request(
+            {
+                "op": op,
+                "positions": [encode_board(boards[index], stack=op == "game") for index in missing],
+                "limit": encode_limit(limit),
+                "multipv": multipv,
+                "priority": self.priority if priority is None else priority,
+            }
+        )
+        self.analysed += len(missing)
+        for index, records in zip(missing, response["results"]):
+            results[index] = decode_result(records, boards[index], multipv)
+
+        return results
+
+    def submit(
+        self, board: chess.Board, limit: chess.engine.Limit, multipv: Optional[int] = None, priority: Optional[int] = None
+    ) -> asyncio.Future:
+        return asyncio.ensure_future(self.analyse(board, limit, multipv, priority))
+
+    async def analyse(
+        self, board: chess.Board, limit: chess.engine.Limit, multipv: Optional[int] = None, priority: Optional[int] = None
+    ) -> Analysis:
+        return (await self._analyse("analyse", [board], limit, multipv, priority))[0]
+
+    async def analyse_many(
+        self,
+        boards: Iterable[chess.Board],
+        limit: chess.engine.Limit,
+        multipv: Optional[int] = None,
+        priority: Optional[int] = None,
+    ) -> List[Analysis]:
+        return await self._analyse("analyse", list(boards), limit, multipv, priority)
+
+    async def analyse_game(
+        self,
+        boards: Iterable[chess.Board],
+        limit: chess.engine.Limit,
+        multipv: Optional[int] = None,
+        priority: Optional[int] = None,
+    ) -> List[Analysis]:
+        return await self._analyse("game", list(boards), limit, multipv, priority)
+
+    async def status(self) -> Dict[str, Any]:
+        return (await self._request({"op": "status"}))["status"]
+
+    def __str__(self) -> str:
+        return f"{self.analysed} positions analysed by the daemon on {self.path} ({self.size} engines, {self.engine_name})"
+
+
+async def print_status(path: str) -> None:
+    async with RemotePool(path, client="status") as pool:
+        print(json.dumps(await pool.status(), indent=2))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run or query the shared analysis daemon")
+    parser.add_argument("command", choices=["serve", "status"])
+    parser.add_argument("--socket", type=str, default=None, help=f"socket path (defaults to ${SOCKET_ENV} or {DEFAULT_SOCKET})")
+    parser.add_argument(
+        "--quota",
+        type=int,
+        default=None,
+        help=f"jobs (positions or games) each client may have outstanding (defaults to {DEFAULT_QUOTA_PER_ENGINE} per engine)",
+    )
+    add_engine_arguments(parser, client=False)
+    args = parser.parse_args()
+
+    path = args.socket or default_socket_path()
+    if args.command == "status":
+        asyncio.run(print_status(path))
+        return
+
+    pool = EnginePool(args.engine, args.engines, args.threads, args.hash, shortcuts=default_shortcuts(args.book, args.syzygy))
+    asyncio.run(AnalysisDaemon(pool, path, args.quota).run())
+
+
+if __name__ == '__main__':
+    main()
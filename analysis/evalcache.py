@@ -0,0 +1,206 @@
+"""
+A persistent cache of engine evaluations, keyed by position.
+
+Positions are keyed by their EPD (the FEN without the move counters, and with an en passant
+square only when a capture is actually possible), so a position reached by different move orders
+or at different move numbers is one entry. Each entry also records the engine that produced it
+and how far it searched (depth, nodes, time) and with how many lines, and a request is served
+from the cache when an entry went at least as far: a depth-20 result answers a depth-18 request,
+and a multipv-3 result answers a single-line one. A position with fewer legal moves than the lines
+asked for only ever has that many, so its entries answer any larger multipv. Only the deepest entry
+per position is kept.
+
+EnginePool consults the default cache transparently, so re-analysing a player's history only
+pays for the positions that are new, and scripts share each other's evaluations. Requests limited
+by the clock or by mate search aren't cached.
+
+Set CHESS_SCRIPTS_EVAL_CACHE to a file path to move the cache, or to "off" to disable it.
+
+Usage:
+python -m analysis.evalcache            # show size and hit/miss statistics
+python -m analysis.evalcache --clear
+"""
+from typing import Any, Dict, List, Optional
+
+import argparse
+import json
+import os
+from pathlib import Path
+import sqlite3
+
+import chess
+import chess.engine
+
+
+CACHE_ENV = "CHESS_SCRIPTS_EVAL_CACHE"
+DEFAULT_PATH = Path.home() / ".cache" / "chess-scripts" / "evals.sqlite"
+
+
+def position_key(board: chess.Board) -> str:
+    return board.epd()
+
+
+def is_cacheable(limit: chess.engine.Limit) -> bool:
+    if limit.mate is not None or limit.white_clock is not None or limit.black_clock is not None:
+        return False
+
+    return limit.depth is not None or limit.nodes is not None or limit.time is not None
+
+
+def line_records(lines: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """The parts of each line worth keeping, as plain data, with scores from the side to move's point of view."""
+    encoded = []
+    for info in lines:
+        line = {key: info[key] for key in ["depth", "seldepth", "nodes", "time"] if key in info}
+        if "score" in info:
+            score = info["score"].relative
+            if score.is_mate():
+                line["mate"] = score.mate()
+            else:
+                line["cp"] = score.score()
+        if "pv" in info:
+            line["pv"] = [move.uci() for move in info["pv"]]
+        encoded.append(line)
+
+    return encoded
+
+
+def lines_from_records(records: List[Dict[str, Any]], board: chess.Board) -> List[Dict[str, Any]]:
+    lines = []
+    for index, line in enumerate(records, 1):
+        info = {key: line[key] for key in ["depth", "seldepth", "nodes", "time"] if key in line}
+        info["multipv"] = index
+        if "mate" in line:
+            info["score"] = chess.engine.PovScore(chess.engine.Mate(line["mate"]), board.turn)
+        elif "cp" in line:
+            info["score"] = chess.engine.PovScore(chess.engine.Cp(line["cp"]), board.turn)
+        if "pv" in line:
+            info["pv"] = [chess.Move.from_uci(move) for move in line["pv"]]
+        lines.append(info)
+
+    return lines
+
+
+def encode_lines(lines: List[Dict[str, Any]]) -> str:
+    return json.dumps(line_records(lines), separators=(",", ":"))
+
+
+def decode_lines(encoded: str, board: chess.Board) -> List[Dict[str, Any]]:
+    return lines_from_records(json.loads(encoded), board)
+
+
+class EvalCache:
+    def __init__(self, path: str = None):
+        self.path = Path(path or os.environ.get(CACHE_ENV) or DEFAULT_PATH)
+        self.stats = {"hits": 0, "misses": 0, "stores": 0}
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS evals (
+                position TEXT NOT NULL,
+                engine TEXT NOT NULL,
+                multipv INTEGER NOT NULL,
+                depth INTEGER,
+                nodes INTEGER,
+                seconds REAL,
+                lines TEXT NOT NULL,
+                PRIMARY KEY (position, engine, multipv)
+            )
+            """
+        )
+
+    def get(
+        self, board: chess.Board, limit: chess.engine.Limit, multipv: int = 1, engine: str = ""
+    ) -> Optional[List[Dict[str, Any]]]:
+        """
+        The first `multipv` lines of a cached search that went at least as far as `limit` on any of
+        its depth, nodes or time bounds (the engine stops at whichever it reaches first), or None.
+        """
+        if not is_cacheable(limit):
+            return None
+
+        # entries record the lines the engine found, which can't be more than there are legal moves
+        lines_needed = max(1, min(multipv, board.legal_moves.count()))
+        row = self.connection.execute(
+            """
+            SELECT lines FROM evals
+            WHERE position = ? AND engine = ? AND multipv >= ? AND (depth >= ? OR nodes >= ? OR seconds >= ?)
+            ORDER BY depth DESC LIMIT 1
+            """,
+            (position_key(board), engine, lines_needed, limit.depth, limit.nodes, limit.time),
+        ).fetchone()
+        if row is None:
+            self.stats["misses"] += 1
+            return None
+
+        self.stats["hits"] += 1
+        return decode_lines(row[0], board)[:multipv]
+
+    def put(
+        self, board: chess.Board, limit: chess.engine.Limit, lines: List[Dict[str, Any]], engine: str = ""
+    ) -> None:
+        if not is_cacheable(limit) or not lines:
+            return
+
+        # what the search reached, which can be more than was asked for; the engine's own report can
+        # fall just short of a time or node bound it stopped on (or of the depth when the game is over)
+        best = lines[0]
+        depth = max(best.get("depth", 0), limit.depth or 0) or None
+        nodes = max(best.get("nodes", 0), limit.nodes or 0) or None
+        seconds = max(best.get("time", 0), limit.time or 0) or None
+        self.connection.execute(
+            """
+            INSERT INTO evals (position, engine, multipv, depth, nodes, seconds, lines) VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (position, engine, multipv) DO UPDATE SET
+                depth = excluded.depth, nodes = excluded.nodes, seconds = excluded.seconds, lines = excluded.lines
+            WHERE COALESCE(excluded.depth, 0) >= COALESCE(depth, 0)
+            """,
+            (position_key(board), engine, len(lines), depth, nodes, seconds, encode_lines(lines)),
+        )
+        self.stats["stores"] += 1
+
+    def summary(self) -> Dict[str, float]:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        entries = self.connection.execute("SELECT COUNT(*) FROM evals").fetchone()[0]
+        return {
+            **self.stats,
+            "hit_rate": round(self.stats["hits"] / lookups, 3) if lookups else 0.0,
+            "entries": entries,
+            "bytes": self.path.stat().st_size,
+        }
+
+    def clear(self) -> None:
+        self.connection.execute("DELETE FROM evals")
+        self.connection.execute("VACUUM")
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+def default_eval_cache() -> Optional[EvalCache]:
+    """The cache every engine pool uses unless told otherwise; CHESS_SCRIPTS_EVAL_CACHE=off disables it."""
+    if os.environ.get(CACHE_ENV, "").lower() == "off":
+        return None
+
+    return EvalCache()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Inspect the engine evaluation cache")
+    parser.add_argument("--path", type=str, default=None, help=f"cache file (defaults to ${CACHE_ENV} or {DEFAULT_PATH})")
+    parser.add_argument("--clear", action="store_true", help="delete every cached evaluation")
+    args = parser.parse_args()
+
+    cache = EvalCache(args.path)
+    if args.clear:
+        cache.clear()
+
+    print(f"{cache.path}: {cache.summary()}")
+
+
+if __name__ == '__main__':
+    main()
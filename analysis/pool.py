@@ -0,0 +1,324 @@
+"""
+A pool of long-lived UCI engines sharing one queue of positions to analyse.
+
+Each of the `size` engines is started once, configured with its own Threads and Hash, and then
+pulls jobs off the queue until the pool is closed, so a script analysing thousands of positions
+pays for process startup once per engine rather than once per game, and keeps every engine busy.
+`analyse` queues a position and returns its result when an engine gets to it; many positions
+(from many games) can be in flight at once, so throughput scales with the number of engines.
+An engine that dies fails the job it was running and is restarted.
+
+`analyse_game` queues a whole game as one job instead: one engine goes through its positions in
+order as a single UCI game (one ucinewgame, then the hash carries over from move to move), so with
+a node or depth limit and one thread per engine the evaluations are the same from run to run.
+
+Positions already in the evaluation cache (analysis.evalcache) at the requested depth or deeper
+are answered from it without reaching an engine, and new results are added to it. So are positions
+in the local endgame tablebases, when there are some (analysis.shortcuts).
+
+Jobs carry a priority (lower goes first, ties in submission order), so an interactive request can
+overtake a long batch.
+
+By default there's one single-threaded engine per core; CHESS_SCRIPTS_ENGINES overrides that.
+When the analysis daemon (analysis.daemon) is running, pool_from_args connects to it instead of
+starting engines, so every script shares its warm engines, cache and cores.
+
+Example:
+async def evaluate(fens):
+    async with EnginePool("/usr/local/bin/stockfish", threads=1, hash_mb=64) as pool:
+        return await pool.analyse_many([chess.Board(fen) for fen in fens], chess.engine.Limit(depth=12))
+
+infos = asyncio.run(evaluate(fens))
+"""
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Union
+
+import argparse
+import asyncio
+import itertools
+import os
+import socket
+import sys
+import time
+
+import chess
+import chess.engine
+
+from analysis.evalcache import EvalCache, default_eval_cache
+from analysis.shortcuts import BOOK_ENV, SYZYGY_ENV, Shortcuts, default_shortcuts
+
+
+SIZE_ENV = "CHESS_SCRIPTS_ENGINES"
+DEFAULT_ENGINE = "/usr/local/bin/stockfish"
+DEFAULT_THREADS = 1
+DEFAULT_HASH_MB = 64
+DEFAULT_PRIORITY = 0
+
+# what engine.analyse returns: one info dict, or a list of them with multipv
+Analysis = Union[Dict[str, Any], List[Dict[str, Any]]]
+
+
+class Job(NamedTuple):
+    boards: List[chess.Board]
+    limit: chess.engine.Limit
+    multipv: Optional[int]
+    future: asyncio.Future
+    # whether the boards are the positions of one game, analysed in order on one engine
+    whole_game: bool
+
+
+def encode_limit(limit: chess.engine.Limit) -> Dict[str, Any]:
+    """The limit's bounds as plain data, for the daemon's protocol or to record what a result was searched with."""
+    return {key: getattr(limit, key) for key in ["depth", "nodes", "time", "mate"] if getattr(limit, key) is not None}
+
+
+def default_size(threads: int = DEFAULT_THREADS) -> int:
+    if os.environ.get(SIZE_ENV):
+        return max(1, int(os.environ[SIZE_ENV]))
+
+    return max(1, (os.cpu_count() or 1) // threads)
+
+
+class EnginePool:
+    def __init__(
+        self,
+        engine_path: str = DEFAULT_ENGINE,
+        size: Optional[int] = None,
+        threads: int = DEFAULT_THREADS,
+        hash_mb: int = DEFAULT_HASH_MB,
+        options: Optional[Dict[str, Any]] = None,
+        cache: Union[EvalCache, bool] = True,
+        shortcuts: Optional[Shortcuts] = None,
+    ):
+        self.engine_path = engine_path
+        self.size = size or default_size(threads)
+        self.options = {"Threads": threads, "Hash": hash_mb, **(options or {})}
+        self.cache = default_eval_cache() if cache is True else (cache or None)
+        self.shortcuts = shortcuts
+        # cached evaluations are only reused for the same engine
+        self.engine_name = ""
+        self.jobs: Optional[asyncio.PriorityQueue] = None
+        # breaks ties between jobs of the same priority, first come first served
+        self._sequence = itertools.count()
+        self.analysed = 0
+        self.restarts = 0
+        self.busy_seconds = 0.0
+        self._workers: List[asyncio.Task] = []
+        self._started = 0.0
+
+    async def _start_engine(self) -> chess.engine.UciProtocol:
+        _, engine = await chess.engine.popen_uci(self.engine_path)
+        # only the options this engine has, so other UCI engines work too
+        await engine.configure({name: value for name, value in self.options.items() if name in engine.options})
+        return engine
+
+    def _cached(self, board: chess.Board, limit: chess.engine.Limit, multipv: Optional[int]) -> Optional[Analysis]:
+        # tablebase results are exact, and quicker to probe again than to cache
+        if self.shortcuts is not None:
+            known = self.shortcuts.tablebase_analysis(board, multipv)
+            if known is not None:
+                return known
+
+        if self.cache is None:
+            return None
+
+        lines = self.cache.get(board, limit, multipv or 1, self.engine_name)
+        if lines is None:
+            return None
+
+        return lines if multipv else lines[0]
+
+    async def _analyse(self, engine: chess.engine.UciProtocol, job: Job) -> List[Analysis]:
+        results = []
+        for board in job.boards:
+            # a single position was looked up when it was submitted
+            result = self._cached(board, job.limit, job.multipv) if job.whole_game else None
+            if result is None:
+                # the same `game` for every position of a game, so the engine only clears its hash at the start
+                result = await engine.analyse(board, job.limit, multipv=job.multipv, game=job if job.whole_game else None)
+                self.analysed += 1
+                if self.cache is not None:
+                    self.cache.put(board, job.limit, result if job.multipv else [result], self.engine_name)
+            results.append(result)
+
+        return results
+
+    async def _work(self, engine: chess.engine.UciProtocol) -> None:
+        try:
+            while True:
+                _, _, job = await self.jobs.get()
+                if job.future.cancelled():
+                    continue
+
+                start = time.perf_counter()
+                try:
+                    results = await self._analyse(engine, job)
+                except (chess.engine.EngineError, chess.engine.EngineTerminatedError) as e:
+                    if not job.future.cancelled():
+                        job.future.set_exception(e)
+                    if engine.returncode.done():
+                        engine = await self._start_engine()
+                        self.restarts += 1
+                    continue
+                finally:
+                    self.busy_seconds += time.perf_counter() - start
+
+                if not job.future.cancelled():
+                    job.future.set_result(results if job.whole_game else results[0])
+        finally:
+            if not engine.returncode.done():
+                try:
+                    await asyncio.shield(engine.quit())
+                except chess.engine.EngineError:
+                    pass
+
+    async def start(self) -> "EnginePool":
+        self.jobs = asyncio.PriorityQueue()
+        engines = await asyncio.gather(*[self._start_engine() for _ in range(self.size)])
+        self.engine_name = engines[0].id.get("name", self.engine_path)
+        self._workers = [asyncio.create_task(self._work(engine)) for engine in engines]
+        self._started = time.perf_counter()
+        return self
+
+    async def close(self) -> None:
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        if self.cache is not None:
+            self.cache.close()
+            self.cache = None
+        if self.shortcuts is not None:
+            self.shortcuts.close()
+
+    async def __aenter__(self) -> "EnginePool":
+        return await self.start()
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
+
+    def _put(self, job: Job, priority: int) -> None:
+        self.jobs.put_nowait((priority, next(self._sequence), job))
+
+    def submit(
+        self,
+        board: chess.Board,
+        limit: chess.engine.Limit,
+        multipv: Optional[int] = None,
+        priority: int = DEFAULT_PRIORITY,
+    ) -> asyncio.Future:
+        """Queues a position and returns the future of its analysis. The board is copied, so it can be reused."""
+        future = asyncio.get_running_loop().create_future()
+        cached = self._cached(board, limit, multipv)
+        if cached is not None:
+            future.set_result(cached)
+            return future
+
+        self._put(Job([board.copy(stack=False)], limit, multipv, future, False), priority)
+        return future
+
+    async def analyse(
+        self,
+        board: chess.Board,
+        limit: chess.engine.Limit,
+        multipv: Optional[int] = None,
+        priority: int = DEFAULT_PRIORITY,
+    ) -> Analysis:
+        return await self.submit(board, limit, multipv, priority)
+
+    async def analyse_many(
+        self,
+        boards: Iterable[chess.Board],
+        limit: chess.engine.Limit,
+        multipv: Optional[int] = None,
+        priority: int = DEFAULT_PRIORITY,
+    ) -> List[Analysis]:
+        """Analyses every board across all the engines; results are in the order of `boards`."""
+        return await asyncio.gather(*[self.submit(board, limit, multipv, priority) for board in boards])
+
+    async def analyse_game(
+        self,
+        boards: Iterable[chess.Board],
+        limit: chess.engine.Limit,
+        multipv: Optional[int] = None,
+        priority: int = DEFAULT_PRIORITY,
+    ) -> List[Analysis]:
+        """
+        Analyses a game's positions, in order, on one engine as one UCI game; results are in the order of `boards`.
+        Many games can be analysed at once, one per engine.
+        """
+        future = asyncio.get_running_loop().create_future()
+        # with their move stacks, so the engine sees repetitions
+        self._put(Job([board.copy() for board in boards], limit, multipv, future, True), priority)
+        return await future
+
+    def queued(self) -> int:
+        return self.jobs.qsize() if self.jobs is not None else 0
+
+    def utilization(self) -> float:
+        elapsed = time.perf_counter() - self._started
+        return self.busy_seconds / (elapsed * self.size) if elapsed > 0 else 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"{self.analysed} positions on {self.size} engines ({self.options['Threads']} threads each), "
+            f"{self.utilization():.0%} busy"
+            + (f", {self.cache.stats['hits']} from the cache" if self.cache is not None else "")
+            + (f", {self.restarts} restarts" if self.restarts else "")
+        )
+
+
+def add_engine_arguments(parser: argparse.ArgumentParser, client: bool = True) -> None:
+    """The engine options, and with `client` the ones for using the daemon instead."""
+    parser.add_argument("--engine", type=str, default=DEFAULT_ENGINE, help="path to your stockfish uci engine")
+    parser.add_argument("--engines", type=int, default=None, help=f"engines to run at once (defaults to ${SIZE_ENV} or cores / threads)")
+    parser.add_argument("--threads", type=int, default=DEFAULT_THREADS, help="threads per engine")
+    parser.add_argument("--hash", type=int, default=DEFAULT_HASH_MB, help="hash table size per engine, in MB")
+    parser.add_argument("--book", type=str, default=None, help=f"Polyglot opening book (defaults to ${BOOK_ENV})")
+    parser.add_argument(
+        "--syzygy", type=str, default=None, help=f"Syzygy tablebase directories, separated by '{os.pathsep}' (defaults to ${SYZYGY_ENV})"
+    )
+    if not client:
+        return
+
+    parser.add_argument(
+        "--daemon", type=str, default=None, help="analysis daemon socket to use (found automatically when it's running), or 'off'"
+    )
+    parser.add_argument(
+        "--priority", type=int, default=DEFAULT_PRIORITY, help="daemon queue priority, lower is sooner"
+    )
+
+
+def daemon_is_listening(path: str) -> bool:
+    if not os.path.exists(path):
+        return False
+
+    # a daemon that was killed leaves its socket file behind
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        try:
+            connection.connect(path)
+        except OSError:
+            return False
+
+    return True
+
+
+def pool_from_args(args: argparse.Namespace):
+    """The running analysis daemon if there is one (the engine options are then the daemon's), or a new pool."""
+    # imported here, as the daemon is built on this module
+    from analysis.daemon import RemotePool, default_socket_path
+
+    shortcuts = default_shortcuts(args.book, args.syzygy)
+    path = args.daemon or default_socket_path()
+    if path != "off":
+        if daemon_is_listening(path):
+            return RemotePool(path, args.priority, shortcuts=shortcuts)
+        if args.daemon:
+            sys.exit(f"no analysis daemon listening on {path}")
+
+    return EnginePool(args.engine, args.engines, args.threads, args.hash, shortcuts=shortcuts)
+
+
+def report(pool: EnginePool) -> None:
+    print(f"engines: {pool}", file=sys.stderr)
+    if pool.shortcuts is not None:
+        print(f"shortcuts: {pool.shortcuts}", file=sys.stderr)
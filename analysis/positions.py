@@ -0,0 +1,151 @@
+"""
+Compact position counting for large game collections.
+
+Positions are keyed by their 64-bit Polyglot Zobrist hash, which ignores the move counters, so a
+position reached at different move numbers (or by different move orders) is counted once. The counts
+live in an open-addressing hash table over two typed arrays (keys and counts, 12 bytes a slot), which
+takes a fraction of the memory of a dict keyed by FEN strings. The FEN of a position is only worth
+keeping once it has come up often enough to be reported, and that's left to the caller.
+
+For whole databases, where most positions come up once or twice, a count-min sketch can go in front
+of the table: positions only get a slot once the sketch has seen them `admit` times, and start with
+the sketch's estimate. Count-min estimates are never too low, so no frequent position is missed;
+collisions can overstate a count by a little, by at most about positions/width on average.
+
+Example:
+counter = PositionCounter(prefilter=CountMinSketch(), admit=3)
+for board in boards:
+    count = counter.add(position_key(board))
+"""
+from typing import Iterator, List, Optional, Tuple
+
+from array import array
+
+import chess
+import chess.polyglot
+
+
+# 0 marks an empty slot, so a position that hashes to 0 is stored as 1 instead
+EMPTY = 0
+MAX_LOAD = 0.5
+DEFAULT_CAPACITY = 1 << 16
+DEFAULT_SKETCH_WIDTH = 1 << 20
+DEFAULT_SKETCH_DEPTH = 4
+# odd multipliers to derive a sketch row's index from the key (multiplicative hashing)
+SKETCH_SEEDS = [0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9, 0xD6E8FEB86659FD93,
+                0xFF51AFD7ED558CCD, 0xC4CEB9FE1A85EC53, 0x94D049BB133111EB, 0xBF58476D1CE4E5B9]
+MASK64 = (1 << 64) - 1
+
+
+def position_key(board: chess.Board) -> int:
+    """The position's Zobrist hash, which leaves out the move counters."""
+    return chess.polyglot.zobrist_hash(board) or 1
+
+
+class CountMinSketch:
+    def __init__(self, width: int = DEFAULT_SKETCH_WIDTH, depth: int = DEFAULT_SKETCH_DEPTH):
+        assert width & (width - 1) == 0, "width must be a power of two"
+        assert depth <= len(SKETCH_SEEDS)
+        self.width = width
+        self.shift = 64 - width.bit_length() + 1
+        self.seeds = SKETCH_SEEDS[:depth]
+        # one row of `width` counters per seed, laid end to end
+        self.table = array("I", bytes(4 * depth * width))
+
+    def _cells(self, key: int) -> List[int]:
+        # the top bits of the product are the well-mixed ones
+        return [row * self.width + (((key * seed) & MASK64) >> self.shift) for row, seed in enumerate(self.seeds)]
+
+    def add(self, key: int) -> int:
+        """Counts the key and returns its estimated count so far."""
+        table = self.table
+        cells = self._cells(key)
+        for cell in cells:
+            table[cell] += 1
+
+        return min(table[cell] for cell in cells)
+
+    def estimate(self, key: int) -> int:
+        return min(self.table[cell] for cell in self._cells(key))
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.table) * self.table.itemsize
+
+
+class PositionCounter:
+    def __init__(
+        self, capacity: int = DEFAULT_CAPACITY, prefilter: Optional[CountMinSketch] = None, admit: int = 2
+    ):
+        capacity = 1 << max(4, (capacity - 1).bit_length())
+        self.keys = array("Q", bytes(8 * capacity))
+        self.counts = array("I", bytes(4 * capacity))
+        self.size = 0
+        self.prefilter = prefilter
+        self.admit = admit
+
+    def _slot(self, key: int) -> int:
+        """The key's slot, or the empty slot where it would go (linear probing)."""
+        keys = self.keys
+        mask = len(keys) - 1
+        # Zobrist keys are random already, but mixing keeps any run of nearby keys from clustering
+        slot = ((key * SKETCH_SEEDS[0]) & MASK64) >> (65 - len(keys).bit_length())
+        while True:
+            stored = keys[slot]
+            if stored == key or stored == EMPTY:
+                return slot
+            slot = (slot + 1) & mask
+
+    def _grow(self) -> None:
+        keys, counts = self.keys, self.counts
+        self.keys = array("Q", bytes(16 * len(keys)))
+        self.counts = array("I", bytes(8 * len(counts)))
+        for key, count in zip(keys, counts):
+            if key != EMPTY:
+                slot = self._slot(key)
+                self.keys[slot] = key
+                self.counts[slot] = count
+
+    def add(self, key: int) -> int:
+        """Counts the position and returns its count so far (0 while the prefilter is still holding it back)."""
+        slot = self._slot(key)
+        if self.keys[slot] != EMPTY:
+            self.counts[slot] += 1
+            return self.counts[slot]
+
+        count = 1
+        if self.prefilter is not None:
+            count = self.prefilter.add(key)
+            if count < self.admit:
+                return 0
+
+        if self.size + 1 > len(self.keys) * MAX_LOAD:
+            self._grow()
+            slot = self._slot(key)
+
+        self.keys[slot] = key
+        self.counts[slot] = count
+        self.size += 1
+        return count
+
+    def __getitem__(self, key: int) -> int:
+        slot = self._slot(key)
+        return self.counts[slot] if self.keys[slot] != EMPTY else 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def items(self, min_count: int = 1) -> Iterator[Tuple[int, int]]:
+        """(key, count) for every position counted at least `min_count` times."""
+        min_count = max(min_count, 1)
+        for key, count in zip(self.keys, self.counts):
+            if count >= min_count:
+                yield key, count
+
+    @property
+    def nbytes(self) -> int:
+        table = len(self.keys) * self.keys.itemsize + len(self.counts) * self.counts.itemsize
+        return table + (self.prefilter.nbytes if self.prefilter else 0)
+
+    def __str__(self) -> str:
+        return f"{self.size} positions counted in {self.nbytes / 2**20:.1f} MiB"
@@ -0,0 +1,134 @@
+"""
+Answers that don't need an engine: an opening book and endgame tablebases.
+
+A position in a Polyglot opening book was reached by a book move, which is sound by definition, so the
+scripts classify it without a search: find-mistakes doesn't report it, find-brilliancies doesn't count a
+book sacrifice, and analyze_game gives the moves of a game's opening (up to its last book position) no
+centipawn loss. A position with few enough pieces for the local Syzygy tablebases gets its exact result
+from them, and the engine pools (analysis.pool, analysis.daemon) answer those without an engine:
+wins and losses are scored TABLEBASE_WIN centipawns less the distance to zeroing, draws 0, the way
+engines report tablebase results. With multipv every move is probed, so the lines are ranked exactly.
+
+Both are optional and local; --book and --syzygy (or CHESS_SCRIPTS_BOOK and CHESS_SCRIPTS_SYZYGY) point
+to them, and the engine summary says how many positions they settled.
+
+Example:
+shortcuts = Shortcuts("gm2001.bin", "/data/syzygy")
+if shortcuts.in_book(board):
+    ...
+info = shortcuts.tablebase_analysis(board, multipv=None)
+"""
+from typing import Any, Dict, List, Optional, Union
+
+import os
+
+import chess
+import chess.engine
+import chess.polyglot
+import chess.syzygy
+
+
+BOOK_ENV = "CHESS_SCRIPTS_BOOK"
+SYZYGY_ENV = "CHESS_SCRIPTS_SYZYGY"
+# well above any evaluation, and below the scripts' mate scores
+TABLEBASE_WIN = 20000
+
+
+def tablebase_score(wdl: int, dtz: int) -> int:
+    """Centipawns for a WDL result; cursed wins and blessed losses are draws under the 50 move rule."""
+    if wdl == 2:
+        return TABLEBASE_WIN - abs(dtz)
+    if wdl == -2:
+        return -TABLEBASE_WIN + abs(dtz)
+
+    return 0
+
+
+class Shortcuts:
+    def __init__(self, book_path: Optional[str] = None, syzygy_path: Optional[str] = None):
+        self.book = chess.polyglot.open_reader(book_path) if book_path else None
+        self.tablebase = None
+        self.max_pieces = 0
+        if syzygy_path:
+            self.tablebase = chess.syzygy.Tablebase()
+            for directory in syzygy_path.split(os.pathsep):
+                self.tablebase.add_directory(directory)
+            # table names are the pieces on each side, e.g. KRPvKR
+            self.max_pieces = max((len(name) - 1 for name in self.tablebase.wdl), default=0)
+        self.stats: Dict[str, int] = {"book": 0, "tablebase": 0}
+
+    def in_book(self, board: chess.Board) -> bool:
+        """Whether the position is in the book; each one found is a search skipped."""
+        if self.book is None or self.book.get(board) is None:
+            return False
+
+        self.stats["book"] += 1
+        return True
+
+    def book_prefix(self, boards: List[chess.Board]) -> int:
+        """The index of the last of a game's positions that, with every position before it, is in the book."""
+        last = 0
+        for index, board in enumerate(boards):
+            if self.book is None or self.book.get(board) is None:
+                break
+            last = index
+
+        # the last book position still needs its evaluation
+        self.stats["book"] += last
+        return last
+
+    def _probe(self, board: chess.Board) -> Optional[int]:
+        """The side to move's tablebase score, or None when the position isn't covered."""
+        try:
+            return tablebase_score(self.tablebase.probe_wdl(board), self.tablebase.probe_dtz(board))
+        except KeyError:
+            # missing tables, or castling rights
+            return None
+
+    def tablebase_analysis(
+        self, board: chess.Board, multipv: Optional[int]
+    ) -> Optional[Union[Dict[str, Any], List[Dict[str, Any]]]]:
+        """An exact analysis of a tablebase position, shaped like the engine's, or None."""
+        if self.tablebase is None or chess.popcount(board.occupied) > self.max_pieces or board.is_game_over():
+            return None
+
+        if not multipv:
+            value = self._probe(board)
+            if value is None:
+                return None
+
+            self.stats["tablebase"] += 1
+            return {"score": chess.engine.PovScore(chess.engine.Cp(value), board.turn), "depth": 0, "tbhits": 1}
+
+        lines = []
+        for move in board.legal_moves:
+            board.push(move)
+            value = self._probe(board)
+            board.pop()
+            if value is None:
+                return None
+            # a result one ply further from zeroing, from the mover's side
+            value = -value + (1 if value > 0 else -1 if value < 0 else 0)
+            lines.append({"score": chess.engine.PovScore(chess.engine.Cp(value), board.turn), "pv": [move], "depth": 0})
+
+        lines.sort(key=lambda line: line["score"].relative.score(), reverse=True)
+        self.stats["tablebase"] += 1
+        return [{**line, "multipv": index} for index, line in enumerate(lines[:multipv], 1)]
+
+    def close(self) -> None:
+        if self.book is not None:
+            self.book.close()
+        if self.tablebase is not None:
+            self.tablebase.close()
+
+    def __str__(self) -> str:
+        return f"{self.stats['book']} book positions and {self.stats['tablebase']} tablebase positions needed no search"
+
+
+def default_shortcuts(book_path: Optional[str] = None, syzygy_path: Optional[str] = None) -> Optional[Shortcuts]:
+    book_path = book_path or os.environ.get(BOOK_ENV)
+    syzygy_path = syzygy_path or os.environ.get(SYZYGY_ENV)
+    if not book_path and not syzygy_path:
+        return None
+
+    return Shortcuts(book_path, syzygy_path)
@@ -1,6 +1,29 @@
-import json
+"""
+Move time and centipawn loss statistics for every game in a monthly archive or PGN file.
+
+Each game is analysed as a whole on one engine of the pool (analysis.pool), every position exactly once,
+and many games run at once, one per engine. A move's centipawn loss is how much the evaluation drops,
+from the mover's point of view, between the position before it and the position after it.
+The search budget is a node count by default, so the numbers are reproducible; --depth or --time replace it.
+Every position is searched with an eighth of the budget first, and only the positions around moves that lose
+ESCALATION_LOSS or more on that search get the full budget (--fixed_budget turns this off).
+Positions with an [%eval] annotation (analysed Lichess games) use it instead of the engine, so a database of
+analysed games needs no engine time beyond the starting position. With an opening book (--book), the opening's
+book moves lose nothing and their positions aren't analysed; with tablebases (--syzygy), endgame positions get
+their exact results (analysis.shortcuts).
+
+Usage:
+python analyze_game/get_game_stats.py --file_path jan_hikaru.json --nodes 500000
+python analyze_game/get_game_stats.py --file_path lichess_db_2024-01.pgn.zst
+"""
+from typing import AsyncIterator, Callable, Counter, Dict, Iterable, List, Optional, Tuple
+
+import argparse
+import asyncio
+import collections
+from pathlib import Path
+import sys
 from io import StringIO
-import re
 
 import chess.pgn
 import chess.engine
@@ -9,82 +32,224 @@ import chess
 from statistics import pstdev as stdev
 from statistics import median
 
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from pgn_parser.clocks import decode_clocks, parse_time_control, time_spent  # noqa: E402
+from script_utils.profiling import maybe_profile  # noqa: E402
+from analysis.pool import Analysis, EnginePool, add_engine_arguments, pool_from_args, report  # noqa: E402
+from analysis.budget import TwoPass, add_budget_arguments  # noqa: E402
+from analysis.annotations import embedded_scores, iter_pgn_games  # noqa: E402
+from chesscom.archive import read_archive  # noqa: E402
+
+
+DEFAULT_NODES = 200_000
+MATE_SCORE = 100000
+# losses this large come from mates being found or missed, and would swamp the averages
+MAX_CP_LOSS = 10000
+# moves losing this much on the shallow search have both their positions searched again at the full budget
+ESCALATION_LOSS = 50
+# games analysed at once, per engine; more keeps the engines busy, fewer keeps memory down on huge files
+GAMES_PER_ENGINE = 4
+
+
+def game_positions(game: chess.pgn.Game) -> Tuple[List[chess.Board], List[str]]:
+    """The position before every move and after the last one, and each move's comment."""
+    board = game.board()
+    boards = [board.copy()]
+    comments = []
+    for node in game.mainline():
+        comments.append(node.comment)
+        board.push(node.move)
+        boards.append(board.copy())
+
+    return boards, comments
+
+
+def white_evals(infos) -> List[int]:
+    return [int(info["score"].white().score(mate_score=MATE_SCORE)) for info in infos]
+
+
+def move_loss(before: int, after: int, ply: int, white_first: bool) -> int:
+    """How much the move at `ply` drops White's evaluation, from the mover's point of view."""
+    return before - after if (ply % 2 == 0) == white_first else after - before
+
+
+def costly_moves(infos) -> List[int]:
+    """The positions before and after every move that loses ESCALATION_LOSS or more."""
+    evals = white_evals(infos)
+    white_first = infos[0]["score"].turn == chess.WHITE
+    indexes = []
+    for ply, (before, after) in enumerate(zip(evals, evals[1:])):
+        if move_loss(before, after, ply, white_first) >= ESCALATION_LOSS:
+            indexes += [ply, ply + 1]
+
+    return indexes
 
-clock_pattern = re.compile(r"\d+:\d+:\d+(\.\d+)?")
 
+def gap_close_call(
+    index: int, scores: List[Optional[chess.engine.PovScore]], book: int, white_first: bool
+) -> Callable[[Analysis], bool]:
+    """
+    Whether the shallow search of an unannotated position needs the full budget: when the move into it or out
+    of it loses ESCALATION_LOSS or more against the annotated positions on either side, as costly_moves decides
+    for whole games, or when a neighbour is unannotated too, so there's nothing to compare with yet.
+    """
 
-def get_clock_in_seconds(node_comment):
-    time_on_clock = clock_pattern.search(node_comment)
-    hours, minutes, seconds = map(float, time_on_clock.group().split(":"))
-    return hours * 60 * 60 + minutes * 60 + seconds * 60
+    def close_call(info: Analysis) -> bool:
+        evals = {index: white_evals([info])[0]}
+        for other in (index - 1, index + 1):
+            if book <= other < len(scores):
+                if scores[other] is None:
+                    return True
+                evals[other] = white_evals([{"score": scores[other]}])[0]
 
+        return any(
+            move_loss(evals[ply], evals[ply + 1], ply, white_first) >= ESCALATION_LOSS
+            for ply in (index - 1, index)
+            if ply in evals and ply + 1 in evals
+        )
 
-def clock_diffs(clock_times):
-    return [
-        x - y
-        for x, y in zip(clock_times, clock_times[1:])
-    ]
+    return close_call
 
 
-def get_game_stats(game, engine_path="/usr/local/bin/stockfish"):
-    board = chess.Board()
+async def position_evals(
+    boards: List[chess.Board], search: TwoPass, scores: Optional[List[Optional[chess.engine.PovScore]]] = None
+) -> List[int]:
+    """
+    White's evaluation of each of a game's positions, in centipawns. Positions with an embedded score use it,
+    and the engine analyses the rest: the whole game if none of it is annotated, otherwise just the gaps.
+    The positions of the opening book all get the evaluation of its last one, so book moves lose nothing.
+    """
+    scores = scores or [None] * len(boards)
+    book = search.pool.shortcuts.book_prefix(boards) if search.pool.shortcuts is not None else 0
 
-    engine = chess.engine.SimpleEngine.popen_uci(engine_path)
-    current_eval = int(engine.analyse(board, chess.engine.Limit(time=0.2))["score"].white().score(mate_score=100000))
-    white_clock_times = []
+    missing = [index for index in range(book, len(boards)) if scores[index] is None]
+    if len(missing) == len(boards) - book:
+        evals = white_evals(await search.analyse_game(boards[book:], costly_moves))
+        return evals[:1] * book + evals
+
+    # each gap is searched shallow first too, and escalated when a move next to it looks costly
+    white_first = boards[0].turn == chess.WHITE
+    infos = [{"score": score} for score in scores]
+    analysed = await asyncio.gather(
+        *[search.analyse(boards[index], gap_close_call(index, scores, book, white_first)) for index in missing]
+    )
+    for index, info in zip(missing, analysed):
+        infos[index] = info
+
+    evals = white_evals(infos[book:])
+    return evals[:1] * book + evals
+
+
+def cp_losses(evals: List[int], white_first: bool = True) -> Tuple[List[int], List[int]]:
+    """Each side's centipawn loss per move, from consecutive evaluations."""
     white_cp_loss = []
-    black_clock_times = []
     black_cp_loss = []
-    for color, node in enumerate(game.mainline()):
-        print(("white" if color % 2 == 0 else "black"), node.move)
-        seconds = get_clock_in_seconds(node.comment)
-        board.push(node.move)
-        new_eval = int(engine.analyse(board, chess.engine.Limit(time=0.2))["score"].white().score(mate_score=100000))
-
-        if color % 2 == 0:
-            white_clock_times.append(seconds)
-            white_cp_loss.append(current_eval - new_eval)
+    for ply, (before, after) in enumerate(zip(evals, evals[1:])):
+        if (ply % 2 == 0) == white_first:
+            white_cp_loss.append(max(0, before - after))
         else:
-            black_clock_times.append(seconds)
-            black_cp_loss.append(current_eval - new_eval)
+            black_cp_loss.append(max(0, after - before))
+
+    return white_cp_loss, black_cp_loss
 
-    engine.close()
 
-    white_clock_diffs = clock_diffs(white_clock_times)
-    black_clock_diffs = clock_diffs(black_clock_times)
+def summarize(values: List[float]) -> Optional[Dict[str, float]]:
+    if not values:
+        return None
+
+    return {
+        "avg": sum(values) / len(values),
+        "median": median(values),
+        "stdev": stdev(values),
+    }
 
-    white_cp_loss = list(filter(lambda x: x < 10000, white_cp_loss))
-    black_cp_loss = list(filter(lambda x: x < 10000, black_cp_loss))
+
+async def get_game_stats(game: chess.pgn.Game, search: TwoPass, counts: Optional[Counter] = None):
+    boards, comments = game_positions(game)
+    scores = embedded_scores(game)
+    if counts is not None:
+        counts["positions"] += len(scores)
+        counts["annotated"] += sum(score is not None for score in scores)
+
+    evals = await position_evals(boards, search, scores)
+    white_cp_loss, black_cp_loss = cp_losses(evals, boards[0].turn == chess.WHITE)
+
+    time_control = parse_time_control(game.headers.get("TimeControl"))
+    increment = time_control[1] if time_control else 0
+    # each side's first move has no earlier clock to measure against
+    move_seconds = time_spent(decode_clocks(" ".join(comments)), increment) / 100
+    white_clock_diffs = move_seconds[2::2].tolist()
+    black_clock_diffs = move_seconds[3::2].tolist()
+
+    white_cp_loss = [loss for loss in white_cp_loss if loss < MAX_CP_LOSS]
+    black_cp_loss = [loss for loss in black_cp_loss if loss < MAX_CP_LOSS]
 
     stats = {
-        "white_move_times": {
-            "avg": sum(white_clock_diffs) / len(white_clock_diffs),
-            "median": median(white_clock_diffs),
-            "stdev": stdev(white_clock_diffs),
-        },
-        "black_move_times": {
-            "avg": sum(black_clock_diffs) / len(black_clock_diffs),
-            "median": median(black_clock_diffs),
-            "stdev": stdev(black_clock_diffs),
-        },
-        "white_cp_loss": {
-            "avg": sum(white_cp_loss) / len(white_cp_loss),
-            "median": median(white_cp_loss),
-            "stdev": stdev(white_cp_loss),
-        },
-        "black_cp_loss": {
-            "avg": sum(black_cp_loss) / len(black_cp_loss),
-            "median": median(black_cp_loss),
-            "stdev": stdev(black_cp_loss),
-        },
+        "white_move_times": summarize(white_clock_diffs),
+        "black_move_times": summarize(black_clock_diffs),
+        "white_cp_loss": summarize(white_cp_loss),
+        "black_cp_loss": summarize(black_cp_loss),
     }
 
     return stats
 
 
-data = json.load(open("jan_hikaru.json", 'r'))
+async def analyse_games(
+    games: Iterable[chess.pgn.Game], pool: EnginePool, limit: chess.engine.Limit, adaptive: bool = True
+) -> AsyncIterator[dict]:
+    """
+    Yields the stats of every game, in order. Games are read as they're needed, and a few per engine
+    are in flight at once, so any number of games can be streamed through.
+    """
+    counts = collections.Counter()
+    async with pool:
+        search = TwoPass(pool, limit, enabled=adaptive)
+        pending = collections.deque()
+        for game in games:
+            pending.append(asyncio.ensure_future(get_game_stats(game, search, counts)))
+            if len(pending) >= pool.size * GAMES_PER_ENGINE:
+                yield await pending.popleft()
+
+        while pending:
+            yield await pending.popleft()
+
+        report(pool)
+        print(f"search: {search}", file=sys.stderr)
+        print(f"annotations: {counts['annotated']} of {counts['positions']} positions", file=sys.stderr)
+
+
+def read_games(file_path: str) -> Iterable[chess.pgn.Game]:
+    """The games in a monthly archive saved as JSON, or in a PGN file."""
+    if file_path.endswith(".json"):
+        return (chess.pgn.read_game(StringIO(game["pgn"])) for game in read_archive(file_path))
+
+    return iter_pgn_games(file_path)
+
+
+async def print_stats(games: Iterable[chess.pgn.Game], pool: EnginePool, limit: chess.engine.Limit, adaptive: bool):
+    async for stats in analyse_games(games, pool, limit, adaptive):
+        print(stats)
+
+
+def search_limit(args: argparse.Namespace) -> chess.engine.Limit:
+    if args.depth is not None or args.time is not None:
+        return chess.engine.Limit(depth=args.depth, time=args.time, nodes=args.nodes)
+
+    return chess.engine.Limit(nodes=args.nodes or DEFAULT_NODES)
+
+
+if __name__ == '__main__':
+    maybe_profile()
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--file_path", type=str, default="jan_hikaru.json", help="monthly archive saved as JSON, or a PGN file (.pgn/.gz/.bz2/.zst)"
+    )
+    parser.add_argument("--nodes", type=int, default=None, help=f"nodes to search per position (default {DEFAULT_NODES})")
+    parser.add_argument("--depth", type=int, default=None, help="depth to search per position")
+    parser.add_argument("--time", type=float, default=None, help="seconds to search per position (not reproducible)")
+    add_engine_arguments(parser)
+    add_budget_arguments(parser)
+    args = parser.parse_args()
 
-for game in data["games"]:
-    pgn = chess.pgn.read_game(StringIO(game["pgn"]))
-    stats = get_game_stats(pgn)
-    print(stats)
+    asyncio.run(print_stats(read_games(args.file_path), pool_from_args(args), search_limit(args), not args.fixed_budget))
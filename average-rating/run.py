@@ -2,15 +2,18 @@
 Get the average rating of all the games played in a pgn database
 """
 from collections import defaultdict
+from pathlib import Path
 import sys
 import re
 
-from tqdm import tqdm
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from script_utils.progress import progress_stdin  # noqa: E402
+
 
 pattern = re.compile(r'\[(White|Black)Elo "(\d+)"\]')
 totals = defaultdict(int)
 
-for line in tqdm(sys.stdin):
+for line in progress_stdin():
     match = pattern.match(line)
     if match:
         totals[int(match.group(2))] += 1
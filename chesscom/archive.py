@@ -0,0 +1,218 @@
+"""
+Lazy decoding of chess.com monthly archives.
+
+Most of a monthly archive's bytes are the games' embedded PGN strings, which most filters never
+look at. The reader cuts each `"pgn": "..."` value out of the raw bytes with a bytes.find scan, parses
+the (much smaller) remainder with orjson when it's installed (the standard json module otherwise),
+and yields ArchiveGame records that only decode their PGN when it's accessed. Each game keeps just
+its own PGN's bytes, not the whole body, and a filter on `time_class`, `rules` or `tournament`
+never pays for a PGN string. Callers that never look at the PGNs can leave them out (`pgns=False`),
+and then the games are only the small dicts.
+
+ArchiveGame behaves like the game dicts from `json.loads`, so it can replace them unchanged.
+
+Example:
+for game in read_archive("2024_01.json"):
+    if game["time_class"] == "blitz" and "tournament" in game:
+        print(game["pgn"])
+"""
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+from collections.abc import Mapping
+import json
+
+try:
+    import orjson
+
+    loads = orjson.loads
+except ImportError:
+    loads = json.loads
+
+
+PGN_KEY = b'"pgn":'
+QUOTE = ord('"')
+BACKSLASH = ord("\\")
+WHITESPACE = b" \t\r\n"
+
+
+class ArchiveGame(Mapping):
+    """One game from a monthly archive, decoding its PGN on first access."""
+
+    __slots__ = ("_data", "_raw", "_pgn")
+
+    def __init__(self, data: Dict[str, Any], raw: Optional[bytes]):
+        # the PGN string's bytes as they are in the JSON, still escaped
+        self._data = data
+        self._raw = raw
+        self._pgn = None
+
+    @property
+    def pgn(self) -> str:
+        if self._pgn is None:
+            if self._raw is None:
+                return self._data["pgn"]
+
+            raw = self._raw
+            # escapes are rare (only quotes in headers), so most PGNs skip the JSON decoder entirely
+            self._pgn = json.loads(b'"' + raw + b'"') if b"\\" in raw else raw.decode()
+
+        return self._pgn
+
+    def __getitem__(self, key: str) -> Any:
+        if key == "pgn" and self._raw is not None:
+            return self.pgn
+
+        return self._data[key]
+
+    def __contains__(self, key: object) -> bool:
+        return (key == "pgn" and self._raw is not None) or key in self._data
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self._data
+        if self._raw is not None:
+            yield "pgn"
+
+    def __len__(self) -> int:
+        return len(self._data) + (self._raw is not None)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(self)
+
+    def __repr__(self) -> str:
+        return f"<ArchiveGame({self._data.get('url')})>"
+
+
+def is_escaped(body: bytes, position: int) -> bool:
+    """Whether the character at `position` is preceded by an odd number of backslashes."""
+    backslashes = 0
+    while body[position - backslashes - 1] == BACKSLASH:
+        backslashes += 1
+
+    return backslashes % 2 == 1
+
+
+def exact_string_end(body: bytes, start: int) -> int:
+    """The offset of the quote closing the JSON string whose contents begin at `start`, or -1."""
+    end = body.find(b'"', start)
+    while end != -1 and is_escaped(body, end):
+        end = body.find(b'"', end + 1)
+
+    return end
+
+
+def fast_string_end(body: bytes, start: int) -> int:
+    """
+    Like exact_string_end, but jumps straight to the first unescaped `",`. Every PGN header holds two
+    escaped quotes, so stepping from quote to quote is slower than parsing the whole archive.
+    It's only right when the string is followed by a comma, which fast_span_is_exact checks.
+    """
+    # commas are rare in PGN text, and a single-byte find is a memchr, so this runs at memory speed
+    comma = body.find(b",", start)
+    while comma != -1 and (body[comma - 1] != QUOTE or is_escaped(body, comma - 1)):
+        comma = body.find(b",", comma + 1)
+
+    return comma - 1 if comma != -1 else -1
+
+
+def fast_span_is_exact(body: bytes, start: int, end: int) -> bool:
+    """
+    Whether a fast scan's end is really the end of the string starting at `start`: the comma must lead on
+    to the object's next key, and every quote inside the span must be escaped. When the pgn is the last key
+    of its object the scan runs on into the next game, over the unescaped quote that really ends the string.
+    """
+    after = end + 2
+    while after < len(body) and body[after] in WHITESPACE:
+        after += 1
+    if after >= len(body) or body[after] != QUOTE:
+        return False
+
+    raw = body[start:end]
+    # a literal backslash makes counting escaped quotes ambiguous, so step through the quotes instead
+    if b"\\\\" in raw:
+        return exact_string_end(body, start) == end
+
+    return raw.count(b'"') == raw.count(b'\\"')
+
+
+def pgn_spans(body: bytes, exact: bool = False) -> Optional[List[Tuple[int, int]]]:
+    """
+    The (start, end) byte offsets of every pgn string value in the body, or None if a fast scan couldn't be
+    confirmed, in which case the exact scan is needed.
+    """
+    string_end = exact_string_end if exact else fast_string_end
+    spans = []
+    position = body.find(PGN_KEY)
+    while position != -1:
+        start = position + len(PGN_KEY)
+        while body[start] in WHITESPACE:
+            start += 1
+
+        # skips a pgn that isn't a string
+        if body[start] != QUOTE:
+            position = body.find(PGN_KEY, start)
+            continue
+
+        end = string_end(body, start + 1)
+        if end == -1 or (not exact and not fast_span_is_exact(body, start + 1, end)):
+            return None
+
+        spans.append((start + 1, end))
+        position = body.find(PGN_KEY, end + 1)
+
+    return spans
+
+
+def parse_without_pgns(body: bytes, spans: List[Tuple[int, int]]) -> List[Dict[str, Any]]:
+    """Parses the body with every pgn value replaced by its index in `spans`."""
+    parts = []
+    previous = 0
+    for index, (start, end) in enumerate(spans):
+        parts.append(body[previous:start - 1])
+        parts.append(str(index).encode())
+        previous = end + 1
+    parts.append(body[previous:])
+
+    data = loads(b"".join(parts))
+    return data.get("games", []) if isinstance(data, dict) else data
+
+
+def iter_archive_games(body: Union[bytes, str], pgns: bool = True) -> Iterator[ArchiveGame]:
+    """
+    Yields the games in a monthly archive body, either the API's {"games": [...]} or a bare list of games.
+    Without `pgns` the games come without their PGN.
+    """
+    if isinstance(body, str):
+        body = body.encode()
+
+    games = None
+    # every fast span is checked as it's found, so any that would overrun its string (when the pgn is the
+    # last key of its object) sends the whole body to the exact scan
+    spans = pgn_spans(body)
+    if spans is not None:
+        try:
+            games = parse_without_pgns(body, spans)
+        except ValueError:
+            pass
+
+    if games is None:
+        spans = pgn_spans(body, exact=True)
+        if spans is None:
+            raise ValueError("malformed monthly archive: a pgn string is never closed")
+        games = parse_without_pgns(body, spans)
+
+    for game in games:
+        index = game.get("pgn")
+        if type(index) is int:
+            del game["pgn"]
+            start, end = spans[index]
+            yield ArchiveGame(game, body[start:end] if pgns else None)
+        else:
+            yield ArchiveGame(game, None)
+
+
+def read_archive(path: str) -> Iterator[ArchiveGame]:
+    """Games from a monthly archive saved as JSON."""
+    with open(path, "rb") as in_file:
+        body = in_file.read()
+
+    return iter_archive_games(body)
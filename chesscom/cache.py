@@ -0,0 +1,247 @@
+"""
+An on-disk cache of chess.com API responses, keyed by URL.
+
+Monthly archives never change once the month is over, so finished months are kept permanently
+(until evicted for space), while the current month and the archive lists get a short TTL
+and the titled-player lists are kept for a day.
+Bodies are stored zlib-compressed in a single SQLite file, which several scripts can share at once.
+When the cache grows past `max_bytes`, the least recently used entries are evicted.
+
+ChessComClient consults the default cache transparently, so repeat runs over the same players
+don't touch the network for historic months.
+
+Each entry also keeps the response's ETag / Last-Modified validators, so a stale entry can be
+revalidated with a conditional request (a 304 costs no body) instead of downloaded again.
+
+Set CHESS_SCRIPTS_CACHE to a file path to move the cache, or to "off" to disable it.
+
+Usage:
+python -m chesscom.cache            # show size and hit/miss statistics
+python -m chesscom.cache --clear
+"""
+from typing import Dict, NamedTuple, Optional
+
+import argparse
+from datetime import datetime, timezone
+import os
+from pathlib import Path
+import re
+import sqlite3
+import time
+import zlib
+
+
+CACHE_ENV = "CHESS_SCRIPTS_CACHE"
+DEFAULT_PATH = Path.home() / ".cache" / "chess-scripts" / "api.sqlite"
+DEFAULT_MAX_BYTES = 4 * 1024 ** 3
+
+PERMANENT = float("inf")
+CURRENT_MONTH_TTL = 10 * 60
+ARCHIVE_LIST_TTL = 60 * 60
+TITLED_TTL = 24 * 60 * 60
+
+MONTH_PATTERN = re.compile(r"/games/(\d{4})/(\d{2})(?:/pgn)?$")
+ARCHIVE_LIST_PATTERN = re.compile(r"/games/archives$")
+TITLED_PATTERN = re.compile(r"/titled/[A-Z]+$")
+
+# the unbounded expiry that stands in for PERMANENT, since sqlite can't store inf
+MAX_TTL = 100 * 365 * 24 * 3600
+
+
+class CachedResponse(NamedTuple):
+    body: bytes
+    etag: Optional[str]
+    last_modified: Optional[str]
+    fresh: bool
+
+
+def ttl_for(url: str, now: datetime = None) -> float:
+    """How long a response may be served from the cache: forever for finished months, 0 for uncacheable URLs."""
+    match = MONTH_PATTERN.search(url)
+    if match:
+        now = now or datetime.now(timezone.utc)
+        if (int(match.group(1)), int(match.group(2))) < (now.year, now.month):
+            return PERMANENT
+
+        return CURRENT_MONTH_TTL
+
+    if ARCHIVE_LIST_PATTERN.search(url):
+        return ARCHIVE_LIST_TTL
+
+    if TITLED_PATTERN.search(url):
+        return TITLED_TTL
+
+    return 0
+
+
+class ArchiveCache:
+    def __init__(self, path: str = None, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.path = Path(path or os.environ.get(CACHE_ENV) or DEFAULT_PATH)
+        self.max_bytes = max_bytes
+        self.stats = {"hits": 0, "misses": 0, "expired": 0, "stores": 0, "revalidated": 0, "evictions": 0}
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                url TEXT PRIMARY KEY,
+                body BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                expires_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                etag TEXT,
+                last_modified TEXT
+            )
+            """
+        )
+        # caches created before validators were stored
+        columns = {row[1] for row in self.connection.execute("PRAGMA table_info(responses)")}
+        for column in ["etag", "last_modified"]:
+            if column not in columns:
+                self.connection.execute(f"ALTER TABLE responses ADD COLUMN {column} TEXT")
+
+        self.connection.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        # kept up to date on every store rather than summed per query; other processes' writes are picked up on eviction
+        self._size = self.size()
+
+    def lookup(self, url: str) -> Optional[CachedResponse]:
+        """The cached entry even if it has expired, so its validators can be used to revalidate it."""
+        row = self.connection.execute(
+            "SELECT body, expires_at, etag, last_modified FROM responses WHERE url = ?", (url,)
+        ).fetchone()
+        if row is None:
+            self.stats["misses"] += 1
+            return None
+
+        body, expires_at, etag, last_modified = row
+        now = time.time()
+        fresh = expires_at >= now
+        if fresh:
+            self.stats["hits"] += 1
+        else:
+            self.stats["expired"] += 1
+            self.stats["misses"] += 1
+
+        self.connection.execute("UPDATE responses SET accessed_at = ? WHERE url = ?", (now, url))
+
+        return CachedResponse(zlib.decompress(body), etag, last_modified, fresh)
+
+    def get(self, url: str) -> Optional[bytes]:
+        """The cached body, or None if it's missing or has expired."""
+        cached = self.lookup(url)
+        return cached.body if cached is not None and cached.fresh else None
+
+    def put(
+        self,
+        url: str,
+        body: bytes,
+        ttl: float = PERMANENT,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+    ) -> None:
+        compressed = zlib.compress(body, 6)
+        previous = self.connection.execute("SELECT size FROM responses WHERE url = ?", (url,)).fetchone()
+        now = time.time()
+        self.connection.execute(
+            """
+            INSERT OR REPLACE INTO responses (url, body, size, expires_at, accessed_at, etag, last_modified)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            """,
+            (url, compressed, len(compressed), now + min(ttl, MAX_TTL), now, etag, last_modified),
+        )
+        self.stats["stores"] += 1
+        self._size += len(compressed) - (previous[0] if previous else 0)
+        if self._size > self.max_bytes:
+            self.evict()
+
+    def revalidated(self, url: str, ttl: float, etag: Optional[str] = None, last_modified: Optional[str] = None) -> None:
+        """Marks an entry fresh again after a 304, keeping its body and any validators the server didn't resend."""
+        self.connection.execute(
+            """
+            UPDATE responses SET expires_at = ?, etag = COALESCE(?, etag), last_modified = COALESCE(?, last_modified)
+            WHERE url = ?
+            """,
+            (time.time() + min(ttl, MAX_TTL), etag, last_modified, url),
+        )
+        self.stats["revalidated"] += 1
+
+    def size(self) -> int:
+        return self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def evict(self) -> None:
+        """Deletes least recently used entries until the cache fits in `max_bytes`."""
+        self._size = self.size()
+        excess = self._size - self.max_bytes
+        if excess <= 0:
+            return
+
+        freed = 0
+        urls = []
+        for url, size in self.connection.execute("SELECT url, size FROM responses ORDER BY accessed_at"):
+            urls.append((url,))
+            freed += size
+            if freed >= excess:
+                break
+
+        self.connection.executemany("DELETE FROM responses WHERE url = ?", urls)
+        self.stats["evictions"] += len(urls)
+        self._size -= freed
+
+    def clear(self) -> None:
+        self.connection.execute("DELETE FROM responses")
+        self.connection.execute("DELETE FROM stats")
+        self.connection.execute("VACUUM")
+        self._size = 0
+
+    def lifetime_stats(self) -> Dict[str, int]:
+        """Counters summed over every run that has used this cache file, including this one."""
+        stats = dict(self.connection.execute("SELECT name, value FROM stats"))
+        return {name: stats.get(name, 0) + value for name, value in self.stats.items()}
+
+    def summary(self, lifetime: bool = False) -> Dict[str, float]:
+        stats = self.lifetime_stats() if lifetime else self.stats
+        lookups = stats["hits"] + stats["misses"]
+        entries = self.connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        return {
+            **stats,
+            "hit_rate": round(stats["hits"] / lookups, 3) if lookups else 0.0,
+            "entries": entries,
+            "bytes": self.size(),
+        }
+
+    def close(self) -> None:
+        self.connection.executemany(
+            "INSERT INTO stats (name, value) VALUES (?, ?) ON CONFLICT (name) DO UPDATE SET value = value + excluded.value",
+            list(self.stats.items()),
+        )
+        self.stats = {name: 0 for name in self.stats}
+        self.connection.close()
+
+
+def default_cache() -> Optional[ArchiveCache]:
+    """The cache every client uses unless told otherwise; CHESS_SCRIPTS_CACHE=off disables it."""
+    if os.environ.get(CACHE_ENV, "").lower() == "off":
+        return None
+
+    return ArchiveCache()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Inspect the chess.com response cache")
+    parser.add_argument("--path", type=str, default=None, help=f"cache file (defaults to ${CACHE_ENV} or {DEFAULT_PATH})")
+    parser.add_argument("--clear", action="store_true", help="delete every cached response")
+    args = parser.parse_args()
+
+    cache = ArchiveCache(args.path)
+    if args.clear:
+        cache.clear()
+
+    print(f"{cache.path}: {cache.summary(lifetime=True)}")
+
+
+if __name__ == '__main__':
+    main()
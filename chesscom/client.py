@@ -0,0 +1,380 @@
+"""
+A shared asyncio client for the chess.com published-data API (https://www.chess.com/news/view/published-data-api).
+
+All requests go through one pooled keep-alive session with gzip and a browser User-Agent
+(the API is much more willing to answer those), and at most `concurrency` are in flight at once. Requests
+wait for a slot before they're sent, and the timeout only counts from then, so any number can be queued up.
+Fetching a long player history is then limited by the API rather than by one-request-at-a-time round trips.
+Monthly archives and archive lists are served from the on-disk cache in `chesscom.cache` when possible,
+and stale entries are revalidated with If-None-Match / If-Modified-Since rather than downloaded again.
+Requests are paced by the process-wide adaptive rate limiter in `chesscom.ratelimit`, and throttled
+or failed requests are retried with backoff; `run` prints the achieved request rate when it's done.
+
+To follow a player's live month, poll `new_games`: it revalidates every time and only returns
+the games that weren't in the previously cached copy (nothing at all, and nothing parsed, on a 304).
+
+Scripts that go through a whole history should stream it with `iter_months` (and `iter_run` from synchronous
+code, which runs the client on a background thread): only a window of months is held at once, the first month
+is processed as soon as it arrives, and the next ones download while it is.
+
+Example:
+async def fetch(client, username):
+    archives = await client.archives(username)
+    async for url, archive in client.iter_months(archives):
+        yield archive
+
+for archive in iter_run(fetch, "hikaru", concurrency=8):
+    ...
+"""
+from typing import (
+    Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple, TypeVar, Union
+)
+
+import asyncio
+from collections import deque
+import json
+import os
+import queue
+import re
+import sys
+import threading
+
+import aiohttp
+
+from chesscom.archive import ArchiveGame, iter_archive_games
+from chesscom.cache import ArchiveCache, default_cache, ttl_for
+from chesscom.ratelimit import (
+    DEFAULT_RETRIES,
+    RETRY_STATUSES,
+    RateLimiter,
+    backoff_delay,
+    default_limiter,
+    is_error_payload,
+    retry_after,
+)
+
+
+BASE_URL = "https://api.chess.com/pub"
+# points every client at another server, e.g. the local stand-in in chesscom.standin
+API_ENV = "CHESS_SCRIPTS_API"
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/117.0.0.0 Safari/537.36",
+    "Accept-Encoding": "gzip",
+}
+
+# game URLs in a monthly archive, so the previous copy can be diffed without parsing it
+GAME_URL_PATTERN = re.compile(rb'"url":\s*"(https://www\.chess\.com/game/[^"]+)"')
+
+TITLES = ["GM", "WGM", "IM", "WIM", "FM", "WFM", "NM", "WNM", "CM", "WCM"]
+
+DEFAULT_CONCURRENCY = 8
+DEFAULT_TIMEOUT = 60
+
+T = TypeVar("T")
+
+
+class ChessComError(Exception):
+    def __init__(self, url: str, status: int, body: str = ""):
+        super().__init__(f"{status} from {url}: {body[:200]}")
+        self.url = url
+        self.status = status
+        self.body = body
+
+
+class Fetched(NamedTuple):
+    body: bytes
+    # False when the body came from the cache, either fresh or confirmed by a 304
+    changed: bool
+    # the cached body a changed response replaced, if there was one
+    previous: Optional[bytes]
+
+
+class ChessComClient:
+    def __init__(
+        self,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        base_url: Optional[str] = None,
+        timeout: float = DEFAULT_TIMEOUT,
+        cache: Union[ArchiveCache, bool] = True,
+        limiter: Optional[RateLimiter] = None,
+        retries: int = DEFAULT_RETRIES,
+    ):
+        self.concurrency = concurrency
+        self.base_url = (base_url or os.environ.get(API_ENV) or BASE_URL).rstrip("/")
+        self.timeout = timeout
+        self.cache = default_cache() if cache is True else (cache or None)
+        self.limiter = limiter or default_limiter()
+        self.retries = retries
+        self.requests = 0
+        self._session = None
+        self._slots = None
+
+    async def __aenter__(self) -> "ChessComClient":
+        connector = aiohttp.TCPConnector(limit=self.concurrency, keepalive_timeout=60)
+        # taken before each request, so the session's timeout never counts the wait for a pooled connection
+        self._slots = asyncio.Semaphore(self.concurrency)
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            headers=HEADERS,
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+        )
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self._session.close()
+        if self.cache is not None:
+            self.cache.close()
+
+    def url(self, path_or_url: str) -> str:
+        """Accepts API paths ("/player/hikaru") or full URLs as returned by the API itself."""
+        if path_or_url.startswith(BASE_URL):
+            path_or_url = path_or_url[len(BASE_URL):]
+        elif path_or_url.startswith("http"):
+            return path_or_url
+
+        return f"{self.base_url}/{path_or_url.lstrip('/')}"
+
+    async def fetch(self, path_or_url: str, revalidate: bool = False) -> Fetched:
+        """
+        Fetches a response, going through the cache for cacheable URLs.
+
+        A fresh cached entry is returned as is unless `revalidate` is set; a stale one is revalidated
+        with its validators, and served from the cache if the server answers 304.
+        """
+        url = self.url(path_or_url)
+        ttl = ttl_for(url) if self.cache is not None else 0
+        cached = self.cache.lookup(url) if ttl else None
+        if cached is not None and cached.fresh and not revalidate:
+            return Fetched(cached.body, False, None)
+
+        headers = {}
+        if cached is not None:
+            if cached.etag:
+                headers["If-None-Match"] = cached.etag
+            if cached.last_modified:
+                headers["If-Modified-Since"] = cached.last_modified
+
+        status, response_headers, body = await self._request(url, headers)
+
+        if status == 304 and cached is not None:
+            self.cache.revalidated(url, ttl, response_headers.get("ETag"), response_headers.get("Last-Modified"))
+            return Fetched(cached.body, False, None)
+
+        if status != 200 or is_error_payload(body):
+            raise ChessComError(url, status, body.decode(errors="replace"))
+
+        if ttl:
+            self.cache.put(url, body, ttl, response_headers.get("ETag"), response_headers.get("Last-Modified"))
+
+        return Fetched(body, True, cached.body if cached is not None else None)
+
+    async def _request(self, url: str, headers: Dict[str, str]) -> Tuple[int, Dict[str, str], bytes]:
+        """One rate-limited GET, retried with backoff on throttling, server errors and dropped connections."""
+        for attempt in range(self.retries + 1):
+            async with self._slots:
+                await self.limiter.acquire()
+                try:
+                    async with self._session.get(url, headers=headers) as response:
+                        status, response_headers = response.status, dict(response.headers)
+                        body = await response.read()
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    if attempt == self.retries:
+                        raise
+                    status = None
+                finally:
+                    self.requests += 1
+
+            # the backoff is waited out without holding a slot
+            if status is None:
+                self.limiter.retries += 1
+                await asyncio.sleep(backoff_delay(attempt))
+                continue
+
+            # 404s carry the same {"code": 0, "message": ...} shape, so only a 200 with it is a transient error
+            failed = status in RETRY_STATUSES or (status == 200 and is_error_payload(body))
+            if not failed or attempt == self.retries:
+                if status < 400:
+                    self.limiter.success()
+                return status, response_headers, body
+
+            self.limiter.retries += 1
+            delay = retry_after(response_headers)
+            if status == 429 or delay is not None:
+                # pauses every caller, and the next acquire() waits it out
+                self.limiter.throttle(delay if delay is not None else backoff_delay(attempt))
+            else:
+                await asyncio.sleep(backoff_delay(attempt))
+
+    async def get_bytes(self, path_or_url: str) -> bytes:
+        return (await self.fetch(path_or_url)).body
+
+    async def get_json(self, path_or_url: str) -> Dict[str, Any]:
+        return json.loads(await self.get_bytes(path_or_url))
+
+    async def get_text(self, path_or_url: str) -> str:
+        return (await self.get_bytes(path_or_url)).decode()
+
+    async def archives(self, username: str) -> List[str]:
+        """The monthly archive URLs for a player, oldest first."""
+        data = await self.get_json(f"/player/{username}/games/archives")
+        return sorted(data.get("archives", []))
+
+    async def month(self, url: str) -> Dict[str, Any]:
+        """A monthly archive as JSON, e.g. {"games": [...]}."""
+        return await self.get_json(url)
+
+    async def month_games(self, url: str, pgns: bool = True) -> List[ArchiveGame]:
+        """
+        A monthly archive's games, with each PGN only decoded when it's accessed (see chesscom.archive), or
+        left out altogether without `pgns`.
+        """
+        return list(iter_archive_games(await self.get_bytes(url), pgns))
+
+    async def month_pgn(self, url: str) -> str:
+        """A monthly archive as one PGN file."""
+        return await self.get_text(f"{url}/pgn")
+
+    async def titled(self, title: str) -> List[str]:
+        data = await self.get_json(f"/titled/{title}")
+        return data["players"]
+
+    async def tournament(self, url: str) -> Dict[str, Any]:
+        """A tournament, or one of its rounds/groups, by URL or "/tournament/..." path."""
+        return await self.get_json(url)
+
+    async def profile(self, username: str) -> Dict[str, Any]:
+        return await self.get_json(f"/player/{username}")
+
+    async def leaderboards(self) -> Dict[str, Any]:
+        return await self.get_json("/leaderboards")
+
+    async def new_games(self, url: str) -> List[Dict[str, Any]]:
+        """
+        Revalidates a monthly archive and returns only the games that weren't in the cached copy.
+
+        Every game is new the first time a month is fetched. Meant for polling the current month,
+        where most polls come back 304 and cost neither bandwidth nor parsing.
+        """
+        fetched = await self.fetch(url, revalidate=True)
+        if not fetched.changed:
+            return []
+
+        seen = set(GAME_URL_PATTERN.findall(fetched.previous)) if fetched.previous is not None else set()
+        games = json.loads(fetched.body).get("games", [])
+        return [game for game in games if game.get("url", "").encode() not in seen]
+
+    async def months(self, urls: List[str]) -> List[Dict[str, Any]]:
+        """
+        Fetches monthly archives concurrently, returned in the same order as `urls`. Every archive is held
+        in memory at once, so use `iter_months` for a player's whole history.
+        """
+        return await asyncio.gather(*[self.month(url) for url in urls])
+
+    async def iter_months(
+        self,
+        urls: List[str],
+        window: Optional[int] = None,
+        ordered: bool = False,
+        fetch_month: Optional[Callable[[str], Awaitable[Any]]] = None,
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Yields (url, archive) pairs as they arrive, or in the order of `urls` if `ordered`; the next months
+        download while the caller works on one. At most `window` months (twice the concurrency by default) are
+        downloading or waiting to be processed at a time, so memory stays flat however long the history is.
+        Each archive is fetched with `fetch_month`, `month` by default (`month_games` works too).
+        """
+        fetch_month = fetch_month or self.month
+
+        async def fetch(url):
+            return url, await fetch_month(url)
+
+        window = window or 2 * self.concurrency
+        urls = iter(urls)
+        pending = deque(asyncio.ensure_future(fetch(url)) for _, url in zip(range(window), urls))
+        try:
+            while pending:
+                if ordered:
+                    task = pending.popleft()
+                else:
+                    done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    task = next(task for task in pending if task in done)
+                    pending.remove(task)
+
+                yield await task
+                # the month just yielded counts towards the window until the caller comes back for the next
+                url = next(urls, None)
+                if url is not None:
+                    pending.append(asyncio.ensure_future(fetch(url)))
+        finally:
+            for task in pending:
+                task.cancel()
+
+
+def run(function: Callable[..., Awaitable[T]], *args, concurrency: int = DEFAULT_CONCURRENCY, **kwargs) -> T:
+    """Runs `function(client, *args, **kwargs)` with a fresh client, for use from synchronous scripts."""
+    async def main():
+        async with ChessComClient(concurrency) as client:
+            result = await function(client, *args, **kwargs)
+            if client.requests:
+                print(f"chess.com: {client.limiter}", file=sys.stderr)
+
+            return result
+
+    return asyncio.run(main())
+
+
+def iter_run(
+    function: Callable[..., AsyncIterator[T]],
+    *args,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    buffer: Optional[int] = None,
+    **kwargs,
+) -> Iterator[T]:
+    """
+    Like `run`, for an async generator `function(client, *args, **kwargs)`: its items are yielded to the
+    synchronous caller as they come. The client runs on its own event loop in a background thread, so
+    downloads carry on while the caller works on an item; at most `buffer` items (the concurrency by default)
+    wait to be taken. An exception in `function` is raised in the caller.
+    """
+    items = queue.Queue(maxsize=buffer or concurrency)
+    stopped = threading.Event()
+
+    async def produce():
+        async with ChessComClient(concurrency) as client:
+            try:
+                async for item in function(client, *args, **kwargs):
+                    # waiting for room on another thread keeps the loop, and the downloads, going
+                    await asyncio.get_running_loop().run_in_executor(None, items.put, (True, item))
+                    if stopped.is_set():
+                        break
+            finally:
+                if client.requests:
+                    print(f"chess.com: {client.limiter}", file=sys.stderr)
+
+    def work():
+        try:
+            asyncio.run(produce())
+            items.put((False, None))
+        except BaseException as error:
+            items.put((False, error))
+
+    thread = threading.Thread(target=work, daemon=True)
+    thread.start()
+    try:
+        while True:
+            more, item = items.get()
+            if not more:
+                if item is not None:
+                    raise item
+                return
+            yield item
+    finally:
+        stopped.set()
+        # frees the producer if it's waiting for room, until it has seen that the caller is gone
+        while thread.is_alive():
+            try:
+                items.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        thread.join()
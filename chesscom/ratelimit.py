@@ -0,0 +1,154 @@
+"""
+Rate limiting and retry policy for the chess.com API.
+
+Every ChessComClient in a process draws from one token bucket, so scripts that fetch concurrently
+(or run several clients) still share a single request budget. The bucket is adaptive: each
+throttled response (429, or a Retry-After) halves the rate and pauses every caller, and each
+success creeps back up towards `max_rate`. Over a long run the achieved rate settles just below
+what the API allows, and `RateLimiter.summary()` reports it so `max_rate` can be tuned.
+
+Failed requests (429, 5xx, chess.com's 200-with-an-error-message payloads, dropped connections)
+are retried with exponential backoff and full jitter, honouring Retry-After when it's sent.
+
+Set CHESS_SCRIPTS_RATE to change the default requests/second.
+"""
+from typing import Dict, Mapping, Optional
+
+import asyncio
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+import json
+import os
+import random
+import time
+
+
+RATE_ENV = "CHESS_SCRIPTS_RATE"
+DEFAULT_RATE = 10.0
+MIN_RATE = 0.5
+
+DEFAULT_RETRIES = 5
+BACKOFF_BASE = 1.0
+BACKOFF_CAP = 60.0
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class RateLimiter:
+    """An asyncio token bucket whose rate backs off multiplicatively and recovers additively."""
+
+    def __init__(self, max_rate: float = DEFAULT_RATE, burst: Optional[float] = None, min_rate: float = MIN_RATE):
+        self.max_rate = max_rate
+        self.min_rate = min(min_rate, max_rate)
+        self.rate = max_rate
+        self.burst = burst or max(1.0, max_rate)
+        self.requests = 0
+        self.throttled = 0
+        self.retries = 0
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._started = None
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> None:
+        """Waits until a request may be sent."""
+        while True:
+            now = time.monotonic()
+            self._refill(now)
+            wait = self._paused_until - now
+            if wait <= 0 and self._tokens >= 1:
+                self._tokens -= 1
+                self.requests += 1
+                if self._started is None:
+                    self._started = now
+                return
+
+            await asyncio.sleep(max(wait, (1 - self._tokens) / self.rate))
+
+    def success(self) -> None:
+        # recovers from a halving in roughly a hundred successful requests
+        self.rate = min(self.max_rate, self.rate + self.max_rate / 100)
+
+    def throttle(self, pause: float) -> None:
+        """The API pushed back: slow everyone down and hold off all requests for `pause` seconds."""
+        now = time.monotonic()
+        self.throttled += 1
+        # requests already in flight when the first 429 arrived don't halve the rate again
+        if now >= self._paused_until:
+            self.rate = max(self.min_rate, self.rate / 2)
+        self._tokens = min(self._tokens, 0)
+        self._paused_until = max(self._paused_until, now + pause)
+
+    def achieved_rate(self) -> float:
+        if self._started is None:
+            return 0.0
+
+        elapsed = time.monotonic() - self._started
+        return self.requests / elapsed if elapsed > 0 else float(self.requests)
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "requests": self.requests,
+            "achieved_rate": round(self.achieved_rate(), 2),
+            "rate": round(self.rate, 2),
+            "max_rate": self.max_rate,
+            "throttled": self.throttled,
+            "retries": self.retries,
+        }
+
+    def __str__(self) -> str:
+        return (
+            f"{self.requests} requests at {self.achieved_rate():.1f}/s "
+            f"(limit {self.rate:.1f}/s of {self.max_rate:g}/s, {self.throttled} throttled, {self.retries} retries)"
+        )
+
+
+_default_limiter: Optional[RateLimiter] = None
+
+
+def default_limiter() -> RateLimiter:
+    """The limiter shared by every client in this process."""
+    global _default_limiter
+    if _default_limiter is None:
+        _default_limiter = RateLimiter(float(os.environ.get(RATE_ENV, DEFAULT_RATE)))
+
+    return _default_limiter
+
+
+def backoff_delay(attempt: int, base: float = BACKOFF_BASE, cap: float = BACKOFF_CAP) -> float:
+    """Exponential backoff with full jitter, so retrying callers don't come back in lockstep."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def retry_after(headers: Mapping[str, str]) -> Optional[float]:
+    """Seconds to wait from a Retry-After header, which may be a number or an HTTP date."""
+    value = headers.get("Retry-After")
+    if not value:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def is_error_payload(body: bytes) -> bool:
+    """chess.com sometimes answers 200 with {"code": 0, "message": "An internal error has occurred..."}."""
+    if not body.lstrip().startswith(b'{"code"'):
+        return False
+
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return False
+
+    return isinstance(data, dict) and set(data) <= {"code", "message"}
@@ -0,0 +1,198 @@
+"""
+A local stand-in for the chess.com published-data API, serving recorded fixtures.
+
+Any /pub/... path is answered from a fixture directory that mirrors the API's paths:
+
+    /pub/player/hikaru/games/archives      ->  fixtures/player/hikaru/games/archives.json
+    /pub/player/hikaru/games/2024/01       ->  fixtures/player/hikaru/games/2024/01.json
+    /pub/player/hikaru/games/2024/01/pgn   ->  fixtures/player/hikaru/games/2024/01.pgn
+                                               (or built from the month's JSON if there's no .pgn)
+    /pub/titled/GM, /pub/leaderboards, /pub/tournament/..., /pub/player/hikaru  ->  <path>.json
+
+Responses carry an ETag and honour If-None-Match, and are gzipped when asked, like the real API.
+To exercise the fetch layer, the server can add latency, fail a fraction of requests (5xx or
+chess.com's 200-with-an-error-message payload), and answer 429 with Retry-After above a request rate.
+In record mode, paths without a fixture are fetched from api.chess.com and saved, so a script run
+once online can afterwards be replayed (and benchmarked) offline.
+
+Point the scripts at it with CHESS_SCRIPTS_API=http://127.0.0.1:8080/pub.
+
+Usage:
+python -m chesscom.standin --fixtures fixtures --record                       # capture fixtures
+python -m chesscom.standin --fixtures fixtures --latency 80 --jitter 40 --error-rate 0.05 --max-rate 20
+"""
+from typing import Dict, Optional
+
+import argparse
+import asyncio
+import hashlib
+import json
+from pathlib import Path
+import random
+import sys
+import time
+
+import aiohttp
+from aiohttp import web
+
+from chesscom.client import BASE_URL, HEADERS
+
+
+DEFAULT_PORT = 8080
+
+ERROR_PAYLOAD = {
+    "code": 0,
+    "message": "An internal error has occurred. Please contact Chess.com Developer's Forum for further help https://www.chess.com/club/chess-com-developer-community .",
+}
+
+
+class StandIn:
+    def __init__(
+        self,
+        fixtures: str,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        max_rate: Optional[float] = None,
+        record: bool = False,
+        seed: Optional[int] = None,
+    ):
+        self.fixtures = Path(fixtures)
+        self.latency = latency / 1000
+        self.jitter = jitter / 1000
+        self.error_rate = error_rate
+        self.max_rate = max_rate
+        self.record = record
+        self.random = random.Random(seed)
+        self.stats: Dict[str, int] = {"requests": 0, "ok": 0, "not_modified": 0, "missing": 0, "errors": 0, "throttled": 0, "recorded": 0}
+        self._tokens = max_rate or 0.0
+        self._updated = time.monotonic()
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def fixture_path(self, path: str) -> Path:
+        if path.endswith("/pgn"):
+            return self.fixtures / f"{path[:-len('/pgn')]}.pgn"
+
+        return self.fixtures / f"{path}.json"
+
+    def _throttled(self) -> bool:
+        """A token bucket holding a second's worth of requests, like a per-client API quota."""
+        if not self.max_rate:
+            return False
+
+        now = time.monotonic()
+        self._tokens = min(self.max_rate, self._tokens + (now - self._updated) * self.max_rate)
+        self._updated = now
+        if self._tokens < 1:
+            return True
+
+        self._tokens -= 1
+        return False
+
+    async def _record(self, path: str, fixture: Path) -> Optional[bytes]:
+        if self._session is None:
+            self._session = aiohttp.ClientSession(headers=HEADERS)
+
+        async with self._session.get(f"{BASE_URL}/{path}") as response:
+            body = await response.read()
+            if response.status != 200:
+                return None
+
+        fixture.parent.mkdir(parents=True, exist_ok=True)
+        fixture.write_bytes(body)
+        self.stats["recorded"] += 1
+
+        return body
+
+    async def load(self, path: str) -> Optional[bytes]:
+        fixture = self.fixture_path(path)
+        if fixture.exists():
+            return fixture.read_bytes()
+
+        if path.endswith("/pgn"):
+            month = self.fixtures / f"{path[:-len('/pgn')]}.json"
+            if month.exists():
+                games = json.loads(month.read_bytes()).get("games", [])
+                return "\n\n".join(game["pgn"] for game in games if "pgn" in game).encode()
+
+        if self.record:
+            return await self._record(path, fixture)
+
+        return None
+
+    async def handle(self, request: web.Request) -> web.StreamResponse:
+        self.stats["requests"] += 1
+        if self.latency or self.jitter:
+            await asyncio.sleep(max(0.0, self.random.gauss(self.latency, self.jitter)))
+
+        if self._throttled():
+            self.stats["throttled"] += 1
+            return web.Response(status=429, headers={"Retry-After": "1"})
+
+        if self.error_rate and self.random.random() < self.error_rate:
+            self.stats["errors"] += 1
+            if self.random.random() < 0.5:
+                return web.json_response(ERROR_PAYLOAD)
+
+            return web.Response(status=self.random.choice([500, 502, 503]))
+
+        path = request.match_info["path"].strip("/")
+        body = None if ".." in path.split("/") else await self.load(path)
+        if body is None:
+            self.stats["missing"] += 1
+            return web.json_response({"code": 0, "message": f"Data provider not found for key \"/pub/{path}\"."}, status=404)
+
+        etag = f'"{hashlib.md5(body).hexdigest()}"'
+        if request.headers.get("If-None-Match") == etag:
+            self.stats["not_modified"] += 1
+            return web.Response(status=304, headers={"ETag": etag})
+
+        self.stats["ok"] += 1
+        content_type = "application/x-chess-pgn" if path.endswith("/pgn") else "application/json"
+        response = web.Response(body=body, content_type=content_type, headers={"ETag": etag})
+        if "gzip" in request.headers.get("Accept-Encoding", ""):
+            response.enable_compression()
+
+        return response
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/pub/{path:.*}", self.handle)
+        app.on_cleanup.append(self._close)
+        return app
+
+    async def _close(self, app: web.Application) -> None:
+        if self._session is not None:
+            await self._session.close()
+
+    async def start(self, host: str = "127.0.0.1", port: int = DEFAULT_PORT) -> web.AppRunner:
+        """Serves in the background of the current event loop, for benchmarks; call `runner.cleanup()` to stop."""
+        runner = web.AppRunner(self.app())
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        return runner
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve chess.com API fixtures locally")
+    parser.add_argument("--fixtures", type=str, default="fixtures", help="fixture directory, mirroring /pub/ paths")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--latency", type=float, default=0.0, help="mean added latency in ms")
+    parser.add_argument("--jitter", type=float, default=0.0, help="standard deviation of the latency in ms")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests failed with a 5xx or error payload")
+    parser.add_argument("--max-rate", type=float, default=None, help="requests/second above which to answer 429")
+    parser.add_argument("--record", action="store_true", help="fetch and save fixtures that don't exist yet")
+    parser.add_argument("--seed", type=int, default=None, help="seed for reproducible latency and errors")
+    args = parser.parse_args()
+
+    standin = StandIn(args.fixtures, args.latency, args.jitter, args.error_rate, args.max_rate, args.record, args.seed)
+    print(f"serving {args.fixtures} at http://{args.host}:{args.port}/pub", file=sys.stderr)
+    try:
+        web.run_app(standin.app(), host=args.host, port=args.port, print=None)
+    finally:
+        print(json.dumps(standin.stats), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
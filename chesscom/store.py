@@ -0,0 +1,333 @@
+"""
+A local store of downloaded chess.com games: one row per game, deduplicated by game URL.
+
+The columns scripts filter on (players, time class/control, rules, rated, end time, tournament,
+results, ratings) are stored and indexed, and the PGN is kept zlib-compressed, so questions like
+"all blitz games between titled players in 2024" are an indexed query rather than a crawl over
+monthly archives. Usernames are stored lowercase. Ingest is incremental: games already in the
+store are skipped, so re-ingesting a month only adds the games that are new.
+
+The store also records which (player, year, month) archives have been synced, and whether the
+month was already over at the time, so `chesscom.sync` only fetches what's new since the last run.
+
+Set CHESS_SCRIPTS_GAMES to move the store.
+
+Example:
+store = GameStore()
+store.add_games(archive["games"])
+for game in store.query(time_class="blitz", between=get_titled_players(), start=datetime(2024, 1, 1)):
+    print(game["pgn"])
+
+Usage:
+python -m chesscom.store ingest raw_data/*.json     # import monthly archives saved as JSON
+python -m chesscom.store export --time_class blitz --titled --year 2024 > titled_blitz_2024.pgn
+python -m chesscom.store stats
+"""
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import argparse
+from datetime import datetime, timezone
+import json
+import os
+from pathlib import Path
+import sqlite3
+import sys
+import time
+import zlib
+
+from chesscom.archive import read_archive
+
+
+STORE_ENV = "CHESS_SCRIPTS_GAMES"
+DEFAULT_PATH = Path.home() / ".local" / "share" / "chess-scripts" / "games.sqlite"
+
+COLUMNS = [
+    "url",
+    "white",
+    "black",
+    "white_rating",
+    "black_rating",
+    "white_result",
+    "black_result",
+    "white_accuracy",
+    "black_accuracy",
+    "time_class",
+    "time_control",
+    "rules",
+    "rated",
+    "end_time",
+    "tournament",
+    "pgn",
+]
+
+INDEXES = {
+    "games_white": "white, end_time",
+    "games_black": "black, end_time",
+    "games_time_class": "time_class, end_time",
+    "games_time_control": "time_control",
+    "games_rules": "rules",
+    "games_rated": "rated",
+    "games_end_time": "end_time",
+    "games_tournament": "tournament",
+    "games_results": "white_result, black_result",
+}
+
+
+def game_row(game: Dict[str, Any]) -> Tuple:
+    """Flattens a game from a monthly archive into a row of COLUMNS."""
+    accuracies = game.get("accuracies", {})
+    return (
+        game["url"],
+        game["white"]["username"].lower(),
+        game["black"]["username"].lower(),
+        game["white"].get("rating"),
+        game["black"].get("rating"),
+        game["white"].get("result"),
+        game["black"].get("result"),
+        accuracies.get("white"),
+        accuracies.get("black"),
+        game.get("time_class"),
+        game.get("time_control"),
+        game.get("rules"),
+        int(game.get("rated", False)),
+        game.get("end_time"),
+        game.get("tournament"),
+        zlib.compress(game.get("pgn", "").encode(), 6),
+    )
+
+
+class GameStore:
+    def __init__(self, path: str = None):
+        self.path = Path(path or os.environ.get(STORE_ENV) or DEFAULT_PATH)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(self.path, timeout=30)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS games (
+                url TEXT PRIMARY KEY,
+                white TEXT NOT NULL,
+                black TEXT NOT NULL,
+                white_rating INTEGER,
+                black_rating INTEGER,
+                white_result TEXT,
+                black_result TEXT,
+                white_accuracy REAL,
+                black_accuracy REAL,
+                time_class TEXT,
+                time_control TEXT,
+                rules TEXT,
+                rated INTEGER,
+                end_time INTEGER,
+                tournament TEXT,
+                pgn BLOB NOT NULL
+            )
+            """
+        )
+        for name, columns in INDEXES.items():
+            self.connection.execute(f"CREATE INDEX IF NOT EXISTS {name} ON games ({columns})")
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS synced_months (
+                player TEXT NOT NULL,
+                year INTEGER NOT NULL,
+                month INTEGER NOT NULL,
+                games INTEGER NOT NULL,
+                complete INTEGER NOT NULL,
+                synced_at REAL NOT NULL,
+                PRIMARY KEY (player, year, month)
+            )
+            """
+        )
+        self.connection.commit()
+
+    def _insert_games(self, games: Iterable[Dict[str, Any]]) -> int:
+        placeholders = ", ".join("?" * len(COLUMNS))
+        before = self.connection.total_changes
+        self.connection.executemany(
+            f"INSERT OR IGNORE INTO games ({', '.join(COLUMNS)}) VALUES ({placeholders})",
+            (game_row(game) for game in games if "url" in game),
+        )
+        return self.connection.total_changes - before
+
+    def add_games(self, games: Iterable[Dict[str, Any]]) -> int:
+        """Inserts games that aren't in the store yet, in one transaction. Returns how many were new."""
+        with self.connection:
+            return self._insert_games(games)
+
+    def synced_months(self, player: str) -> Dict[Tuple[int, int], bool]:
+        """{(year, month): complete} for every archive of the player synced so far."""
+        rows = self.connection.execute(
+            "SELECT year, month, complete FROM synced_months WHERE player = ?", (player.lower(),)
+        )
+        return {(year, month): bool(complete) for year, month, complete in rows}
+
+    def add_months(self, months: Iterable[Tuple[str, int, int, List[Dict[str, Any]], bool]]) -> int:
+        """
+        Stores the games of several (player, year, month, games, complete) archives and marks them
+        synced, all in one transaction. Returns how many games were new.
+        """
+        added = 0
+        now = time.time()
+        with self.connection:
+            for player, year, month, games, complete in months:
+                added += self._insert_games(games)
+                self.connection.execute(
+                    """
+                    INSERT OR REPLACE INTO synced_months (player, year, month, games, complete, synced_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    """,
+                    (player.lower(), year, month, len(games), int(complete), now),
+                )
+
+        return added
+
+    def __contains__(self, url: str) -> bool:
+        return self.connection.execute("SELECT 1 FROM games WHERE url = ?", (url,)).fetchone() is not None
+
+    def __len__(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM games").fetchone()[0]
+
+    def query(
+        self,
+        player: Optional[str] = None,
+        white: Optional[str] = None,
+        black: Optional[str] = None,
+        between: Optional[Iterable[str]] = None,
+        time_class: Optional[str] = None,
+        time_control: Optional[str] = None,
+        rules: Optional[str] = "chess",
+        rated: Optional[bool] = None,
+        tournament: Optional[str] = None,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        columns: Optional[List[str]] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Yields games matching every given filter, oldest first, as dicts of `columns` (all by default)
+        with the PGN decompressed. `player` matches either side; `between` keeps only games where both
+        players are in the given collection of usernames; `start`/`end` bound the game's end time.
+        """
+        conditions = []
+        params: List[Any] = []
+        for column, value in [
+            ("white", white),
+            ("black", black),
+            ("time_class", time_class),
+            ("time_control", time_control),
+            ("rules", rules),
+            ("tournament", tournament),
+        ]:
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(value.lower() if column in {"white", "black"} else value)
+
+        if player is not None:
+            conditions.append("(white = ? OR black = ?)")
+            params += [player.lower(), player.lower()]
+        if rated is not None:
+            conditions.append("rated = ?")
+            params.append(int(rated))
+        if start is not None:
+            conditions.append("end_time >= ?")
+            params.append(int(start.timestamp()))
+        if end is not None:
+            conditions.append("end_time < ?")
+            params.append(int(end.timestamp()))
+        if between is not None:
+            # a temp table keeps the membership test indexed however many usernames there are
+            self.connection.execute("CREATE TEMP TABLE IF NOT EXISTS between_players (username TEXT PRIMARY KEY)")
+            self.connection.execute("DELETE FROM between_players")
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO between_players VALUES (?)", ((username.lower(),) for username in between)
+            )
+            conditions.append("white IN between_players AND black IN between_players")
+
+        columns = columns or COLUMNS
+        sql = f"SELECT {', '.join(columns)} FROM games"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY end_time"
+
+        for row in self.connection.execute(sql, params):
+            game = dict(row)
+            if "pgn" in game:
+                game["pgn"] = zlib.decompress(game["pgn"]).decode()
+            yield game
+
+    def stats(self) -> Dict[str, Any]:
+        count, first, last = self.connection.execute("SELECT COUNT(*), MIN(end_time), MAX(end_time) FROM games").fetchone()
+        by_time_class = dict(
+            self.connection.execute("SELECT time_class, COUNT(*) FROM games GROUP BY time_class").fetchall()
+        )
+        return {
+            "games": count,
+            "first": datetime.fromtimestamp(first, timezone.utc).date().isoformat() if first else None,
+            "last": datetime.fromtimestamp(last, timezone.utc).date().isoformat() if last else None,
+            "time_classes": by_time_class,
+            "bytes": self.path.stat().st_size,
+        }
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def __enter__(self) -> "GameStore":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Manage the local chess.com game store")
+    parser.add_argument("--path", type=str, default=None, help=f"store file (defaults to ${STORE_ENV} or {DEFAULT_PATH})")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    ingest = commands.add_parser("ingest", help="add games from saved monthly archive JSON files")
+    ingest.add_argument("files", nargs="+")
+
+    export = commands.add_parser("export", help="write matching games as PGN to stdout")
+    export.add_argument("--player", type=str, default=None)
+    export.add_argument("--time_class", type=str, default=None)
+    export.add_argument("--time_control", type=str, default=None)
+    export.add_argument("--year", type=int, default=None)
+    export.add_argument("--titled", action="store_true", help="only games between two titled players")
+
+    commands.add_parser("stats", help="show the size of the store")
+    args = parser.parse_args()
+
+    with GameStore(args.path) as store:
+        if args.command == "ingest":
+            added = sum(store.add_games(read_archive(path)) for path in args.files)
+            print(f"added {added} games ({len(store)} in the store)", file=sys.stderr)
+
+        elif args.command == "export":
+            between = None
+            if args.titled:
+                from chesscom.titled import get_titled_players
+
+                between = get_titled_players().usernames
+
+            year = {}
+            if args.year:
+                year = {"start": datetime(args.year, 1, 1, tzinfo=timezone.utc), "end": datetime(args.year + 1, 1, 1, tzinfo=timezone.utc)}
+
+            for game in store.query(
+                player=args.player,
+                between=between,
+                time_class=args.time_class,
+                time_control=args.time_control,
+                columns=["pgn"],
+                **year,
+            ):
+                sys.stdout.write(game["pgn"])
+                sys.stdout.write("\n\n")
+
+        else:
+            print(json.dumps(store.stats(), indent=2))
+
+
+if __name__ == '__main__':
+    main()
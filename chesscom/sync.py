@@ -0,0 +1,121 @@
+"""
+Incremental sync of players' monthly archives into the local game store.
+
+For each player the archive list is fetched and compared with the months already recorded in
+the store: finished months that were synced after they ended are skipped, and everything else
+(new months, and months that were still in progress at the last sync, including the current one)
+is fetched. Players are synced concurrently, new months are written a batch per transaction,
+and the client's rate limiter paces the requests.
+
+Example:
+async def nightly(client, store):
+    titled = await fetch_titled_players(client)
+    return await sync_players(client, store, titled, keep=lambda game: game["rules"] == "chess")
+
+stats = run(nightly, GameStore())
+"""
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import asyncio
+from datetime import datetime, timezone
+
+from tqdm import tqdm
+
+from chesscom.cache import MONTH_PATTERN
+from chesscom.client import ChessComClient, ChessComError
+from chesscom.store import GameStore
+
+
+DEFAULT_PLAYER_CONCURRENCY = 16
+# months fetched, then written in one transaction, at a time, so a long first sync doesn't sit in memory
+MONTHS_PER_BATCH = 12
+
+
+class SyncStats(NamedTuple):
+    players: int
+    months: int
+    games: int
+    failed: List[str]
+
+
+def month_key(url: str) -> Optional[Tuple[int, int]]:
+    match = MONTH_PATTERN.search(url)
+    return (int(match.group(1)), int(match.group(2))) if match else None
+
+
+def months_to_fetch(archives: Iterable[str], synced: Dict[Tuple[int, int], bool]) -> List[Tuple[str, int, int]]:
+    """The (url, year, month) archives that aren't in the store yet or were still in progress when synced."""
+    pending = []
+    for url in archives:
+        key = month_key(url)
+        if key is not None and not synced.get(key, False):
+            pending.append((url, *key))
+
+    return pending
+
+
+async def sync_player(
+    client: ChessComClient,
+    store: GameStore,
+    player: str,
+    keep: Optional[Callable[[Dict[str, Any]], bool]] = None,
+) -> Tuple[int, int]:
+    """
+    Fetches the player's new months and stores the games `keep` accepts (all of them by default).
+
+    Returns:
+        Tuple[int, int]: the number of months fetched and of games added
+    """
+    pending = months_to_fetch(await client.archives(player), store.synced_months(player))
+    now = datetime.now(timezone.utc)
+
+    added = 0
+    for start in range(0, len(pending), MONTHS_PER_BATCH):
+        batch = pending[start:start + MONTHS_PER_BATCH]
+        # games are read lazily, so PGNs are only decoded for the games `keep` accepts
+        archives = await asyncio.gather(*[client.month_games(url) for url, _, _ in batch])
+
+        months = []
+        for (url, year, month), games in zip(batch, archives):
+            if keep is not None:
+                games = [game for game in games if keep(game)]
+
+            # a month is only final once it's over; otherwise it's fetched again next time
+            months.append((player, year, month, games, (year, month) < (now.year, now.month)))
+
+        added += store.add_months(months)
+
+    return len(pending), added
+
+
+async def sync_players(
+    client: ChessComClient,
+    store: GameStore,
+    players: Iterable[str],
+    keep: Optional[Callable[[Dict[str, Any]], bool]] = None,
+    concurrency: int = DEFAULT_PLAYER_CONCURRENCY,
+) -> SyncStats:
+    """Syncs many players, `concurrency` at a time. Players whose sync fails are reported, not retried."""
+    players = list(players)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def sync(player):
+        async with semaphore:
+            try:
+                return player, await sync_player(client, store, player, keep)
+            except ChessComError as e:
+                tqdm.write(str(e))
+                return player, None
+
+    months = games = 0
+    failed = []
+    for task in tqdm(asyncio.as_completed([sync(player) for player in players]), total=len(players)):
+        player, result = await task
+        if result is None:
+            failed.append(player)
+            continue
+
+        months += result[0]
+        games += result[1]
+
+    return SyncStats(len(players), months, games, failed)
@@ -0,0 +1,58 @@
+"""
+The registry of titled players on chess.com.
+
+The ten /titled/<TITLE> lists are fetched concurrently and kept in the on-disk response cache for
+a day, so after the first run loading the registry costs no network round trips. Usernames are
+normalized to lowercase (game JSON uses the player's display casing, the titled lists don't),
+and membership checks are a frozenset lookup rather than a scan of a list.
+
+Example:
+titled = get_titled_players()
+if game["white"]["username"] in titled:
+    print(titled.title(game["white"]["username"]))
+"""
+from typing import Dict, Iterator, List, Optional
+
+import asyncio
+from functools import lru_cache
+
+from chesscom.client import TITLES, ChessComClient, run
+
+
+class TitledPlayers:
+    def __init__(self, titles: Dict[str, str]):
+        self.titles = {username.lower(): title for username, title in titles.items()}
+        self.usernames = frozenset(self.titles)
+        self.names: List[str] = sorted(self.usernames)
+
+    def __contains__(self, username: str) -> bool:
+        return username.lower() in self.usernames
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.names)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def title(self, username: str) -> Optional[str]:
+        """The player's title ("GM", "IM", ...), or None if they aren't titled."""
+        return self.titles.get(username.lower())
+
+    def with_title(self, *titles: str) -> frozenset:
+        return frozenset(username for username, title in self.titles.items() if title in titles)
+
+
+async def fetch_titled_players(client: ChessComClient) -> TitledPlayers:
+    players = await asyncio.gather(*[client.titled(title) for title in TITLES])
+    titles = {}
+    # reversed so that a player listed under two titles keeps the higher one
+    for title, usernames in reversed(list(zip(TITLES, players))):
+        titles.update(dict.fromkeys(usernames, title))
+
+    return TitledPlayers(titles)
+
+
+@lru_cache(maxsize=None)
+def get_titled_players() -> TitledPlayers:
+    """The registry for synchronous scripts, loaded once per process."""
+    return run(fetch_titled_players)
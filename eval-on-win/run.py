@@ -6,30 +6,33 @@ Only uses moves after move 10 (5 for each player) to avoid including eval from o
 Does not include mate in X evaluations
 """
 from collections import defaultdict
+from pathlib import Path
 import sys
-import re
 
-from tqdm import tqdm
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from pgn_parser.evals import MISSING, decode_evals  # noqa: E402
+from script_utils.progress import progress_stdin  # noqa: E402
+
 
-pattern = re.compile(r'\[%eval (-?\d+.\d+)\]')
 totals = defaultdict(int)
 
 white_evals = []
 black_evals = []
 draw_evals = []
 
-for line in tqdm(sys.stdin):
+for line in progress_stdin():
     if r'%eval' not in line:
         continue
 
-    matches = pattern.findall(line)
-    if len(matches) < 11:
+    evals = decode_evals(line, mate_score=None)
+    evals = evals[evals != MISSING]
+    if len(evals) < 11:
         continue
 
-    matches = matches[10:]
+    evals = evals[10:]
 
-    if matches:
-        avg = sum(map(float, matches)) / len(matches)
+    if len(evals):
+        avg = evals.mean() / 100
 
         if '1/2-1/2' in line:
             draw_evals.append(avg)
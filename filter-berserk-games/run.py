@@ -4,14 +4,17 @@ This is only applicable for PGNs generated from the Lichess database: https://da
 since that is the only site I'm aware of that allows berserking.
 
 Usage:
-cat /path/to/lichess/pgn.pgn | python run.py > berserk_db.pgn
+cat /path/to/lichess/pgn.pgn | python run.py [--profile] > berserk_db.pgn
 """
+from itertools import islice
+from pathlib import Path
 import sys
-import re
 
 from chess.pgn import read_game
 
-clock_pattern = re.compile(r"(\d+):(\d+):(\d+)")
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from pgn_parser.clocks import decode_clocks, parse_time_control  # noqa: E402
+from script_utils.profiling import maybe_profile  # noqa: E402
 
 
 def game_is_berserk(game) -> bool:
@@ -19,27 +22,24 @@ def game_is_berserk(game) -> bool:
     if event is None or "tournament" not in event:
         return False
 
-    time_control = game.headers["TimeControl"]
-    time_control = int(time_control.split("+")[0])
+    time_control = parse_time_control(game.headers["TimeControl"])
+    if time_control is None:
+        return False
 
     try:
-        white, black = list(game.mainline())[:2]
+        white, black = islice(game.mainline(), 2)
     except ValueError:
         return False
 
-    for move in [white, black]:
-        match = clock_pattern.search(move.comment)
-        if not match:
-            return False
-
-        hours, minutes, seconds = map(int, [match.group(1), match.group(2), match.group(3)])
-        move_tc = hours * 60 * 60 + minutes * 60 + seconds
+    clocks = decode_clocks(white.comment + black.comment)
+    if len(clocks) < 2:
+        return False
 
-        if move_tc < time_control:
-            return True
+    # clocks are in whole seconds on lichess, so anything below the initial time means half of it was given up
+    return bool((clocks < time_control[0]).any())
 
-    return False
 
+maybe_profile()
 
 game = read_game(sys.stdin)
 count = 0
@@ -6,18 +6,53 @@ We replaced the old Brilliant algorithm with a simpler definition
     you should not be in a bad position after a Brilliant move
     you should not be completely winning even if you had not found the move.
 Also, we are more generous in defining a piece sacrifice for newer players, compared with those who are higher rated.
+
+Downloads overlap with analysis: upcoming monthly archives are fetched in the background (up to --prefetch months
+at a time) while the engines work through the current one, so the run takes about as long as the engines alone.
+Games are analysed concurrently on a pool of engines (see analysis.pool), one per core by default: a rolling window
+of GAMES_PER_ENGINE games per engine is walked at once, and each game that finishes makes room for the next one,
+whichever month or file it's from, so the engines never run dry at a month's end.
+Each sacrifice is searched at half depth first, and only searched at full depth when the shallow result could
+still pass the tests below with every threshold loosened by ESCALATION_MARGIN (see analysis.budget).
+Each game's verdict is saved to a checkpoint (--progress, a SQLite file; see analysis.checkpoint) as soon as it's
+known, keyed by the game's URL and the analysis settings, so an interrupted run loses only the games in flight.
+A rerun with the same settings skips the games (and the finished months) already analysed, and reports the brilliant
+games from every run; new months, and new games in the current one, are all that's left to analyse. A --progress
+file from before checkpoints (JSON) is carried over into a .sqlite checkpoint next to it, and left as it was.
+
+With --file_path the games come from a PGN file instead (all of them, for both sides, or only the player's when a
+username is given too), read as the window has room for them. Moves whose [%eval] annotation, as in analysed
+Lichess games, already says the mover isn't doing well enough afterwards are ruled out without the engine.
+So are sacrifices that are still in the opening book (--book), which are theory rather than finds (analysis.shortcuts).
 """
 
+from typing import AsyncIterable, AsyncIterator, Callable, Iterable, Iterator, List, Optional, Tuple
+
 import argparse
+import asyncio
+import collections
+from datetime import datetime, timezone
+import hashlib
+import json
+from pathlib import Path
+import sys
 from io import StringIO
 
-import requests
 from tqdm import tqdm
 
 import chess
 import chess.pgn
 import chess.engine
 
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from script_utils.profiling import maybe_profile  # noqa: E402
+from analysis.pool import EnginePool, add_engine_arguments, encode_limit, pool_from_args, report  # noqa: E402
+from analysis.checkpoint import Checkpoint  # noqa: E402
+from analysis.budget import TwoPass, add_budget_arguments  # noqa: E402
+from analysis.annotations import iter_pgn_games  # noqa: E402
+from chesscom.client import ChessComClient  # noqa: E402
+from chesscom.sync import month_key  # noqa: E402
+
 
 PIECE_VALUE_MAP = {
     chess.KING: 0,
@@ -28,26 +63,16 @@ PIECE_VALUE_MAP = {
     chess.PAWN: 1,
 }
 
-HEADERS = {
-    "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/117.0.0.0 Safari/537.36"
-}
-
-
-def number_of_defenders(board, move):
-    squares = [square for square in board.attackers(board.turn ^ 1, move.to_square)]
-    return len(squares)
-
+DEFAULT_PREFETCH = 3
 
-def number_of_attackers(board, move):
-    squares = [square for square in board.attackers(board.turn, move.to_square)]
-    return len(squares)
-
-
-def piece_is_underdefended(board, move):
-    defenders = number_of_defenders(board, move)
-    attackers = number_of_attackers(board, move)
-
-    return attackers > defenders
+SEARCH_LIMIT = chess.engine.Limit(depth=18)
+# how far (in centipawns) a shallow result may be from every threshold and still get the full search
+ESCALATION_MARGIN = 100
+# how far an annotated evaluation may be from the losing_if_played threshold and still get the engine's opinion;
+# annotations come from a similar depth, but a different engine and settings
+ANNOTATION_MARGIN = 50
+# games walked at once per engine; each has one position at a time with an engine, so it takes several
+GAMES_PER_ENGINE = 16
 
 
 def piece_is_moved(board, move) -> bool:
@@ -59,15 +84,62 @@ def piece_is_moved(board, move) -> bool:
     ]
 
 
-def captures_greater_piece(board, move):
-    piece_moved_value = PIECE_VALUE_MAP[board.piece_at(move.from_square).piece_type]
-    target_square_piece = board.piece_at(move.to_square)
-    target_value = PIECE_VALUE_MAP.get(
-        None if target_square_piece is None else target_square_piece.piece_type, 0
-    )
-
-    # captures a more valuable piece or a piece of equal value
-    return piece_moved_value <= target_value
+def least_valuable_attacker(board, color, square, occupied):
+    """The square of `color`'s cheapest piece that can capture on `square` with only `occupied` left on the board."""
+    attackers = board.attackers_mask(color, square, occupied) & occupied
+    for piece_type in [chess.PAWN, chess.KNIGHT, chess.BISHOP, chess.ROOK, chess.QUEEN, chess.KING]:
+        for attacker in chess.scan_forward(attackers & board.pieces_mask(piece_type, color)):
+            # a pinned piece can only recapture along its pin
+            if board.pin_mask(color, attacker) & chess.BB_SQUARES[square]:
+                return attacker
+
+    return None
+
+
+def static_exchange_evaluation(board, move) -> int:
+    """
+    The material the side to move wins (or loses, if negative) when `move` starts a sequence of captures on its
+    target square and each side recaptures with its cheapest piece for as long as that pays off.
+    Captures are found on the bitboards with the pieces already exchanged removed, so x-rays behind them join in.
+    """
+    square = move.to_square
+    if board.is_en_passant(move):
+        gains = [PIECE_VALUE_MAP[chess.PAWN]]
+        occupied = board.occupied & ~chess.BB_SQUARES[square - 8 if board.turn == chess.WHITE else square + 8]
+    else:
+        gains = [PIECE_VALUE_MAP.get(board.piece_type_at(square), 0)]
+        occupied = board.occupied
+
+    on_square = board.piece_type_at(move.from_square)
+    if move.promotion:
+        gains[0] += PIECE_VALUE_MAP[move.promotion] - PIECE_VALUE_MAP[chess.PAWN]
+        on_square = move.promotion
+
+    occupied &= ~chess.BB_SQUARES[move.from_square]
+    color = not board.turn
+    while True:
+        attacker = least_valuable_attacker(board, color, square, occupied)
+        if attacker is None:
+            break
+
+        # the king can only take last, once the other side has nothing left to take back with
+        if board.piece_type_at(attacker) == chess.KING and least_valuable_attacker(
+            board, not color, square, occupied & ~chess.BB_SQUARES[attacker]
+        ) is not None:
+            break
+
+        # the piece on the square, valued as a king is worth more than anything it could win
+        value = 100 if on_square == chess.KING else PIECE_VALUE_MAP[on_square]
+        gains.append(value - gains[-1])
+        on_square = board.piece_type_at(attacker)
+        occupied &= ~chess.BB_SQUARES[attacker]
+        color = not color
+
+    # either side can stop capturing when carrying on would lose material
+    for index in range(len(gains) - 1, 0, -1):
+        gains[index - 1] = -max(-gains[index - 1], gains[index])
+
+    return gains[0]
 
 
 def move_is_piece_sacrifice(board, move):
@@ -75,21 +147,11 @@ def move_is_piece_sacrifice(board, move):
     if not piece_is_moved(board, move):
         return False
 
-    # make sure it's not just a capture of another piece
-    if captures_greater_piece(board, move):
-        return False
-
-    # the square is underdefended
-    board.push(move)
-    if not piece_is_underdefended(board, move):
-        board.pop()
-        return False
-    board.pop()
-
-    return True
+    # the piece is given up: the best sequence of captures on its square loses material
+    return static_exchange_evaluation(board, move) < 0
 
 
-def best_move_is_played(board, san, engine_eval):
+def best_move_is_played(board, san, engine_eval, tolerance=50):
     max_eval = max(
         [
             record["score"].pov(board.turn).score(mate_score=100)
@@ -99,28 +161,52 @@ def best_move_is_played(board, san, engine_eval):
     return san in [
         board.san(record["pv"][0])
         for record in engine_eval
-        if abs(record["score"].pov(board.turn).score(mate_score=100) - max_eval) < 50
+        if abs(record["score"].pov(board.turn).score(mate_score=100) - max_eval) < tolerance
     ]
 
 
-def losing_if_played(board, engine_eval):
-    return engine_eval[0]["score"].pov(board.turn).score(mate_score=100) < 300
+def losing_if_played(board, engine_eval, threshold=300):
+    return engine_eval[0]["score"].pov(board.turn).score(mate_score=100) < threshold
 
 
-def is_completely_winning(board, engine_eval):
+def is_completely_winning(board, engine_eval, threshold=0):
     return (
         True
         if len(engine_eval) <= 1
-        else engine_eval[1]["score"].pov(board.turn).score(mate_score=100) > 0
+        else engine_eval[1]["score"].pov(board.turn).score(mate_score=100) > threshold
+    )
+
+
+def could_be_brilliant(board, san, engine_eval, margin=ESCALATION_MARGIN):
+    """The tests in move_is_brilliant with each threshold loosened by `margin`, to judge a shallow search."""
+    return (
+        best_move_is_played(board, san, engine_eval, 50 + margin)
+        and not losing_if_played(board, engine_eval, 300 - margin)
+        and not is_completely_winning(board, engine_eval, margin)
     )
 
 
-def move_is_brilliant(board, move, engine):
+async def move_is_brilliant(board, move, search: TwoPass, embedded: Optional[chess.engine.PovScore] = None):
+    """`embedded` is the annotated evaluation of the position after `move`, if there is one."""
     if not move_is_piece_sacrifice(board, move):
         return False
 
-    engine_eval = engine.analyse(board, chess.engine.Limit(depth=18), multipv=3)
+    # the annotation already says the mover is worse off than losing_if_played allows
+    if embedded is not None and embedded.pov(board.turn).score(mate_score=100) < 300 - ANNOTATION_MARGIN:
+        return False
+
+    # a book sacrifice is a known gambit
+    shortcuts = search.pool.shortcuts
+    if shortcuts is not None:
+        board.push(move)
+        in_book = shortcuts.in_book(board)
+        board.pop()
+        if in_book:
+            return False
+
     san = board.san(move)
+    # a shallow result is only returned when it fails the loosened tests, so it fails the real ones too
+    engine_eval = await search.analyse(board, lambda engine_eval: could_be_brilliant(board, san, engine_eval), multipv=3)
     if not best_move_is_played(board, san, engine_eval):
         return False
 
@@ -135,59 +221,310 @@ def move_is_brilliant(board, move, engine):
     return True
 
 
-def game_has_brilliant_move(game, player_color, engine):
+async def first_brilliant_move(game, player_color, search: TwoPass) -> Optional[str]:
+    """The first brilliant move `player_color` (either side when None) played, in SAN, or None."""
     board = game.board()
-    for move in game.mainline_moves():
-        if board.turn == player_color and move_is_brilliant(board, move, engine):
-            return True
+    for node in game.mainline():
+        if player_color in (None, board.turn) and await move_is_brilliant(board, node.move, search, node.eval()):
+            return board.san(node.move)
 
-        board.push(move)
+        board.push(node.move)
 
-    return False
+    return None
 
 
 def read_game(pgn: StringIO):
-    try:
-        game = chess.pgn.read_game(pgn)
-    except AssertionError:
-        return read_game()
+    """The next game in the stream, or None at the end; games python-chess can't parse are skipped."""
+    while True:
+        try:
+            return chess.pgn.read_game(pgn)
+        except AssertionError:
+            continue
+
+
+def parse_games(pgn_text: str) -> Iterator[chess.pgn.Game]:
+    """The games in a PGN text, parsed one at a time as they're asked for."""
+    pgn = StringIO(pgn_text)
+    while (game := read_game(pgn)) is not None:
+        yield game
+
+
+def game_link(game) -> str:
+    # chess.com has a Link header, Lichess puts the game's URL in Site
+    return game.headers.get("Link") or game.headers.get("Site", "?")
+
+
+def game_key(game) -> str:
+    """The game's URL, or for games without one, a digest of the game itself."""
+    link = game_link(game)
+    if link.startswith("http"):
+        return link
+
+    return "sha1:" + hashlib.sha1(str(game).encode()).hexdigest()
+
 
-    return game
+def analysis_settings(pool: EnginePool, adaptive: bool, username: Optional[str]) -> dict:
+    """Everything a game's verdict depends on; results found with other settings aren't reused."""
+    return {
+        # whose moves are looked at (both sides' without a username)
+        "player": username.lower() if username else None,
+        "engine": pool.engine_name,
+        "limit": encode_limit(SEARCH_LIMIT),
+        "adaptive": adaptive,
+        "escalation_margin": ESCALATION_MARGIN,
+        "annotation_margin": ANNOTATION_MARGIN,
+        "book": pool.shortcuts is not None and pool.shortcuts.book is not None,
+        "syzygy": pool.shortcuts is not None and pool.shortcuts.tablebase is not None,
+    }
 
 
-def main(username, engine_path):
-    brilliant_games = []
-    engine = chess.engine.SimpleEngine.popen_uci(engine_path)
+def is_json_progress(path: Path) -> bool:
+    """Whether the file is a progress file from before checkpoints; exits if it's neither that nor a checkpoint."""
+    if not path.exists() or path.stat().st_size == 0:
+        return False
 
-    archives = requests.get(
-        f"https://api.chess.com/pub/player/{username}/games/archives",
-        headers=HEADERS,
-    ).json()["archives"]
-    archives.sort(reverse=True)
+    with path.open("rb") as file:
+        if file.read(16) == b"SQLite format 3\0":
+            return False
 
-    for url in tqdm(archives):
-        pgn_response = requests.get(f"{url}/pgn", headers=HEADERS)
+    try:
+        progress = json.loads(path.read_text())
+    except ValueError:
+        progress = None
+    if not isinstance(progress, dict) or not {"months", "games"} <= progress.keys():
+        sys.exit(f"{path} is neither a checkpoint nor an older JSON progress file; pass another --progress")
 
-        pgn = StringIO(pgn_response.text)
+    return True
 
-        game = read_game(pgn)
 
-        while game is not None:
-            player_color = (
-                chess.WHITE if username == game.headers["White"] else chess.BLACK
+def import_json_progress(json_path: Path, checkpoint: Checkpoint) -> None:
+    """
+    Carries an older progress file ({"months": [...], "games": [...]}) over into the checkpoint: its finished
+    months are marked done and its brilliant games kept. It didn't record its settings, so they're taken to be
+    the current ones.
+    """
+    progress = json.loads(json_path.read_text())
+    for url in progress["months"]:
+        checkpoint.mark_done(url)
+    for link in progress["games"]:
+        if checkpoint.get(link) is None:
+            # the move itself wasn't recorded
+            checkpoint.put(link, {"link": link, "brilliant": "?"})
+
+    print(f"imported {len(progress['months'])} months from {json_path} into {checkpoint.path}", file=sys.stderr)
+
+
+def brilliant_links(checkpoint: Checkpoint) -> List[str]:
+    return [result["link"] for result in checkpoint.results().values() if result["brilliant"]]
+
+
+async def find_brilliant_games(
+    games: AsyncIterable[Tuple[Optional[chess.pgn.Game], Optional[str]]],
+    username: Optional[str],
+    search: TwoPass,
+    checkpoint: Optional[Checkpoint] = None,
+    window: int = GAMES_PER_ENGINE,
+    scope_done: Optional[Callable[[str], None]] = None,
+) -> List[str]:
+    """
+    The links of the games where the player (or either side, without a username) found a brilliant move.
+    Games already in the checkpoint are skipped, and each new verdict is saved there as soon as it's known.
+
+    `games` are (game, scope) pairs, the scope being the game's month (or None), and (None, scope) once all of a
+    scope's games have come. Up to `window` games are walked at once, and the next one starts as soon as one
+    finishes; `scope_done` is called with each scope once its last game is checked.
+    """
+    outstanding = collections.Counter()
+    complete = set()
+
+    def finished(scope):
+        if scope is not None and scope_done is not None:
+            scope_done(scope)
+
+    async def check(game, scope):
+        link = await check_game(game)
+        outstanding[scope] -= 1
+        if outstanding[scope] == 0 and scope in complete:
+            finished(scope)
+        return link
+
+    async def check_game(game):
+        key = game_key(game)
+        if checkpoint is not None and checkpoint.get(key) is not None:
+            return None
+
+        if username is None:
+            player_color = None
+        else:
+            player_color = chess.WHITE if username.lower() == game.headers["White"].lower() else chess.BLACK
+        brilliant = await first_brilliant_move(game, player_color, search)
+        if checkpoint is not None:
+            checkpoint.put(key, {"link": game_link(game), "brilliant": brilliant})
+        if brilliant is not None:
+            print(game_link(game))
+            return game_link(game)
+
+    links = []
+    pending = set()
+    async for game, scope in games:
+        if game is None:
+            complete.add(scope)
+            if outstanding[scope] == 0:
+                finished(scope)
+            continue
+
+        if len(pending) >= window:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            links += [task.result() for task in done]
+        outstanding[scope] += 1
+        pending.add(asyncio.ensure_future(check(game, scope)))
+
+    if pending:
+        done, _ = await asyncio.wait(pending)
+        links += [task.result() for task in done]
+
+    return [link for link in links if link is not None]
+
+
+def month_is_over(url: str) -> bool:
+    now = datetime.now(timezone.utc)
+    return month_key(url) < (now.year, now.month)
+
+
+async def month_games(
+    client: ChessComClient, urls: List[str], prefetch: int
+) -> AsyncIterator[Tuple[Optional[chess.pgn.Game], str]]:
+    """
+    (game, month) for the months' games, in order, then (None, month) after each month's last game. At most
+    `prefetch` months are downloading or being read at a time.
+    """
+    async for url, pgn_text in client.iter_months(urls, window=prefetch, ordered=True, fetch_month=client.month_pgn):
+        for game in parse_games(pgn_text):
+            yield game, url
+        yield None, url
+
+
+async def file_games(games: Iterable[chess.pgn.Game]) -> AsyncIterator[Tuple[chess.pgn.Game, None]]:
+    for game in games:
+        yield game, None
+
+
+async def analyse_months(
+    username: str,
+    pool: EnginePool,
+    progress_path: Path,
+    prefetch: int,
+    adaptive: bool = True,
+    json_progress_path: Optional[Path] = None,
+) -> List[str]:
+    """
+    The links of the player's brilliant games, from this run and every earlier one with the same settings
+    (and from the older progress file at `json_progress_path`, if there is one).
+    """
+    search = TwoPass(pool, SEARCH_LIMIT, enabled=adaptive)
+
+    async with ChessComClient() as client, pool:
+        checkpoint = Checkpoint(progress_path, analysis_settings(pool, adaptive, username))
+        try:
+            if json_progress_path is not None:
+                import_json_progress(json_progress_path, checkpoint)
+            archives = [url for url in reversed(await client.archives(username)) if not checkpoint.is_done(url)]
+
+            with tqdm(total=len(archives)) as bar:
+                def month_done(url):
+                    # the current month can still get new games, so it's looked at again next time
+                    if month_is_over(url):
+                        checkpoint.mark_done(url)
+                    bar.update()
+
+                await find_brilliant_games(
+                    month_games(client, archives, max(1, prefetch)),
+                    username,
+                    search,
+                    checkpoint,
+                    pool.size * GAMES_PER_ENGINE,
+                    month_done,
+                )
+
+            report(pool)
+            print(f"search: {search}", file=sys.stderr)
+            return brilliant_links(checkpoint)
+        finally:
+            checkpoint.close()
+
+
+def is_player_game(headers, username: Optional[str]) -> bool:
+    return username is None or username.lower() in {headers.get("White", "").lower(), headers.get("Black", "").lower()}
+
+
+async def analyse_file(
+    file_path: str, username: Optional[str], pool: EnginePool, progress_path: Path, adaptive: bool = True
+) -> List[str]:
+    search = TwoPass(pool, SEARCH_LIMIT, enabled=adaptive)
+
+    async with pool:
+        checkpoint = Checkpoint(progress_path, analysis_settings(pool, adaptive, username))
+        try:
+            # the other players' games are skipped on their headers, before their moves are parsed
+            games = iter_pgn_games(file_path, lambda headers: is_player_game(headers, username))
+            await find_brilliant_games(
+                file_games(tqdm(games, unit="game")), username, search, checkpoint, pool.size * GAMES_PER_ENGINE
             )
-            if game_has_brilliant_move(game, player_color, engine):
-                print(game.headers["Link"])
-                brilliant_games.append(game.headers["Link"])
 
-            game = read_game(pgn)
+            report(pool)
+            print(f"search: {search}", file=sys.stderr)
+            return brilliant_links(checkpoint)
+        finally:
+            checkpoint.close()
+
+
+def default_progress_path(username: Optional[str], file_path: Optional[str]) -> str:
+    if file_path is None:
+        return f"brilliancies_{username.lower()}.sqlite"
+
+    return f"brilliancies_{Path(file_path).name.split('.')[0]}" + (f"_{username.lower()}" if username else "") + ".sqlite"
+
+
+def main(
+    username,
+    pool: EnginePool,
+    progress_path: Optional[str] = None,
+    prefetch: int = DEFAULT_PREFETCH,
+    adaptive: bool = True,
+    file_path: Optional[str] = None,
+):
+    json_progress_path = None
+    if progress_path is not None:
+        progress_path = Path(progress_path)
+        if is_json_progress(progress_path):
+            if progress_path.suffix == ".sqlite":
+                sys.exit(f"{progress_path} is an older JSON progress file; rename it to .json to carry it over")
+            json_progress_path, progress_path = progress_path, progress_path.with_suffix(".sqlite")
+    else:
+        progress_path = Path(default_progress_path(username, file_path))
+        # progress files used to default to brilliancies_<username>.json
+        if file_path is None and not progress_path.exists() and is_json_progress(progress_path.with_suffix(".json")):
+            json_progress_path = progress_path.with_suffix(".json")
+
+    if json_progress_path is not None and file_path is not None:
+        sys.exit(f"{json_progress_path} is an older progress file for chess.com archives, not for --file_path")
 
-    print(brilliant_games)
+    try:
+        if file_path is not None:
+            brilliant_games = asyncio.run(analyse_file(file_path, username, pool, progress_path, adaptive))
+        else:
+            brilliant_games = asyncio.run(
+                analyse_months(username, pool, progress_path, prefetch, adaptive, json_progress_path)
+            )
+    except KeyboardInterrupt:
+        sys.exit(f"interrupted; the games analysed so far are saved in {progress_path}, rerun to carry on")
 
-    engine.close()
+    print(brilliant_games)
 
 
 if __name__ == "__main__":
+    maybe_profile()
+
     parser = argparse.ArgumentParser()
     parser.add_argument(
         "--chesscom_username", type=str, help="your chess.com username", default=None
@@ -195,18 +532,33 @@ if __name__ == "__main__":
     parser.add_argument(
         "--file_path",
         type=str,
-        help="path to source file to analyze moves",
+        help="PGN file (.pgn, .gz, .bz2 or .zst) to read games from instead of chess.com",
         default=None,
     )
+    add_engine_arguments(parser)
+    add_budget_arguments(parser)
     parser.add_argument(
-        "--engine",
+        "--progress",
         type=str,
-        default="/usr/local/bin/stockfish",
-        help="path to your stockfish uci engine",
+        default=None,
+        help="checkpoint of every game's result, reused by reruns (defaults to brilliancies_<username>.sqlite)",
+    )
+    parser.add_argument(
+        "--prefetch",
+        type=int,
+        default=DEFAULT_PREFETCH,
+        help="how many months to download ahead of the analysis",
     )
 
     args = parser.parse_args()
 
     assert args.chesscom_username is not None or args.file_path is not None
 
-    main(args.chesscom_username, args.engine)
+    main(
+        args.chesscom_username,
+        pool_from_args(args),
+        args.progress,
+        args.prefetch,
+        not args.fixed_budget,
+        args.file_path,
+    )
@@ -1,17 +1,15 @@
+from typing import AsyncIterator
+
 import argparse
+import asyncio
 from io import StringIO
+from pathlib import Path
+import sys
 
-import requests
-from tqdm import tqdm
 import chess.pgn
 
-
-def get_data(url):
-    headers = {'User-Agent': "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/117.0.0.0 Safari/537.36"}
-
-    response = requests.request("GET", url, headers=headers)
-
-    return response.json()
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from chesscom.client import iter_run  # noqa: E402
 
 
 def get_month_overlap(user_1_archives: list[str], user_2_archives: list[str]) -> list[str]:
@@ -36,6 +34,14 @@ def is_valid_month(month_overlaps: set[str], archive_url: str) -> bool:
     return False
 
 
+async def fetch_overlapping_months(client, user1: str, user2: str) -> AsyncIterator[dict]:
+    user_1_archives, user_2_archives = await asyncio.gather(client.archives(user1), client.archives(user2))
+    month_overlap = get_month_overlap(user_1_archives, user_2_archives)
+
+    async for _, month in client.iter_months(sorted(month_overlap)):
+        yield month
+
+
 def main(user1, user2):
     game_results = {
         "bullet": {
@@ -54,14 +60,9 @@ def main(user1, user2):
             "draws": 0
         }
     }
-    user_1_archives = get_data(f"https://api.chess.com/pub/player/{user1}/games/archives")["archives"]
-    user_2_archives = get_data(f"https://api.chess.com/pub/player/{user2}/games/archives")["archives"]
-    month_overlap = get_month_overlap(user_1_archives, user_2_archives)
-
     players = {user1, user2}
 
-    for url in tqdm(month_overlap):
-        archive_response = get_data(url)
+    for archive_response in iter_run(fetch_overlapping_months, user1, user2):
         for game_json in archive_response["games"]:
             # not a rated game
             if (
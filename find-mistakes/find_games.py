@@ -1,57 +1,104 @@
+"""
+Finds the opening positions a player keeps reaching after their own mistakes: positions from the first
+15 moves that came up at least five times, where the opponent is better by more than a pawn.
+
+Games come from the player's chess.com archives, or from a PGN file with --file_path (all the games in it,
+or only the player's when a username is given too). Positions already evaluated by an [%eval] annotation,
+as in analysed Lichess games, aren't sent to the engine.
+
+Positions are counted by Zobrist hash (analysis.positions), so transpositions and the same position at different
+move numbers are one position, and a FEN is only kept for the positions that come up --min_count times. For whole
+databases, --prefilter puts a count-min sketch in front of the counts so positions seen only once never take a slot.
+With an opening book (--book), positions in it were reached by book moves and aren't evaluated (analysis.shortcuts).
+"""
+from typing import Iterator, Optional, Tuple
+
 import argparse
-from collections import defaultdict
+import asyncio
+from itertools import islice
+from pathlib import Path
+import sys
 from io import StringIO
 
-import requests
 from tqdm import tqdm
 
 import chess
 import chess.pgn
 import chess.engine
 
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from analysis.pool import EnginePool, add_engine_arguments, pool_from_args, report  # noqa: E402
+from analysis.budget import TwoPass, add_budget_arguments  # noqa: E402
+from analysis.annotations import iter_pgn_games  # noqa: E402
+from analysis.positions import CountMinSketch, PositionCounter, position_key  # noqa: E402
+from pgn_parser.clocks import parse_time_control  # noqa: E402
+from chesscom.client import iter_run  # noqa: E402
+from script_utils.profiling import maybe_profile  # noqa: E402
+
 import warnings
 warnings.filterwarnings("ignore")
 
 
+SEARCH_LIMIT = chess.engine.Limit(depth=10)
+# positions where the player's opponent is better by more than this were reached by a mistake
+MISTAKE_THRESHOLD = 100
+# shallow evaluations this close to the threshold are searched again at full depth
+ESCALATION_MARGIN = 75
+# positions reached at least this many times are reported
+MIN_COUNT = 5
+# Lichess' definition of bullet: an estimated game length (base + 40 increments) under three minutes
+BULLET_SECONDS = 180
+
+
 def read_game(pgn: StringIO):
-    try:
-        game = chess.pgn.read_game(pgn)
-    except AssertionError:
-        return read_game()
+    """The next game in the stream, or None at the end; games python-chess can't parse are skipped."""
+    while True:
+        try:
+            return chess.pgn.read_game(pgn)
+        except AssertionError:
+            continue
+
+
+def get_game_positions(
+    game: chess.pgn.Game, remainder: Optional[int]
+) -> Iterator[Tuple[chess.Board, Optional[chess.engine.PovScore]]]:
+    """
+    (board, embedded evaluation or None) after each of the player's first 15 moves, or of both sides' when
+    `remainder` is None. The same board is yielded each time, moved on, so copy it to keep it.
+    """
+    board = game.board()
+    for i, node in enumerate(islice(game.mainline(), 30)):
+        board.push(node.move)
+        if remainder is None or i % 2 == remainder:
+            yield board, node.eval()
 
-    return game
 
+async def fetch_months(client, username):
+    async for _, month in client.iter_months(await client.archives(username)):
+        yield month
 
-def get_game_positions(game: chess.pgn.Game, remainder: int):
-    output = []
-    board = game.board()
-    for i, move in enumerate(list(game.mainline_moves())[:30]):
-        board.push(move)
-        if i % 2 == remainder:
-            output.append(board.fen())
 
-    return output
+def is_close_call(info) -> bool:
+    score = info["score"].relative.score()
+    # mates are clear-cut (and never reported)
+    return score is not None and abs(score - MISTAKE_THRESHOLD) < ESCALATION_MARGIN
 
 
-def main(username, engine_path):
-    position_counts = defaultdict(int)
-    engine = chess.engine.SimpleEngine.popen_uci(engine_path)
+async def evaluate_positions(pool: EnginePool, positions, adaptive: bool = True):
+    async with pool:
+        search = TwoPass(pool, SEARCH_LIMIT, enabled=adaptive)
+        tasks = [asyncio.ensure_future(search.analyse(chess.Board(position), is_close_call)) for position in positions]
+        infos = [await task for task in tqdm(tasks)]
+        report(pool)
+        print(f"search: {search}", file=sys.stderr)
 
-    url = f"https://api.chess.com/pub/player/{username}/games/archives"
-    archives = requests.get(
-        url,
-        headers={'User-Agent': "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/117.0.0.0 Safari/537.36"}
-    )
-    try:
-        archives = archives.json()["archives"]
-    except Exception:
-        print(archives.text)
-        print(archives.url)
-    archives.sort()
-
-    for url in tqdm(archives):
-        archive_response = requests.get(f"{url}")
-        for game_json in archive_response.json()["games"]:
+    return infos
+
+
+def chesscom_games(username):
+    """(game, remainder) for the player's rated non-bullet standard games, remainder being 0 when they're white."""
+    for archive_response in iter_run(fetch_months, username):
+        for game_json in archive_response["games"]:
             # not a rated game
             if not game_json["rated"]:
                 continue
@@ -67,40 +114,107 @@ def main(username, engine_path):
             if "pgn" not in game_json:
                 continue
 
-            remainder = 0 if username == game_json["white"]["username"] else 1
-
-            pgn = StringIO(game_json["pgn"])
-            game = read_game(pgn)
-
-            for position in get_game_positions(game, remainder):
-                position_counts[position] += 1
-
-            game = read_game(pgn)
-
-    position_counts = {key: value for key, value in position_counts.items() if value >= 5}
+            game = read_game(StringIO(game_json["pgn"]))
+            if game is None:
+                continue
 
-    for position in tqdm(position_counts.keys()):
-        board = chess.Board(position)
-        info = engine.analyse(board, chess.engine.Limit(depth=10))
+            remainder = 0 if username == game_json["white"]["username"] else 1
+            yield game, remainder
+
+
+def is_wanted_pgn_game(headers, username: Optional[str]) -> bool:
+    """The same filters for PGN headers: rated (not "Casual"), not bullet, the standard starting position."""
+    if "Casual" in headers.get("Event", "") or "FEN" in headers or headers.get("Variant", "Standard") != "Standard":
+        return False
+
+    time_control = parse_time_control(headers.get("TimeControl"))
+    if time_control and time_control[0] + 40 * time_control[1] < BULLET_SECONDS:
+        return False
+
+    return username is None or username.lower() in {headers.get("White", "").lower(), headers.get("Black", "").lower()}
+
+
+def pgn_file_games(file_path: str, username: Optional[str]):
+    """(game, remainder) for the wanted games in a PGN file; the remainder is None (both sides) without a username."""
+    # the headers are checked before the moves are parsed
+    for game in iter_pgn_games(file_path, lambda headers: is_wanted_pgn_game(headers, username)):
+        if username is None:
+            yield game, None
+        else:
+            yield game, 0 if game.headers.get("White", "").lower() == username.lower() else 1
+
+
+def main(
+    username,
+    pool: EnginePool,
+    adaptive: bool = True,
+    file_path: Optional[str] = None,
+    min_count: int = MIN_COUNT,
+    prefilter: bool = False,
+):
+    # positions only need a slot once the sketch has seen them twice
+    counter = PositionCounter(prefilter=CountMinSketch() if prefilter else None, admit=min(2, min_count))
+    # FENs and embedded evaluations are only kept for the positions frequent enough to report
+    fens = {}
+    embedded = {}
+
+    games = pgn_file_games(file_path, username) if file_path is not None else chesscom_games(username)
+    for game, remainder in games:
+        for board, score in get_game_positions(game, remainder):
+            key = position_key(board)
+            if counter.add(key) >= min_count and key not in fens:
+                fens[key] = board.fen()
+            if score is not None and key in fens:
+                embedded.setdefault(key, {"score": score})
+
+    position_counts = dict(counter.items(min_count))
+    print(counter, file=sys.stderr)
+
+    # book moves aren't mistakes
+    if pool.shortcuts is not None:
+        position_counts = {
+            key: count for key, count in position_counts.items() if not pool.shortcuts.in_book(chess.Board(fens[key]))
+        }
+
+    # all the positions without an embedded evaluation are queued at once and spread across the engines
+    missing = [key for key in position_counts if key not in embedded]
+    print(f"{len(position_counts) - len(missing)} of {len(position_counts)} positions already evaluated", file=sys.stderr)
+    infos = (
+        dict(zip(missing, asyncio.run(evaluate_positions(pool, [fens[key] for key in missing], adaptive)))) if missing else {}
+    )
 
+    for key in position_counts:
+        info = embedded.get(key) or infos[key]
         try:
-            if info["score"].relative.cp > 100:
-                print(position)
-                print(position_counts[position])
+            if info["score"].relative.cp > MISTAKE_THRESHOLD:
+                print(fens[key])
+                print(position_counts[key])
         except Exception:
             pass
 
-    engine.close()
-
 
 if __name__ == '__main__':
+    maybe_profile()
+
     parser = argparse.ArgumentParser()
     parser.add_argument("--chesscom_username", type=str, help="your chess.com username", default=None)
-    parser.add_argument("--file_path", type=str, help="path to source file to analyze moves", default=None)
-    parser.add_argument("--engine", type=str, default="/usr/local/bin/stockfish", help="path to your stockfish uci engine")
+    parser.add_argument("--file_path", type=str, help="PGN file (.pgn, .gz, .bz2 or .zst) to read games from instead of chess.com", default=None)
+    parser.add_argument("--min_count", type=int, default=MIN_COUNT, help="report positions reached at least this often")
+    parser.add_argument(
+        "--prefilter", action="store_true", help="count through a count-min sketch first, for whole databases"
+    )
+    add_engine_arguments(parser)
+    add_budget_arguments(parser)
 
     args = parser.parse_args()
 
     assert args.chesscom_username is not None or args.file_path is not None
 
-    main(args.chesscom_username, args.engine)
+    main(
+        args.chesscom_username,
+        pool_from_args(args),
+        not args.fixed_budget,
+        args.file_path,
+        args.min_count,
+        args.prefilter,
+    )
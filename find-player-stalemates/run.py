@@ -6,11 +6,14 @@ username = "caleb-courtney"
 import argparse
 
 from io import StringIO
+from pathlib import Path
+import sys
 
-import requests
 import chess
 import chess.pgn
-from tqdm import tqdm
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from chesscom.client import iter_run  # noqa: E402
 
 import warnings
 warnings.filterwarnings("ignore")
@@ -21,12 +24,6 @@ parser.add_argument("username", type=str)
 
 args = parser.parse_args()
 
-archives = requests.get(
-    f"https://api.chess.com/pub/player/{args.username}/games/archives",
-    verify=False
-).json()["archives"]
-archives.sort()
-
 
 def white_stalemated(game: chess.pgn.Game) -> bool:
     # returns true if white made the last move
@@ -34,8 +31,12 @@ def white_stalemated(game: chess.pgn.Game) -> bool:
     return len(list(game.mainline_moves())) % 2 == 1
 
 
-for url in tqdm(archives):
-    data = requests.get(url).json()
+async def fetch_months(client):
+    async for _, data in client.iter_months(await client.archives(args.username), ordered=True):
+        yield data
+
+
+for data in iter_run(fetch_months):
     for game_json in data["games"]:
         if "pgn" not in game_json:
             continue
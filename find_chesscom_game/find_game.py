@@ -7,16 +7,14 @@ fen = "B1b2rk1/p3ppbp/3p2p1/8/nP3BP1/2PnP2P/1PQ1N3/qNK2R2"
 import argparse
 import json
 from io import StringIO
+from pathlib import Path
+import sys
 
-import requests
 import chess
 import chess.pgn
-from tqdm import tqdm
 
-
-HEADERS = {
-    "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/117.0.0.0 Safari/537.36"
-}
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from chesscom.client import run  # noqa: E402
 
 
 parser = argparse.ArgumentParser()
@@ -25,12 +23,6 @@ parser.add_argument("fen", type=str)
 
 args = parser.parse_args()
 
-archives = requests.get(
-    f"https://api.chess.com/pub/player/{args.username}/games/archives",
-    headers=HEADERS,
-).json()["archives"]
-archives.sort(reverse=True)
-
 
 def game_is_match(game: chess.pgn.Game) -> bool:
     assert isinstance(game, chess.pgn.Game)
@@ -47,14 +39,19 @@ def game_is_match(game: chess.pgn.Game) -> bool:
     return False
 
 
-for url in tqdm(archives):
-    data = requests.get(f"{url}", headers=HEADERS).json()
-    for game_json in data["games"]:
-        if "pgn" not in game_json:
-            continue
+async def find_games(client):
+    # most recent months first, searched as they arrive
+    archives = await client.archives(args.username)
+    async for url, data in client.iter_months(archives[::-1]):
+        for game_json in data["games"]:
+            if "pgn" not in game_json:
+                continue
+
+            game = chess.pgn.read_game(StringIO(game_json["pgn"]))
+
+            if game_is_match(game):
+                print(json.dumps(game_json))
+                print(url)
 
-        game = chess.pgn.read_game(StringIO(game_json["pgn"]))
 
-        if game_is_match(game):
-            print(json.dumps(game_json))
-            print(url)
+run(find_games)
@@ -5,12 +5,16 @@ from typing import Tuple
 
 import argparse
 import json
+from pathlib import Path
 import re
 import sys
 
 import requests
 from tqdm import tqdm
 
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from chesscom.titled import get_titled_players  # noqa: E402
+
 parser = argparse.ArgumentParser()
 parser.add_argument("format", type=str, choices=["bullet", "blitz", "rapid"])
 args = parser.parse_args()
@@ -18,18 +22,6 @@ args = parser.parse_args()
 streak_find = re.compile(r'"winningStreak":(\d+)')
 
 
-def get_titled_players() -> list:
-    players = []
-    for title in ["GM", "WGM", "IM", "WIM", "FM", "WFM", "NM", "WNM", "CM", "WCM"]:
-        response = requests.get(f"https://api.chess.com/pub/titled/{title}", headers={'User-Agent': "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/117.0.0.0 Safari/537.36"})
-        response = response.json()
-        players.extend(response["players"])
-
-    players.sort()
-
-    return players
-
-
 def get_user_streak(fmt: str, username: str) -> Tuple[str, int]:
     response = requests.get(f"https://www.chess.com/stats/live/{fmt}/{username}/0")
     assert response.status_code == 200
@@ -57,7 +49,7 @@ def main() -> None:
     except FileNotFoundError:
         processed_data = []
 
-    processed_players = [player["username"] for player in processed_data]
+    processed_players = {player["username"] for player in processed_data}
 
     titled_players = [player for player in titled_players if player not in processed_players]
 
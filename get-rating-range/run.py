@@ -3,10 +3,12 @@ This script will read a PGN file passed in from the command line
 and gets the max, min, and average ELO of the players that played that month
 """
 
+from pathlib import Path
 import sys
 import re
 
-from tqdm import tqdm
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from script_utils.progress import progress_stdin  # noqa: E402
 
 
 elo_pattern = re.compile(r'\[(White|Black)Elo "(\d+)"\]')
@@ -16,7 +18,7 @@ max_elo = -1
 avg_elo = 0
 count = 0
 
-for line in tqdm(sys.stdin):
+for line in progress_stdin():
     if line.startswith('[WhiteElo "'):
         white_elo = int(elo_pattern.match(line).group(2))
         min_elo = min(min_elo, white_elo)
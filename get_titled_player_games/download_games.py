@@ -1,100 +1,78 @@
 """
-Get the games between all titled players. Note that this will take a *very* long time to download all the data.
+Get the games between all titled players. Note that the first run will take a *very* long time to download all the data;
+later runs only fetch the months added (or still in progress) since the last one.
 It would be nice if Chess.com made it simpler to generate downloadable archives, given certain queryies.
 
 This is essentially a
 SELECT pgn
 FROM database
 WHERE white IN titled_players AND black IN titled_players
-"""
-from typing import List
 
+The games are added to the local game store (chesscom/store.py); `python keep_games.py` exports them as PGN.
+Archives saved to raw_data/ by older versions of this script can be imported with
+`python -m chesscom.store ingest raw_data/*.json`, and the months listed in an old processed_archives.db
+are marked as synced on the first run.
+"""
+from typing import Any, Dict
 
-from urllib.parse import urlparse
-import os
-from datetime import datetime
-import time
-import json
+import argparse
+from pathlib import Path
 import sqlite3
+import sys
 
-import requests
-from tqdm import tqdm
-
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from chesscom.client import run  # noqa: E402
+from chesscom.store import GameStore  # noqa: E402
+from chesscom.sync import DEFAULT_PLAYER_CONCURRENCY, month_key, sync_players  # noqa: E402
+from chesscom.titled import TitledPlayers, fetch_titled_players  # noqa: E402
 
-cur_year = datetime.now().year
-cur_month = datetime.now().month
 
+LEGACY_DATABASE = Path("processed_archives.db")
 
-connection = sqlite3.connect("processed_archives.db")
-cursor = connection.cursor()
-sql = "CREATE TABLE IF NOT EXISTS archives (archive TEXT)"
-cursor.execute(sql)
 
+def import_processed_archives(store: GameStore, path: Path = LEGACY_DATABASE) -> None:
+    """Marks the archives an older version of this script already processed as synced."""
+    connection = sqlite3.connect(path)
+    months = []
+    for (url,) in connection.execute("SELECT archive FROM archives"):
+        key = month_key(url)
+        if key is not None:
+            months.append((url.split("/")[-4], *key, [], True))
+    connection.close()
 
-def get_processed_archives(username) -> List[str]:
-    sql = """
-        SELECT archive
-        FROM archives
-        WHERE archive LIKE '%_{}_%'
-    """.format(username)
+    store.add_months(months)
+    path.rename(path.with_suffix(".db.imported"))
 
-    cursor.execute(sql)
-    return [row[0] for row in cursor.fetchall()]
 
+def between_titled(titled_players: TitledPlayers):
+    def keep(game: Dict[str, Any]) -> bool:
+        return (
+            game["rules"] == "chess"
+            and game["white"]["username"] in titled_players
+            and game["black"]["username"] in titled_players
+        )
 
-def add_processed_archives(url_name: str) -> None:
-    sql = """
-        INSERT INTO archives (archive)
-        VALUES ('{}')
-    """.format(url_name)
+    return keep
 
-    cursor.execute(sql)
-    connection.commit()
 
+async def download(client, store: GameStore, concurrency: int):
+    players = await fetch_titled_players(client)
+    stats = await sync_players(client, store, players, keep=between_titled(players), concurrency=concurrency)
+    print(f"{stats.players} players, {stats.months} months fetched, {stats.games} new games", file=sys.stderr)
+    if stats.failed:
+        print(f"failed: {stats.failed}", file=sys.stderr)
 
-def get_titled_players() -> List[str]:
-    players = []
-    for title in ["GM", "WGM", "IM", "WIM", "FM", "WFM", "NM", "WNM", "CM", "WCM"]:
-        response = requests.get(f"https://api.chess.com/pub/titled/{title}").json()
-        players.extend(response["players"])
 
-    return players
+def main():
+    parser = argparse.ArgumentParser(description="Sync the games between titled players into the local game store")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_PLAYER_CONCURRENCY, help="players synced at once")
+    args = parser.parse_args()
 
+    with GameStore() as store:
+        if LEGACY_DATABASE.exists():
+            import_processed_archives(store)
 
-def main():
-    processed_archives = os.listdir("raw_data")
-    players = get_titled_players()
-    for player in tqdm(players):
-        player_processed_archives = get_processed_archives(player)
-        archives_response = requests.get(f"https://api.chess.com/pub/player/{player}/games/archives").json()
-        archive_urls = [
-            url for url in archives_response["archives"]
-            if f"{cur_year}/{cur_month}" not in url
-            and url not in player_processed_archives
-        ]
-        for archive_url in archive_urls:
-            info = urlparse(archive_url)
-
-            if f"{info.path.replace('/', '_')}.json" in processed_archives:
-                continue
-
-            data = requests.get(archive_url, headers={"Accept-Encoding": "gzip"}).json()
-            data = [
-                record
-                for record in data["games"]
-                if record["rules"] == "chess"
-                and record["white"]["username"] in players
-                and record["black"]["username"] in players
-            ]
-            if data:
-                with open(f"raw_data/{info.path.replace('/', '_')}.json", "w+") as out_file:
-                    json.dump(data, out_file)
-
-                time.sleep(0.1)
-
-            add_processed_archives(archive_url)
-
-        time.sleep(0.1)
+        run(download, store, args.concurrency, concurrency=args.concurrency)
 
 
 if __name__ == '__main__':
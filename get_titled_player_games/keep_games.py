@@ -1,40 +1,24 @@
-import os
-import json
+"""
+Export the games between titled players from the local game store (filled by download_games.py) as one PGN file.
+"""
+from pathlib import Path
+import sys
 
 from tqdm import tqdm
-import requests
 
-
-def get_titled_players() -> set:
-    players = []
-    for title in ["GM", "WGM", "IM", "WIM", "FM", "WFM", "NM", "WNM", "CM", "WCM"]:
-        response = requests.get(f"https://api.chess.com/pub/titled/{title}").json()
-        players.extend(response["players"])
-
-    return set(players)
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from chesscom.store import GameStore  # noqa: E402
+from chesscom.titled import get_titled_players  # noqa: E402
 
 
 titled_players = get_titled_players()
 
-processed_games = set()
-
 out_file = open(f"titled_games/titled_games.pgn", "w+")
 
 game_count = 0
 
-for file_name in tqdm(os.listdir("raw_data")):
-    if not file_name.endswith(".json"):
-        continue
-
-    data = json.load(open(f"raw_data/{file_name}", "r"))
-    for game in data:
-        if (
-            game["rules"] != "chess"
-            or game["white"]["username"] not in titled_players
-            or game["black"]["username"] not in titled_players
-        ):
-            continue
-
+with GameStore() as store:
+    for game in tqdm(store.query(rules="chess", between=titled_players.usernames, columns=["pgn"])):
         pgn = game["pgn"]
         out_file.write(pgn)
         out_file.write("\n")
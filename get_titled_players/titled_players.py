@@ -3,18 +3,12 @@ Get the top players (by username) for a given game format.
 """
 
 import json
+from pathlib import Path
+import sys
 
-import requests
-
-
-def get_titled_players() -> list:
-    players = []
-    for title in ["GM", "WGM", "IM", "WIM", "FM", "WFM", "NM", "WNM", "CM", "WCM"]:
-        response = requests.get(f"https://api.chess.com/pub/titled/{title}").json()
-        players.extend(response["players"])
-
-    return players
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from chesscom.titled import get_titled_players  # noqa: E402
 
 
 if __name__ == '__main__':
-    print(json.dumps(get_titled_players()))
+    print(json.dumps(get_titled_players().names))
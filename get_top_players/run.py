@@ -4,12 +4,19 @@ Get the top players (by username) for a given game format.
 
 import argparse
 import json
+from pathlib import Path
+import sys
 
-import requests
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from chesscom.client import run  # noqa: E402
+
+
+async def fetch_leaderboards(client) -> dict:
+    return await client.leaderboards()
 
 
 def get_top_players(game_format) -> list:
-    response = requests.get("https://api.chess.com/pub/leaderboards").json()
+    response = run(fetch_leaderboards)
     if game_format not in response:
         raise ValueError(f"Invalid game format: must be one of {', '.join(response.keys())}")
 
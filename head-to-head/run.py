@@ -1,28 +1,27 @@
+from typing import AsyncIterator
+
 import argparse
+from pathlib import Path
+import sys
 
-import requests
-from tqdm import tqdm
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from chesscom.client import iter_run  # noqa: E402
 
 
-HEADERS = {
-    "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/117.0.0.0 Safari/537.36"
-}
+async def fetch_months(client, username: str) -> AsyncIterator[dict]:
+    async for _, month in client.iter_months(await client.archives(username)):
+        yield month
 
 
 def main(user_1: str, user_2: str):
-    url = f"https://api.chess.com/pub/player/{user_1}/games/archives"
-    archives = requests.get(url, headers=HEADERS).json()["archives"]
-
     output = {
         "win": 0,
         "loss": 0,
         "draw": 0,
     }
 
-    for url in tqdm(archives):
-        games = requests.get(url, headers=HEADERS).json()["games"]
-
-        for game in games:
+    for month in iter_run(fetch_months, user_1):
+        for game in month["games"]:
             if {
                 game["white"]["username"].lower(),
                 game["black"]["username"].lower(),
@@ -3,24 +3,20 @@ Get the top players (by username) for a given game format.
 """
 
 import json
+from pathlib import Path
+import sys
 
 import requests
 from tqdm import tqdm
 
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from chesscom.titled import get_titled_players  # noqa: E402
+
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/117.0.0.0 Safari/537.36"
 }
 
 
-def get_titled_players() -> list:
-    players = []
-    for title in ["GM", "WGM", "IM", "WIM", "FM", "WFM", "NM", "WNM", "CM", "WCM"]:
-        response = requests.get(f"https://api.chess.com/pub/titled/{title}", headers=HEADERS).json()
-        players.extend(response["players"])
-
-    return players
-
-
 def main():
     titled_players = get_titled_players()
     output = json.loads(open("titled_players.json", "r").read())
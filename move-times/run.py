@@ -1,18 +1,13 @@
-import requests
-from io import StringIO
-import re
+from pathlib import Path
+import sys
+
 import matplotlib.pyplot as plt
+import numpy as np
 import statistics
 
-import chess.pgn as pgn
-
-CLOCK_PATTERN = re.compile(
-    r"(?P<hours>\d+):(?P<minutes>\d+):(?P<seconds>\d+(?:\.\d+)?)"
-)
-
-HEADERS = {
-    "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/117.0.0.0 Safari/537.36"
-}
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from chesscom.client import iter_run  # noqa: E402
+from pgn_parser.clocks import decode_clocks, parse_time_control, time_spent  # noqa: E402
 
 
 PLAYERS_TO_COMPARE = [
@@ -56,15 +51,16 @@ JUNIORS = [
 ]
 
 
+async def fetch_months(client, username, year="2024"):
+    archives = await client.archives(username)
+    async for _, month in client.iter_months([url for url in archives if year in url]):
+        yield month
+
+
 def get_move_stats(username):
-    url = f"https://api.chess.com/pub/player/{username}/games/archives"
-    archives = requests.get(url, headers=HEADERS)
-    archives = [x for x in archives.json()["archives"] if "2024" in x]
     player_move_times = []
 
-    for game_url in archives:
-        print(game_url)
-        month_data = requests.get(game_url, headers=HEADERS).json()
+    for month_data in iter_run(fetch_months, username):
         for game in month_data["games"]:
             if "tournament" not in game or "titled-tuesday" not in game["tournament"]:
                 continue
@@ -73,36 +69,12 @@ def get_move_stats(username):
                 continue
 
             side = 0 if game["white"]["username"].lower() == username.lower() else 1
-            if "+" not in game["time_control"]:
-                increment = 0
-                time_control = int(game["time_control"])
-            else:
-                time_control, increment = map(int, game["time_control"].split("+"))
-
-            # discount white's first move of the game, since it's a paired tournament and white (nearly) always pre-moves
-            current_clock = time_control * 2
-            first_move = True
-
-            pgn_game = pgn.read_game(StringIO(game["pgn"]))
-
-            for index, node in enumerate(pgn_game.mainline()):
-                clock_time = str(node.comment)
-                hours, minutes, seconds = CLOCK_PATTERN.search(clock_time).groups()
-
-                seconds_left = float(seconds) + 60 * int(minutes) + 3600 * int(hours)
-                if index % 2 == side:
-                    if (
-                        not first_move
-                        and round(current_clock - (seconds_left - increment), 1)
-                        < time_control
-                    ):
-                        # calculate the time spent by the player – make sure to add second for increment
-                        player_move_times.append(
-                            round(current_clock - (seconds_left - increment), 1)
-                        )
-
-                    current_clock = seconds_left
-                    first_move = False
+            time_control, increment = parse_time_control(game["time_control"])
+
+            # discount the player's first move of the game, since it's a paired tournament and white (nearly) always pre-moves
+            move_times = time_spent(decode_clocks(game["pgn"]), increment)[side + 2::2]
+            move_times = np.round(move_times / 100, 1)
+            player_move_times.extend(move_times[move_times < time_control / 100].tolist())
 
     return player_move_times
 
@@ -1,11 +1,11 @@
-import requests
-from tqdm import tqdm
-import time
+import sys
+from pathlib import Path
 
+from tqdm import tqdm
 
-HEADERS = {
-    "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/117.0.0.0 Safari/537.36"
-}
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from chesscom.client import ChessComError, run  # noqa: E402
+from chesscom.titled import fetch_titled_players  # noqa: E402
 
 
 PLAYERS = [
@@ -16,47 +16,20 @@ PLAYERS = [
 ]
 
 
-def get_titled_players() -> list:
-    players = []
-    for title in ["GM", "WGM", "IM", "WIM", "FM", "WFM", "NM", "WNM", "CM", "WCM"]:
-        response = requests.get(
-            f"https://api.chess.com/pub/titled/{title}", headers=HEADERS
-        ).json()
-        players.extend(response["players"])
-
-    return {p.lower() for p in players}
-
-
-TITLED_PLAYERS = get_titled_players()
-
-
-def get_opponents(player, time_control="180") -> set[str]:
+async def get_opponents(client, player, titled_players, time_control="180") -> set[str]:
     output = set()
-    archives_url = f"https://api.chess.com/pub/player/{player}/games/archives"
-    archives_response = requests.get(archives_url, headers=HEADERS)
-    urls = archives_response.json()["archives"]
-    urls.sort(reverse=True)
+    # newest first; the client's rate limiter paces the requests and retries throttled ones
+    urls = list(reversed(await client.archives(player)))
     num_games = 0
     for url in tqdm(urls):
         if num_games > 3000:
             continue
 
-        time.sleep(1.5)
-
-        response = requests.get(url, headers=HEADERS)
-        if response.json() == {
-            "code": 0,
-            "message": "An internal error has occurred. Please contact Chess.com Developer's Forum for further help https://www.chess.com/club/chess-com-developer-community .",
-        }:
-            continue
-
         try:
-            games = response.json()["games"]
-        except KeyError:
-            print(response.text)
-            time.sleep(10)
-            response = requests.get(url, headers=HEADERS)
-            games = response.json()["games"]
+            games = await client.month_games(url)
+        except ChessComError as e:
+            print(e)
+            continue
 
         for game in games:
             if game["time_control"] != time_control:
@@ -64,13 +37,13 @@ def get_opponents(player, time_control="180") -> set[str]:
 
             if (
                 game["white"]["rating"] > 2500
-                and game["white"]["username"].lower() not in TITLED_PLAYERS
+                and game["white"]["username"] not in titled_players
             ):
                 num_games += 1
                 output.add(game["white"]["username"])
             if (
                 game["black"]["rating"] > 2500
-                and game["black"]["username"].lower() not in TITLED_PLAYERS
+                and game["black"]["username"] not in titled_players
             ):
                 num_games += 1
                 output.add(game["black"]["username"])
@@ -81,23 +54,30 @@ def get_opponents(player, time_control="180") -> set[str]:
     return output
 
 
-def main():
+async def find_cheaters(client) -> list[str]:
+    titled_players = await fetch_titled_players(client)
     opponents = set()
     for player in PLAYERS:
         print(player)
-        opponents |= get_opponents(player)
+        opponents |= await get_opponents(client, player, titled_players)
 
     cheaters = []
 
     print("trying to get cheaters")
     for opp in tqdm(opponents):
-        url = f"https://api.chess.com/pub/player/{opp}"
-        profile = requests.get(url, headers=HEADERS)
-        print(profile.text)
-        if profile.status_code != 200:
+        try:
+            print(await client.profile(opp))
+        except ChessComError as e:
+            print(e)
             cheaters.append(opp)
             print(cheaters)
 
+    return cheaters
+
+
+def main():
+    cheaters = run(find_cheaters)
+
     print(cheaters)
     print(len(cheaters))
 
@@ -1,16 +1,18 @@
-import requests
+from pathlib import Path
+import sys
 
-# links to all the archives of games Hikaru has played
-url = f"https://api.chess.com/pub/player/hikaru/games/archives"
-archives = requests.get(url)
-archives = archives.json()["archives"]
-archives.sort()
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from chesscom.client import iter_run  # noqa: E402
 
-games_played = 0
-for url in archives:
-    # get the games played that month
-    archive_response = requests.get(url).json()
 
+async def fetch_months(client, username):
+    # links to all the archives of games the player has played, downloaded concurrently
+    async for _, month in client.iter_months(await client.archives(username)):
+        yield month
+
+
+games_played = 0
+for archive_response in iter_run(fetch_months, "hikaru"):
     # iterate through each game
     for game_json in archive_response["games"]:
         # must be a game of chess, not a variant
@@ -1,12 +1,14 @@
-from typing import NamedTuple
+from typing import AsyncIterator, NamedTuple
 from datetime import datetime
 from pathlib import Path
-import json
+import sys
 
-import requests
 import pandas as pd
 import matplotlib.pyplot as plt
 
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from chesscom.client import iter_run, run  # noqa: E402
+
 
 mapping = {
     "win": 1,
@@ -23,10 +25,6 @@ mapping = {
     "timevsinsufficient": 0.5,
 }
 
-HEADERS = {
-    "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/117.0.0.0 Safari/537.36"
-}
-
 
 def expected_score(opponent_ratings: list[float], own_rating: float) -> float:
     """How many points we expect to score in games with these opponents"""
@@ -51,12 +49,22 @@ def performance_rating(opponent_ratings: list[float], score: float) -> int:
     return round(mid)
 
 
-def get_top_players():
-    response = requests.get("https://api.chess.com/pub/leaderboards", headers=HEADERS)
-    blitz_players = response.json()["live_blitz"]
+async def fetch_top_players(client):
+    blitz_players = (await client.leaderboards())["live_blitz"]
     return [player["username"] for player in blitz_players]
 
 
+def get_top_players():
+    return run(fetch_top_players)
+
+
+async def fetch_archives(client, username) -> AsyncIterator[dict]:
+    # the current month is still changing, so it's left out; finished months come from the on-disk cache
+    # the performance is over consecutive games, so the months are taken in order
+    async for _, month in client.iter_months((await client.archives(username))[:-1], ordered=True):
+        yield month
+
+
 class Result(NamedTuple):
     rating: int
     result: float
@@ -66,31 +74,9 @@ class Result(NamedTuple):
 
 
 def main(username, time_control="blitz"):
-    url = f"https://api.chess.com/pub/player/{username}/games/archives"
-    archives = requests.get(url, headers=HEADERS)
-    try:
-        archives = archives.json()["archives"]
-    except Exception:
-        print(archives.text)
-        print(archives.url)
-    archives.sort()
-
     rating_results: list[Result] = []
 
-    for url in archives[:-1]:
-        save_path = Path("data") / username
-        if not save_path.exists():
-            save_path.mkdir(parents=True)
-
-        save_name = f'{"_".join(url.split("/")[-2:])}.json'
-
-        if (save_path / save_name).exists():
-            archive_response = json.load(open(save_path / save_name))
-        else:
-            archive_response = requests.get(url, headers=HEADERS).json()
-            with open(save_path / save_name, "w+") as out:
-                json.dump(archive_response, out)
-
+    for archive_response in iter_run(fetch_archives, username):
         if "games" not in archive_response:
             continue
 
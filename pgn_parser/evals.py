@@ -0,0 +1,100 @@
+"""
+Vectorized decoding of `[%eval ...]` annotations, including mate scores.
+
+Every move comment in the movetext is matched in a single regex pass and converted to an int16
+array of centipawns from white's point of view, one entry per comment (so per ply for Lichess and
+chess.com movetext, where every move carries a comment). Plies without an evaluation get `missing`,
+which keeps the array aligned with the moves and with `pgn_parser.clocks.decode_clocks`.
+
+Mates are encoded the same way as python-chess's `score(mate_score=...)`: mate in N for white is
+`mate_score - N`, and mate in N for black is `-(mate_score - N)`. Centipawn evaluations are clipped
+to MATE_MARGIN below the mate score, so a huge evaluation never reads as a mate. Passing `mate_score=None`
+treats mate annotations as missing, for analyses that only want centipawn evaluations.
+
+Example:
+evals = decode_evals(movetext)
+losses = cp_loss(evals)
+white_losses = losses[0::2][losses[0::2] != MISSING]
+"""
+from typing import Optional, Union
+
+import re
+
+import numpy as np
+
+
+MISSING = np.iinfo(np.int16).min
+MATE_SCORE = 10000
+# centipawns stay this far below the mate score, well under any mate's encoding (mate in N is mate_score - N)
+MATE_MARGIN = 1000
+
+# one match per comment, with the eval's mate or centipawn value captured when it has one
+COMMENT_EVAL_PATTERN = re.compile(
+    r"\{[^}]*?(?:\[%eval\s(?:#([+-]?\d+)|([+-]?(?:\d+(?:\.\d*)?|\.\d+)))(?:,\d+)?\][^}]*)?\}"
+)
+COMMENT_EVAL_PATTERN_BYTES = re.compile(COMMENT_EVAL_PATTERN.pattern.encode())
+
+
+def decode_evals(
+    movetext: Union[str, bytes],
+    mate_score: Optional[int] = MATE_SCORE,
+    missing: int = MISSING,
+) -> np.ndarray:
+    """
+    Extracts the evaluation from every move comment in the movetext.
+
+    Centipawn values are clipped to stay MATE_MARGIN below the mate scores (and within int16).
+
+    Returns:
+        np.ndarray: int16 centipawns from white's point of view, `missing` where a comment has no usable eval
+    """
+    pattern = COMMENT_EVAL_PATTERN_BYTES if isinstance(movetext, (bytes, bytearray, memoryview)) else COMMENT_EVAL_PATTERN
+    matches = pattern.findall(movetext)
+    if not matches:
+        return np.empty(0, dtype=np.int16)
+
+    # (mate, pawns) columns, with blanks parsed as nan so the whole thing converts in one go; an object
+    # array, as a fixed-width string array is only as wide as its longest value and would truncate "nan"
+    parts = np.array(matches, dtype=object)
+    parts[parts == matches[0][0][:0]] = np.nan
+    parts = parts.astype(np.float64)
+    mates = parts[:, 0]
+    pawns = parts[:, 1]
+
+    limit = np.iinfo(np.int16).max if mate_score is None else mate_score - MATE_MARGIN
+    evals = np.full(len(parts), missing, dtype=np.int16)
+
+    has_cp = ~np.isnan(pawns)
+    evals[has_cp] = np.clip(np.rint(pawns[has_cp] * 100), -limit, limit)
+
+    if mate_score is not None:
+        has_mate = ~np.isnan(mates)
+        # "#0" never appears in practice, but a bare mate counts as white's since the sign is lost
+        signs = np.where(mates[has_mate] < 0, -1, 1)
+        evals[has_mate] = signs * (mate_score - np.abs(mates[has_mate]))
+
+    return evals
+
+
+def cp_loss(evals: np.ndarray, missing: int = MISSING, initial: Optional[int] = None) -> np.ndarray:
+    """
+    The centipawns each ply gave up from the mover's point of view: the eval before the move
+    minus the eval after it, flipped for black and floored at 0.
+
+    The first ply is measured against `initial` (e.g. the engine's opening eval) when it's given.
+    Plies where either eval is missing are `missing`.
+
+    Returns:
+        np.ndarray: int32 centipawn loss per ply
+    """
+    evals = np.asarray(evals).astype(np.int32)
+    before = np.empty_like(evals)
+    before[1:] = evals[:-1]
+    if len(evals):
+        before[0] = missing if initial is None else initial
+
+    movers = np.where(np.arange(len(evals)) % 2 == 0, 1, -1)
+    losses = np.maximum((before - evals) * movers, 0)
+    losses[(before == missing) | (evals == missing)] = missing
+
+    return losses
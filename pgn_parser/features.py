@@ -0,0 +1,246 @@
+"""
+Streams a PGN database into per-move feature rows, written as batched Parquet (or Arrow IPC) files.
+
+Every move becomes one row with a fixed schema, so analyses like time-advantage or rating-cp-loss
+become column queries (pandas, DuckDB, polars, ...) instead of another pass over the PGN:
+
+    game         Link/Site header identifying the game
+    ply          0-based half-move number (even plies are white's)
+    san          the move in SAN
+    clock        centiseconds on the mover's clock after the move
+    time_spent   centiseconds the move took (the clock change plus the increment, none on each side's first move)
+    eval_before  white-relative centipawns before the move (mate = +/-(10000 - N))
+    eval_after   white-relative centipawns after the move
+    cp_loss      centipawns the mover gave up, floored at 0
+    elo          the mover's rating
+    result       the mover's score from the game: 1, 0.5 or 0
+
+Clock and eval columns are null for games (or plies) without the annotations.
+The moves aren't validated, so this runs at regex speed rather than python-chess speed.
+
+Usage (from the repo root):
+cat lichess_db.pgn | python -m pgn_parser.features --output moves.parquet
+python -m pgn_parser.features --output features/ --workers 8 shard_*.pgn
+"""
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import argparse
+from multiprocessing import Pool
+from pathlib import Path
+import re
+import sys
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.ipc
+import pyarrow.parquet as pq
+
+from pgn_parser.clocks import decode_clocks, parse_time_control, time_spent
+from pgn_parser.evals import MISSING, cp_loss, decode_evals
+from pgn_parser.parse import MOVETEXT_REGEX, iter_games, open_pgn
+
+
+SCHEMA = pa.schema([
+    ("game", pa.string()),
+    ("ply", pa.int16()),
+    ("san", pa.string()),
+    ("clock", pa.int32()),
+    ("time_spent", pa.int32()),
+    ("eval_before", pa.int16()),
+    ("eval_after", pa.int16()),
+    ("cp_loss", pa.int16()),
+    ("elo", pa.int16()),
+    ("result", pa.float32()),
+])
+
+# sentinels for values that become nulls once the batch is converted to arrow
+MISSING_CLOCK = np.iinfo(np.int32).min
+
+BATCH_ROWS = 1_000_000
+
+COMMENT_PATTERN = re.compile(r"\{[^}]*\}")
+RESULT_SCORES = {"1-0": 1.0, "0-1": 0.0, "1/2-1/2": 0.5}
+
+
+def header_elo(headers: Dict[str, str], key: str) -> int:
+    value = headers.get(key, "")
+    return int(value) if value.isdigit() else MISSING
+
+
+def game_features(headers: Dict[str, str], movetext: str) -> Optional[Dict[str, np.ndarray]]:
+    """
+    Builds the feature columns for one game.
+
+    Returns:
+        Optional[Dict[str, np.ndarray]]: one array (or list, for strings) per schema column, or None if the game has no moves
+    """
+    sans = [match.group(0) for match in MOVETEXT_REGEX.finditer(COMMENT_PATTERN.sub(" ", movetext))]
+    plies = len(sans)
+    if not plies:
+        return None
+
+    movers = np.arange(plies) % 2
+
+    clocks = decode_clocks(movetext)
+    if len(clocks) == plies:
+        time_control = parse_time_control(headers.get("TimeControl"))
+        increment, initial = (time_control[1], time_control[0]) if time_control else (0, None)
+        spent = time_spent(clocks, increment, initial)
+    else:
+        clocks = np.full(plies, MISSING_CLOCK, dtype=np.int32)
+        spent = clocks
+
+    evals = decode_evals(movetext)
+    if len(evals) != plies:
+        evals = np.full(plies, MISSING, dtype=np.int16)
+
+    before = np.empty_like(evals)
+    before[0] = MISSING
+    before[1:] = evals[:-1]
+
+    elos = np.array([header_elo(headers, "WhiteElo"), header_elo(headers, "BlackElo")], dtype=np.int16)
+
+    score = RESULT_SCORES.get(headers.get("Result"), np.nan)
+    results = np.array([score, 1 - score], dtype=np.float32)
+
+    return {
+        "game": [headers.get("Link") or headers.get("Site")] * plies,
+        "ply": np.arange(plies, dtype=np.int16),
+        "san": sans,
+        "clock": clocks,
+        "time_spent": spent,
+        "eval_before": before,
+        "eval_after": evals,
+        "cp_loss": cp_loss(evals).astype(np.int16),
+        "elo": elos[movers],
+        "result": results[movers],
+    }
+
+
+def column_to_arrow(name: str, parts: List) -> pa.Array:
+    field = SCHEMA.field(name)
+    if pa.types.is_string(field.type):
+        return pa.array([value for part in parts for value in part], type=field.type)
+
+    values = np.concatenate(parts)
+    if pa.types.is_floating(field.type):
+        mask = np.isnan(values)
+    elif field.type == pa.int32():
+        mask = values == MISSING_CLOCK
+    else:
+        mask = values == MISSING
+
+    return pa.array(values, type=field.type, mask=mask if mask.any() else None)
+
+
+class FeatureWriter:
+    """Accumulates game features and writes them out a batch of rows at a time."""
+
+    def __init__(self, path: str, batch_rows: int = BATCH_ROWS):
+        self.path = Path(path)
+        self.batch_rows = batch_rows
+        self.rows = 0
+        self.games = 0
+        self._columns = {name: [] for name in SCHEMA.names}
+        self._pending = 0
+        self._writer = None
+
+    def add_game(self, headers: Dict[str, str], movetext: str) -> int:
+        features = game_features(headers, movetext)
+        if features is None:
+            return 0
+
+        for name, values in features.items():
+            self._columns[name].append(values)
+
+        plies = len(features["ply"])
+        self._pending += plies
+        self.rows += plies
+        self.games += 1
+        if self._pending >= self.batch_rows:
+            self.flush()
+
+        return plies
+
+    def _open(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if self.path.suffix in {".arrow", ".feather", ".ipc"}:
+            return pa.ipc.new_file(str(self.path), SCHEMA)
+
+        return pq.ParquetWriter(str(self.path), SCHEMA, compression="zstd")
+
+    def flush(self) -> None:
+        if self._writer is None:
+            self._writer = self._open()
+
+        if not self._pending:
+            return
+
+        batch = pa.RecordBatch.from_arrays(
+            [column_to_arrow(name, self._columns[name]) for name in SCHEMA.names],
+            schema=SCHEMA,
+        )
+        self._writer.write_batch(batch)
+        self._columns = {name: [] for name in SCHEMA.names}
+        self._pending = 0
+
+    def close(self) -> None:
+        self.flush()
+        self._writer.close()
+
+    def __enter__(self) -> "FeatureWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def extract(games: Iterator[Tuple[Dict[str, str], str]], output: str, batch_rows: int = BATCH_ROWS) -> Tuple[int, int]:
+    with FeatureWriter(output, batch_rows) as writer:
+        for headers, movetext in games:
+            writer.add_game(headers, movetext)
+
+    return writer.games, writer.rows
+
+
+def extract_shard(args: Tuple[str, str, int]) -> Tuple[str, int, int]:
+    path, output, batch_rows = args
+    with open_pgn(path) as in_file:
+        games, rows = extract(iter_games(in_file), output, batch_rows)
+
+    return path, games, rows
+
+
+def shard_output(path: str, output_dir: Path, suffix: str) -> str:
+    name = Path(path).name
+    for extension in [".zst", ".bz2", ".gz", ".pgn"]:
+        name = name.removesuffix(extension)
+
+    return str(output_dir / f"{name}{suffix}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Extract per-move features from PGN files")
+    parser.add_argument("shards", nargs="*", help="PGN files to process in parallel (stdin if none are given)")
+    parser.add_argument("--output", type=str, required=True, help="output file for stdin, or output directory for shards")
+    parser.add_argument("--workers", type=int, default=None, help="number of shards to process at once")
+    parser.add_argument("--format", type=str, choices=["parquet", "arrow"], default="parquet")
+    parser.add_argument("--batch_rows", type=int, default=BATCH_ROWS, help="rows per row group / record batch")
+    args = parser.parse_args()
+
+    if not args.shards:
+        from script_utils.progress import progress_stdin
+
+        games, rows = extract(iter_games(progress_stdin()), args.output, args.batch_rows)
+        print(f"{games} games, {rows} moves", file=sys.stderr)
+        return
+
+    output_dir = Path(args.output)
+    jobs = [(path, shard_output(path, output_dir, f".{args.format}"), args.batch_rows) for path in args.shards]
+    with Pool(args.workers) as pool:
+        for path, games, rows in pool.imap_unordered(extract_shard, jobs):
+            print(f"{path}: {games} games, {rows} moves", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
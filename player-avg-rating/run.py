@@ -8,12 +8,15 @@ in each ELO bucket broken into 10 buckets
 Output is expectedly a fairly normal distribution
 """
 
+from pathlib import Path
 import sys
 import re
 
-from tqdm import tqdm
 import matplotlib.pyplot as plt
 
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from script_utils.progress import progress_stdin  # noqa: E402
+
 
 class Player:
     def __init__(self, elo: int):
@@ -35,7 +38,7 @@ black = None
 black_elo = None
 
 try:
-    for line in tqdm(sys.stdin):
+    for line in progress_stdin():
         if line.startswith('[WhiteElo "'):
             white_elo = int(elo_pattern.match(line).group(2))
         elif line.startswith('[BlackElo "'):
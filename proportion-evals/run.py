@@ -2,13 +2,16 @@
 For wins/losses/draws, get the average evaluation for each result in a PGN database
 Does not include mate in X evaluations
 """
+from pathlib import Path
 import sys
-from tqdm import tqdm
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from script_utils.progress import progress_stdin  # noqa: E402
 
 games = 0
 eval_games = 0
 
-for line in tqdm(sys.stdin):
+for line in progress_stdin():
     if line.startswith("1."):
         games += 1
 
@@ -2,15 +2,20 @@
 Reads in a pgn and estimates the average loss per move for each rating.
 Assumes that the pgn is in a format consistent with lichess db formats
 Only looks at ELO ranges 800-2500
-Additionally, does not take into account mate in X moves as part of quantity
+Evaluations are capped at EVAL_CEILING centipawns either way, as in Lichess' average centipawn loss, so letting
+a mate slip counts as giving up a decisive advantage rather than ten thousand centipawns.
 """
 from collections import defaultdict
+from pathlib import Path
 import re
 import sys
 
 import matplotlib.pyplot as plt
 import numpy as np
 
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from pgn_parser.evals import MISSING, cp_loss, decode_evals  # noqa: E402
+
 
 class EloLoss:
     def __init__(self, elo: int, loss: float):
@@ -18,8 +23,9 @@ class EloLoss:
         self.loss: float = loss
 
 
+EVAL_CEILING = 1000
+
 extract_elo = re.compile(r'\[(White|Black)Elo "(\d+)"\]')
-extract_eval = re.compile(r'%eval ((\d+\.\d+)|(#\d+))')
 extract_tc = re.compile(r'\[TimeControl "(\d+)\+(\d+)"')
 
 elo_loss_count = defaultdict(lambda: defaultdict(int))
@@ -55,14 +61,17 @@ try:
             game_count += 1
             if game_count % 100000 == 0:
                 print(game_count, file=sys.stderr, end="\r")
-            result = extract_eval.findall(line)
-            for i, (prior, current) in enumerate(zip(result, result[1:])):
-                if "#" in current[0] or "#" in prior[0]:
-                    continue
-
-                elo = black_elo if i % 2 == 0 else white_elo
-
-                elo_loss_count[elo][abs(round(float(current[0]) - float(prior[0]), 2))] += 1
+            evals = decode_evals(line)
+            known = evals != MISSING
+            evals[known] = np.clip(evals[known], -EVAL_CEILING, EVAL_CEILING)
+            plies = cp_loss(evals)
+
+            # white's first move has no eval before it, so its loss is missing
+            for elo, parity in [(white_elo, 0), (black_elo, 1)]:
+                player_plies = plies[parity::2]
+                losses, counts = np.unique(player_plies[player_plies != MISSING], return_counts=True)
+                for loss, count in zip((losses / 100).tolist(), counts.tolist()):
+                    elo_loss_count[elo][loss] += count
 
             white_elo = None
             black_elo = None
@@ -0,0 +1,310 @@
+"""
+A low-overhead sampling profiler that can be switched on for any script in this repo.
+
+Rather than tracing every call like cProfile, a background thread wakes up every few milliseconds
+and records the stack of the main thread (or every thread, with --all-threads).
+The cost is a few microseconds per sample, so it can be left on for multi-hour scans of the Lichess database.
+
+On exit, each process writes flamegraph-compatible collapsed stacks (`profile.<pid>.collapsed`,
+usable with flamegraph.pl or speedscope) to the output directory. Worker processes are profiled too;
+the parent merges their stacks into `merged.collapsed` and writes a top-N hotspot summary
+to `summary.txt` (and stderr) when it exits.
+
+Usage:
+python -m script_utils.profiling [--output profiles] [--interval 5] [--top 25] path/to/run.py [args ...]
+python -m script_utils.profiling --merge profiles
+
+Scripts that call `maybe_profile()` also accept `--profile[=DIR]`, and every process honours
+the CHESS_SCRIPTS_PROFILE=DIR environment variable.
+"""
+from typing import Dict, List, Optional, Tuple
+
+import argparse
+import atexit
+from collections import Counter
+import multiprocessing.util
+import os
+from pathlib import Path
+import runpy
+import sys
+import threading
+
+
+PROFILE_ENV = "CHESS_SCRIPTS_PROFILE"
+INTERVAL_ENV = "CHESS_SCRIPTS_PROFILE_INTERVAL"
+TOP_ENV = "CHESS_SCRIPTS_PROFILE_TOP"
+THREADS_ENV = "CHESS_SCRIPTS_PROFILE_ALL_THREADS"
+
+DEFAULT_OUTPUT = "profiles"
+DEFAULT_INTERVAL_MS = 5.0
+DEFAULT_TOP = 25
+
+MERGED_NAME = "merged.collapsed"
+SUMMARY_NAME = "summary.txt"
+
+_active_profiler = None
+
+
+def frame_label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def collapse_stack(frame, labels: Dict) -> str:
+    """
+    Turns a frame into a single `root;caller;callee` string.
+    Labels are cached per code object, since formatting them is the expensive part of a sample.
+    """
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        label = labels.get(code)
+        if label is None:
+            label = labels[code] = frame_label(code)
+
+        names.append(label)
+        frame = frame.f_back
+
+    names.reverse()
+    return ";".join(names)
+
+
+class SamplingProfiler:
+    def __init__(
+        self,
+        output_dir: str = DEFAULT_OUTPUT,
+        interval_ms: float = DEFAULT_INTERVAL_MS,
+        top: int = DEFAULT_TOP,
+        all_threads: bool = False,
+    ):
+        self.output_dir = Path(output_dir)
+        self.interval = interval_ms / 1000
+        self.top = top
+        self.all_threads = all_threads
+        self.stacks = Counter()
+        self.samples = 0
+        self._labels = {}
+        self._stop = threading.Event()
+        self._thread = None
+        self._written = False
+
+    def start(self) -> "SamplingProfiler":
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+        main_id = threading.main_thread().ident
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            if self.all_threads:
+                for thread_id, frame in frames.items():
+                    if thread_id != own_id:
+                        self.stacks[collapse_stack(frame, self._labels)] += 1
+
+            elif main_id in frames:
+                self.stacks[collapse_stack(frames[main_id], self._labels)] += 1
+
+            self.samples += 1
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def write(self) -> Optional[Path]:
+        """Stops sampling and writes this process's collapsed stacks. Safe to call more than once."""
+        self.stop()
+        if self._written:
+            return None
+
+        self._written = True
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        path = self.output_dir / f"profile.{os.getpid()}.collapsed"
+        write_collapsed(self.stacks, path)
+
+        return path
+
+
+def write_collapsed(stacks: Counter, path: Path) -> None:
+    with open(path, "w") as out_file:
+        for stack, count in stacks.most_common():
+            out_file.write(f"{stack} {count}\n")
+
+
+def read_collapsed(path: Path) -> Counter:
+    stacks = Counter()
+    with open(path, "r") as in_file:
+        for line in in_file:
+            stack, _, count = line.rstrip("\n").rpartition(" ")
+            if stack:
+                stacks[stack] += int(count)
+
+    return stacks
+
+
+def merge_profiles(output_dir: str) -> Counter:
+    """Sums every per-process profile in the directory and writes the result to `merged.collapsed`."""
+    output_dir = Path(output_dir)
+    merged = Counter()
+    for path in sorted(output_dir.glob("profile.*.collapsed")):
+        merged.update(read_collapsed(path))
+
+    write_collapsed(merged, output_dir / MERGED_NAME)
+
+    return merged
+
+
+def hotspots(stacks: Counter, top: int = DEFAULT_TOP) -> List[Tuple[str, int, int]]:
+    """
+    Returns (function, self samples, total samples) for the `top` functions by self samples.
+    Recursive functions are only counted once per stack towards their total.
+    """
+    own = Counter()
+    total = Counter()
+    for stack, count in stacks.items():
+        frames = stack.split(";")
+        own[frames[-1]] += count
+        for name in set(frames):
+            total[name] += count
+
+    return [(name, count, total[name]) for name, count in own.most_common(top)]
+
+
+def format_summary(stacks: Counter, top: int = DEFAULT_TOP) -> str:
+    samples = sum(stacks.values())
+    if not samples:
+        return "no samples collected"
+
+    lines = [f"{samples} samples", f"{'self %':>7} {'total %':>8}  function"]
+    for name, own, total in hotspots(stacks, top):
+        lines.append(f"{100 * own / samples:>7.1f} {100 * total / samples:>8.1f}  {name}")
+
+    return "\n".join(lines)
+
+
+def _finish(profiler: SamplingProfiler, merge: bool) -> None:
+    # forked children inherit the parent's atexit handlers, so only the process's own profiler is written
+    if profiler is not _active_profiler:
+        return
+
+    path = profiler.write()
+    if path is None or not merge:
+        return
+
+    summary = format_summary(merge_profiles(profiler.output_dir), profiler.top)
+    with open(profiler.output_dir / SUMMARY_NAME, "w") as out_file:
+        out_file.write(summary + "\n")
+
+    print(f"profile written to {profiler.output_dir}", file=sys.stderr)
+    print(summary, file=sys.stderr)
+
+
+def _register_worker_finish(_parent: SamplingProfiler = None) -> None:
+    # multiprocessing workers leave through os._exit, which skips atexit, but they do run these finalizers
+    multiprocessing.util.Finalize(None, _finish, args=(_active_profiler, False), exitpriority=100)
+
+
+def _restart_in_child() -> None:
+    """Forked children inherit a copy of the parent's profiler but not its sampling thread, so start a fresh one."""
+    global _active_profiler
+
+    parent = _active_profiler
+    if parent is None:
+        return
+
+    _active_profiler = SamplingProfiler(parent.output_dir, parent.interval * 1000, parent.top, parent.all_threads).start()
+    atexit.register(_finish, _active_profiler, False)
+
+
+def start_profiling(
+    output_dir: str = DEFAULT_OUTPUT,
+    interval_ms: float = DEFAULT_INTERVAL_MS,
+    top: int = DEFAULT_TOP,
+    all_threads: bool = False,
+    worker: bool = False,
+) -> SamplingProfiler:
+    """
+    Starts profiling the current process (and any process it forks) until exit.
+    The settings are exported to the environment so spawned interpreters that call `maybe_profile()` pick them up.
+    Workers only write their own stacks; the parent merges everything in the output directory when it exits.
+    """
+    global _active_profiler
+
+    if _active_profiler is not None:
+        return _active_profiler
+
+    os.environ[PROFILE_ENV] = str(output_dir)
+    os.environ[INTERVAL_ENV] = str(interval_ms)
+    os.environ[TOP_ENV] = str(top)
+    os.environ[THREADS_ENV] = "1" if all_threads else ""
+
+    if not worker:
+        # a fresh run shouldn't merge stacks left behind by an earlier one
+        for path in Path(output_dir).glob("profile.*.collapsed"):
+            path.unlink()
+
+    _active_profiler = SamplingProfiler(output_dir, interval_ms, top, all_threads).start()
+    atexit.register(_finish, _active_profiler, not worker)
+    if worker:
+        _register_worker_finish()
+
+    os.register_at_fork(after_in_child=_restart_in_child)
+    # multiprocessing clears its finalizers after forking a worker, so they are registered again from here
+    multiprocessing.util.register_after_fork(_active_profiler, _register_worker_finish)
+
+    return _active_profiler
+
+
+def maybe_profile(argv: List[str] = None) -> Optional[SamplingProfiler]:
+    """
+    Starts the profiler if `--profile[=DIR]` is on the command line or CHESS_SCRIPTS_PROFILE is set.
+    The flag is removed from argv so it doesn't trip up the script's own argument parsing.
+    """
+    argv = sys.argv if argv is None else argv
+    output_dir = os.environ.get(PROFILE_ENV)
+
+    for index, arg in enumerate(argv[1:], start=1):
+        if arg == "--profile" or arg.startswith("--profile="):
+            output_dir = arg.partition("=")[2] or DEFAULT_OUTPUT
+            del argv[index]
+            break
+
+    if not output_dir:
+        return None
+
+    return start_profiling(
+        output_dir,
+        float(os.environ.get(INTERVAL_ENV, DEFAULT_INTERVAL_MS)),
+        int(os.environ.get(TOP_ENV, DEFAULT_TOP)),
+        bool(os.environ.get(THREADS_ENV)),
+        worker=multiprocessing.parent_process() is not None,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run a script under the sampling profiler")
+    parser.add_argument("--output", type=str, default=DEFAULT_OUTPUT, help="directory for the collapsed stacks")
+    parser.add_argument("--interval", type=float, default=DEFAULT_INTERVAL_MS, help="milliseconds between samples")
+    parser.add_argument("--top", type=int, default=DEFAULT_TOP, help="number of hotspots to summarize")
+    parser.add_argument("--all-threads", action="store_true", help="sample every thread, not just the main one")
+    parser.add_argument("--merge", type=str, default=None, help="merge the profiles in this directory and exit")
+    parser.add_argument("script", nargs="?", help="path to the script to profile")
+    parser.add_argument("args", nargs=argparse.REMAINDER, help="arguments passed to the script")
+    args = parser.parse_args()
+
+    if args.merge is not None:
+        print(format_summary(merge_profiles(args.merge), args.top))
+        return
+
+    if args.script is None:
+        parser.error("a script to profile is required")
+
+    sys.argv = [args.script] + args.args
+    sys.path.insert(0, os.path.dirname(os.path.abspath(args.script)))
+    start_profiling(args.output, args.interval, args.top, args.all_threads)
+    runpy.run_path(args.script, run_name="__main__")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+"""
+Progress reporting for scans over huge PGN files that costs nothing per line.
+
+Wrapping stdin in tqdm means a tqdm update on every one of the ~billion lines in a Lichess dump.
+Instead, bytes are counted a megabyte at a time, as the buffered reader refills from the raw stream,
+so iterating over lines stays close to the speed of a bare `for line in sys.stdin`.
+The status line is redrawn on stderr at most every `interval` seconds, with an ETA when the size is known.
+
+Usage:
+for line in progress_stdin():
+    ...
+
+The size is known when stdin is redirected from a file (`python run.py < games.pgn`);
+when it's piped, pass `total` or set PROGRESS_TOTAL_BYTES to get an ETA.
+"""
+from typing import BinaryIO, Optional, TextIO
+
+import io
+import os
+import stat
+import sys
+import time
+
+
+TOTAL_ENV = "PROGRESS_TOTAL_BYTES"
+BUFFER_SIZE = 1 << 20
+
+
+def format_bytes(count: float) -> str:
+    for unit in ["B", "KB", "MB", "GB"]:
+        if count < 1024:
+            return f"{count:.1f} {unit}"
+        count /= 1024
+
+    return f"{count:.1f} TB"
+
+
+def format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+
+    return f"{hours}:{minutes:02d}:{seconds:02d}"
+
+
+class ByteProgress:
+    def __init__(self, total: Optional[int] = None, interval: float = 0.5, out: TextIO = None):
+        self.total = total or None
+        self.interval = interval
+        self.out = sys.stderr if out is None else out
+        self.consumed = 0
+        self.started = time.monotonic()
+        self._next_update = self.started + interval
+        self._closed = False
+
+    def advance(self, count: int) -> None:
+        self.consumed += count
+        now = time.monotonic()
+        if now >= self._next_update:
+            self._next_update = now + self.interval
+            self.render(now)
+
+    def render(self, now: float = None) -> None:
+        elapsed = max((now or time.monotonic()) - self.started, 1e-9)
+        rate = self.consumed / elapsed
+        status = f"{format_bytes(self.consumed)}"
+        if self.total:
+            status += f" / {format_bytes(self.total)} {100 * self.consumed / self.total:5.1f}%"
+
+        status += f"  {format_bytes(rate)}/s  {format_duration(elapsed)}"
+        if self.total and rate:
+            status += f"  ETA {format_duration(max(self.total - self.consumed, 0) / rate)}"
+
+        print(f"\r{status}", end="", file=self.out, flush=True)
+
+    def close(self) -> None:
+        if self._closed:
+            return
+
+        self._closed = True
+        self.render()
+        print(file=self.out, flush=True)
+
+
+class CountingReader(io.RawIOBase):
+    """A raw stream that reports the bytes read through it; the reads go straight into the caller's buffer."""
+
+    # the text and buffered readers check `closed` on every line unless the raw stream is a FileIO;
+    # a plain attribute keeps that check cheap, where the inherited property costs a Python call
+    closed = False
+
+    def __init__(self, raw: BinaryIO, progress: ByteProgress, closefd: bool = True):
+        self.raw = raw
+        self.progress = progress
+        self.closefd = closefd
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> Optional[int]:
+        count = self.raw.readinto(buffer)
+        if count:
+            self.progress.advance(count)
+        elif count == 0:
+            self.progress.close()
+
+        return count
+
+    def close(self) -> None:
+        if self.closed:
+            return
+
+        self.__dict__["closed"] = True
+        self.progress.close()
+        if self.closefd:
+            self.raw.close()
+
+
+def stream_size(raw: BinaryIO) -> Optional[int]:
+    try:
+        info = os.fstat(raw.fileno())
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        return None
+
+    return info.st_size if stat.S_ISREG(info.st_mode) else None
+
+
+def progress_reader(
+    raw: BinaryIO, total: Optional[int] = None, interval: float = 0.5, closefd: bool = True
+) -> BinaryIO:
+    """
+    Wraps a raw (unbuffered) binary stream so reading it reports progress; see `progress_stdin`.
+
+    The bytes are counted as the buffer refills, once a megabyte, so the returned stream is a plain
+    buffered reader and line iteration keeps its fast path. Closing it closes `raw` too, if `closefd`.
+    """
+    if total is None:
+        total = int(os.environ.get(TOTAL_ENV, 0)) or stream_size(raw)
+
+    return io.BufferedReader(CountingReader(raw, ByteProgress(total, interval), closefd), BUFFER_SIZE)
+
+
+def progress_stdin(total: Optional[int] = None, interval: float = 0.5) -> TextIO:
+    """
+    Returns stdin as a text stream that reports progress by bytes consumed.
+    Iterate over it exactly like `sys.stdin`.
+    """
+    reader = progress_reader(getattr(sys.stdin.buffer, "raw", sys.stdin.buffer), total, interval, closefd=False)
+
+    return io.TextIOWrapper(reader, encoding=sys.stdin.encoding, errors=sys.stdin.errors)
+
+
+def progress_open(path: str, mode: str = "r", interval: float = 0.5):
+    """Opens a file for reading (text or binary) with progress against its size."""
+    reader = progress_reader(open(path, "rb", buffering=0), interval=interval)
+    if "b" in mode:
+        return reader
+
+    return io.TextIOWrapper(reader, encoding="utf-8")
@@ -4,22 +4,16 @@ Gets the peak rapid, blitz, and tactics ratings for all titled players on chess.
 
 import json
 import os
+from pathlib import Path
+import sys
 
 import requests
 from tqdm import tqdm
 import pandas as pd
 import matplotlib.pyplot as plt
 
-
-def get_titled_players() -> list:
-    players = []
-    for title in ["GM", "WGM", "IM", "WIM", "FM", "WFM", "NM", "WNM", "CM", "WCM"]:
-        response = requests.get(f"https://api.chess.com/pub/titled/{title}").json()
-        players.extend(response["players"])
-
-    players.sort()
-
-    return players
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from chesscom.titled import get_titled_players  # noqa: E402
 
 
 data = []
@@ -0,0 +1,41 @@
+import json
+
+import pytest
+
+from chesscom.archive import iter_archive_games
+
+
+GAMES = [
+    {"url": "https://www.chess.com/game/live/1", "pgn": '[Event "Live Chess"]\n[White "a"]\n\n1. e4 e5 *'},
+    {"pgn": '[Event "Live Chess"]\n[White "b"]\n\n1. d4 d5 *', "t": "b", "url": "https://www.chess.com/game/live/2"},
+    {"url": "https://www.chess.com/game/live/3", "pgn": "1. c4 *", "rated": True},
+]
+
+
+def test_pgn_as_last_and_first_key():
+    body = json.dumps({"games": GAMES}).encode()
+    assert [game.to_dict() for game in iter_archive_games(body)] == GAMES
+
+
+def test_escaped_backslashes():
+    games = [{"url": "u", "pgn": '[Event "a\\\\"]\n1. e4 *'}, {"pgn": "1. d4 *", "url": "v"}]
+    assert [game.to_dict() for game in iter_archive_games(json.dumps(games))] == games
+
+
+def test_games_dont_keep_the_body():
+    games = list(iter_archive_games(json.dumps({"games": GAMES}).encode()))
+    assert [game.pgn for game in games] == [game["pgn"] for game in GAMES]
+    assert all(len(game._raw) <= len(game.pgn) + 10 for game in games)
+
+
+def test_without_pgns():
+    games = list(iter_archive_games(json.dumps({"games": GAMES}), pgns=False))
+    assert [game.to_dict() for game in games] == [
+        {key: value for key, value in game.items() if key != "pgn"} for game in GAMES
+    ]
+    assert not any("pgn" in game for game in games)
+
+
+def test_unterminated_pgn():
+    with pytest.raises(ValueError, match="malformed"):
+        list(iter_archive_games(b'{"games": [{"url": "u", "pgn": "1. e4 *}]}'))
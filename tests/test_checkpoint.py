@@ -0,0 +1,40 @@
+from analysis.checkpoint import Checkpoint
+
+
+def test_results_are_kept_per_settings(tmp_path):
+    path = tmp_path / "progress.sqlite"
+    shallow = Checkpoint(path, {"depth": 10, "engine": "Stockfish 16"})
+    shallow.put("game/1", {"brilliant": "Rxf7"})
+    shallow.put("game/2", {"brilliant": None})
+    shallow.close()
+
+    # the same settings in another order are the same settings
+    again = Checkpoint(path, {"engine": "Stockfish 16", "depth": 10})
+    assert again.get("game/1") == {"brilliant": "Rxf7"}
+    assert list(again.results()) == ["game/1", "game/2"]
+    assert len(again) == 2
+    again.close()
+
+    deep = Checkpoint(path, {"depth": 18, "engine": "Stockfish 16"})
+    assert deep.get("game/1") is None
+    assert deep.results() == {} and len(deep) == 0
+    deep.put("game/1", {"brilliant": None})
+    deep.close()
+
+    shallow = Checkpoint(path, {"depth": 10, "engine": "Stockfish 16"})
+    assert shallow.get("game/1") == {"brilliant": "Rxf7"}
+    shallow.close()
+
+
+def test_done_scopes_are_kept_per_settings(tmp_path):
+    path = tmp_path / "progress.sqlite"
+    checkpoint = Checkpoint(path, {"depth": 10})
+    assert not checkpoint.is_done("2024/01")
+    checkpoint.mark_done("2024/01")
+    checkpoint.mark_done("2024/01")
+    assert checkpoint.is_done("2024/01")
+    assert not checkpoint.is_done("2024/02")
+    checkpoint.close()
+
+    assert Checkpoint(path, {"depth": 10}).is_done("2024/01")
+    assert not Checkpoint(path, {"depth": 18}).is_done("2024/01")
@@ -0,0 +1,136 @@
+import asyncio
+import random
+import time
+
+from aiohttp import web
+import pytest
+
+from chesscom.client import ChessComClient, iter_run
+from chesscom.ratelimit import RateLimiter
+
+
+class FakeClient(ChessComClient):
+    """Months arrive after a random delay; counts how many are held at once."""
+
+    def __init__(self, concurrency=2):
+        super().__init__(concurrency, cache=False)
+        self.held = 0
+        self.most_held = 0
+
+    async def archives(self, username):
+        return [f"/month/{index}" for index in range(20)]
+
+    async def month(self, url):
+        self.fetched = getattr(self, "fetched", 0) + 1
+        self.held += 1
+        self.most_held = max(self.most_held, self.held)
+        await asyncio.sleep(random.random() / 100)
+        return {"url": url}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+
+async def consume(client, ordered):
+    urls = await client.archives("player")
+    seen = []
+    async for url, month in client.iter_months(urls, ordered=ordered):
+        assert month == {"url": url}
+        seen.append(url)
+        client.held -= 1
+
+    return urls, seen
+
+
+def test_iter_months_holds_a_window():
+    client = FakeClient()
+    urls, seen = asyncio.run(consume(client, ordered=False))
+    assert sorted(seen) == sorted(urls)
+    assert client.most_held <= 2 * client.concurrency
+
+
+def test_iter_months_ordered():
+    client = FakeClient()
+    urls, seen = asyncio.run(consume(client, ordered=True))
+    assert seen == urls
+    assert client.most_held <= 2 * client.concurrency
+
+
+def test_iter_run_stops_early(monkeypatch):
+    monkeypatch.setattr("chesscom.client.ChessComClient", lambda concurrency: FakeClient(concurrency))
+
+    async def months(client):
+        async for url, _ in client.iter_months(await client.archives("player"), ordered=True):
+            yield url
+
+    for index, url in enumerate(iter_run(months)):
+        assert url == f"/month/{index}"
+        if index == 3:
+            break
+
+
+def test_iter_run_downloads_while_the_caller_works(monkeypatch):
+    clients = []
+
+    def make_client(concurrency):
+        clients.append(FakeClient(concurrency))
+        return clients[-1]
+
+    monkeypatch.setattr("chesscom.client.ChessComClient", make_client)
+
+    async def months(client):
+        async for url, _ in client.iter_months(await client.archives("player"), ordered=True):
+            yield url
+
+    items = iter_run(months, concurrency=2)
+    next(items)
+    fetched = clients[0].fetched
+    # only the caller is busy now
+    time.sleep(0.2)
+    assert clients[0].fetched > fetched
+    assert len(list(items)) == 19
+
+
+def test_iter_run_raises_in_the_caller(monkeypatch):
+    monkeypatch.setattr("chesscom.client.ChessComClient", lambda concurrency: FakeClient(concurrency))
+
+    async def months(client):
+        yield 1
+        raise RuntimeError("archive gone")
+
+    items = iter_run(months)
+    assert next(items) == 1
+    with pytest.raises(RuntimeError, match="archive gone"):
+        next(items)
+
+
+async def fetch_all_queued(latency, count, timeout):
+    async def month(request):
+        await asyncio.sleep(latency)
+        return web.json_response({"games": []})
+
+    app = web.Application()
+    app.router.add_get("/pub/player/{username}/games/{year}/{month}", month)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    try:
+        client = ChessComClient(
+            2, f"http://127.0.0.1:{port}/pub", timeout=timeout, cache=False, limiter=RateLimiter(1000), retries=0
+        )
+        async with client:
+            urls = [f"/player/a/games/2024/{index:02}" for index in range(count)]
+            return await client.months(urls)
+    finally:
+        await runner.cleanup()
+
+
+def test_waiting_for_a_connection_isnt_timed():
+    # 20 requests two at a time take a second, twice the timeout of each request
+    months = asyncio.run(fetch_all_queued(latency=0.1, count=20, timeout=0.5))
+    assert months == [{"games": []}] * 20
@@ -0,0 +1,36 @@
+import chess
+import chess.engine
+
+from analysis.evalcache import EvalCache
+
+
+LIMIT = chess.engine.Limit(depth=12)
+
+
+def lines(board, count):
+    return [
+        {"score": chess.engine.PovScore(chess.engine.Cp(-index), board.turn), "pv": [move], "depth": 12}
+        for index, move in enumerate(list(board.legal_moves)[:count])
+    ]
+
+
+def test_multipv_beyond_legal_moves(tmp_path):
+    cache = EvalCache(tmp_path / "evals.sqlite")
+    # the rook covers g7 and g8, so Kh7 is the only move
+    board = chess.Board("7k/8/8/8/8/8/6R1/K7 b - - 0 1")
+    assert board.legal_moves.count() == 1
+
+    cache.put(board, LIMIT, lines(board, 5))
+    cached = cache.get(board, LIMIT, multipv=5)
+    assert cached is not None and len(cached) == 1
+    assert len(cache.get(board, LIMIT, multipv=1)) == 1
+
+
+def test_fewer_lines_than_requested(tmp_path):
+    cache = EvalCache(tmp_path / "evals.sqlite")
+    board = chess.Board()
+
+    cache.put(board, LIMIT, lines(board, 2))
+    assert cache.get(board, LIMIT, multipv=3) is None
+    assert len(cache.get(board, LIMIT, multipv=2)) == 2
+    assert cache.get(board, chess.engine.Limit(depth=14), multipv=1) is None
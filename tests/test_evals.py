@@ -0,0 +1,34 @@
+import numpy as np
+
+from pgn_parser.evals import MATE_MARGIN, MATE_SCORE, MISSING, cp_loss, decode_evals
+
+
+def test_no_evals():
+    evals = decode_evals("1. e4 {[%clk 0:03:00]} e5 {[%clk 0:02:59.9]}")
+    assert evals.tolist() == [MISSING, MISSING]
+
+
+def test_mate_only_evals():
+    assert decode_evals("1. e4 { [%eval #3] } e5 { [%eval #-2] }").tolist() == [MATE_SCORE - 3, -(MATE_SCORE - 2)]
+
+
+def test_single_digit_evals():
+    assert decode_evals("1. e4 { [%eval 1] } e5 { [%eval 0] }").tolist() == [100, 0]
+
+
+def test_bytes_without_evals():
+    evals = decode_evals(b"1. e4 {[%clk 0:03:00]} e5 { [%eval #1] }")
+    assert evals.dtype == np.int16
+    assert evals.tolist() == [MISSING, MATE_SCORE - 1]
+
+
+def test_huge_evals_stay_below_mates():
+    evals = decode_evals("1. e4 { [%eval 150.0] } e5 { [%eval -150.0] } 2. Qh5 { [%eval #-120] }")
+    assert evals.tolist() == [MATE_SCORE - MATE_MARGIN, -(MATE_SCORE - MATE_MARGIN), -(MATE_SCORE - 120)]
+    assert evals[0] < MATE_SCORE - 120
+
+
+def test_cp_loss_ignores_gains():
+    evals = decode_evals("1. e4 { [%eval 0.3] } e5 { [%eval 1.0] } 2. Qh5 { [%eval #2] } Nc6 { [%eval 0.5] }")
+    # black gives up 70, then white and black both improve their positions
+    assert cp_loss(evals).tolist() == [MISSING, 70, 0, 0]
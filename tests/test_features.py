@@ -0,0 +1,52 @@
+import io
+
+import pyarrow.parquet as pq
+
+from pgn_parser.features import extract
+from pgn_parser.parse import iter_games
+
+
+MIXED_PGN = """[Site "https://lichess.org/annotated"]
+[Result "1-0"]
+
+1. e4 { [%eval 0.3] [%clk 0:03:00] } 1... e5 { [%eval #3] [%clk 0:02:59] } 2. Qh5 { [%eval 1] [%clk 0:02:58] } 1-0
+
+[Site "https://lichess.org/clocks"]
+[Result "0-1"]
+
+1. d4 {[%clk 0:03:00]} d5 {[%clk 0:02:59.9]} 0-1
+
+[Site "https://lichess.org/bare"]
+[Result "1/2-1/2"]
+
+1. c4 c5 1/2-1/2
+
+"""
+
+
+def test_mixed_annotations(tmp_path):
+    output = str(tmp_path / "moves.parquet")
+    games, rows = extract(iter_games(io.StringIO(MIXED_PGN)), output)
+    assert (games, rows) == (3, 7)
+
+    table = pq.read_table(output).to_pydict()
+    assert table["eval_after"] == [30, 9997, 100, None, None, None, None]
+    assert table["clock"][3:5] == [18000, 17990]
+    assert table["clock"][5:] == [None, None]
+
+
+INCREMENT_PGN = """[Site "https://lichess.org/increment"]
+[TimeControl "180+2"]
+[Result "*"]
+
+1. e4 {[%clk 0:03:00]} e5 {[%clk 0:02:58]} 2. Nf3 {[%clk 0:02:59]} Nc6 {[%clk 0:02:50]} *
+
+"""
+
+
+def test_first_moves_get_no_increment(tmp_path):
+    output = str(tmp_path / "moves.parquet")
+    extract(iter_games(io.StringIO(INCREMENT_PGN)), output)
+
+    # a premoved first move took nothing, and the later moves get their 2s back
+    assert pq.read_table(output).to_pydict()["time_spent"] == [0, 200, 300, 1000]
@@ -0,0 +1,99 @@
+import importlib.util
+import json
+from pathlib import Path
+
+import chess
+import pytest
+
+from analysis.checkpoint import Checkpoint
+
+
+@pytest.fixture(scope="module")
+def find_games():
+    # find-brilliancies is a script directory, not a package
+    path = Path(__file__).resolve().parents[1] / "find-brilliancies" / "find_games.py"
+    spec = importlib.util.spec_from_file_location("find_games", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def see(find_games, fen, uci):
+    board = chess.Board(fen)
+    move = chess.Move.from_uci(uci)
+    assert move in board.legal_moves
+    return find_games.static_exchange_evaluation(board, move)
+
+
+def test_defended_capture(find_games):
+    # Nxe5 dxe5
+    assert see(find_games, "4k3/8/3p4/4p3/8/5N2/8/4K3 w - - 0 1", "f3e5") == -2
+    assert see(find_games, "4k3/8/8/4p3/8/5N2/8/4K3 w - - 0 1", "f3e5") == 1
+
+
+def test_x_ray_recapture(find_games):
+    # Rxe5 Rxe5 Rxe5, the second rook only attacking once the first has gone
+    assert see(find_games, "4r1k1/8/8/4p3/8/8/4R3/4R1K1 w - - 0 1", "e2e5") == 1
+    assert see(find_games, "4r1k1/8/8/4p3/8/8/4R3/6K1 w - - 0 1", "e2e5") == -4
+
+
+def test_pinned_piece_cant_recapture(find_games):
+    # the d6 pawn is pinned to its king by the rook on d1
+    assert see(find_games, "3k4/8/3p4/4p3/8/5N2/8/3R3K w - - 0 1", "f3e5") == 1
+
+
+def test_en_passant(find_games):
+    # the pawn taken en passant leaves d5, so the rook behind it recaptures on d6
+    assert see(find_games, "4k3/8/8/3pP3/8/8/3r4/7K w - d6 0 1", "e5d6") == 0
+    assert see(find_games, "4k3/8/8/3pP3/8/8/8/7K w - d6 0 1", "e5d6") == 1
+
+
+def test_promotion(find_games):
+    # the new queen is taken, so only the pawn is lost
+    assert see(find_games, "r3k3/1P6/8/8/8/8/8/4K3 w - - 0 1", "b7b8q") == -1
+    assert see(find_games, "r3k3/1P6/8/8/8/8/8/4K3 w - - 0 1", "b7a8q") == 13
+
+
+def test_king_recaptures_last(find_games):
+    # Bxf7+ can't be met by Kxf7 while the rook on f2 guards f7
+    assert see(find_games, "6k1/5p2/8/8/8/1B6/5R2/6K1 w - - 0 1", "b3f7") == 1
+    assert see(find_games, "6k1/5p2/8/8/8/1B6/8/6K1 w - - 0 1", "b3f7") == -2
+
+
+def test_least_valuable_attacker(find_games):
+    board = chess.Board("3k4/8/3p4/4p3/5P2/5N2/8/3R3K w - - 0 1")
+    assert find_games.least_valuable_attacker(board, chess.WHITE, chess.E5, board.occupied) == chess.F4
+    assert find_games.least_valuable_attacker(board, chess.BLACK, chess.E5, board.occupied) is None
+
+    board.remove_piece_at(chess.D1)
+    assert find_games.least_valuable_attacker(board, chess.BLACK, chess.E5, board.occupied) == chess.D6
+
+
+def test_import_json_progress(find_games, tmp_path, capsys):
+    json_path = tmp_path / "brilliancies_hikaru.json"
+    months = ["https://api.chess.com/pub/player/hikaru/games/2024/01"]
+    games = ["https://www.chess.com/game/live/1", "https://www.chess.com/game/live/2"]
+    json_path.write_text(json.dumps({"months": months, "games": games}))
+    assert find_games.is_json_progress(json_path)
+
+    checkpoint = Checkpoint(json_path.with_suffix(".sqlite"), {"depth": 18})
+    checkpoint.put(games[1], {"link": games[1], "brilliant": "Qxh7"})
+    find_games.import_json_progress(json_path, checkpoint)
+
+    assert checkpoint.is_done(months[0])
+    assert find_games.brilliant_links(checkpoint) == games[1:] + games[:1]
+    # results already in the checkpoint are left alone
+    assert checkpoint.get(games[1])["brilliant"] == "Qxh7"
+    assert checkpoint.get(games[0])["brilliant"] == "?"
+    assert "imported 1 months" in capsys.readouterr().err
+
+    # the checkpoint itself isn't an older progress file
+    checkpoint.close()
+    assert not find_games.is_json_progress(json_path.with_suffix(".sqlite"))
+
+
+def test_unknown_progress_file_is_refused(find_games, tmp_path):
+    path = tmp_path / "progress.json"
+    path.write_text(json.dumps({"games": []}))
+    with pytest.raises(SystemExit):
+        find_games.is_json_progress(path)
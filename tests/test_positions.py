@@ -0,0 +1,74 @@
+import random
+
+import chess
+
+from analysis import positions
+from analysis.positions import CountMinSketch, PositionCounter, position_key
+
+
+def test_counter_grows_past_its_load_factor():
+    random.seed(1)
+    keys = list({random.getrandbits(64) | 1 for _ in range(1000)})
+    counter = PositionCounter(capacity=16)
+    for index, key in enumerate(keys):
+        for _ in range(index % 3 + 1):
+            counter.add(key)
+
+    assert len(counter) == len(keys)
+    assert len(counter.keys) >= len(keys) / positions.MAX_LOAD
+    assert all(counter[key] == index % 3 + 1 for index, key in enumerate(keys))
+    assert counter[12345] == 0
+
+
+def test_items_min_count():
+    counter = PositionCounter()
+    for key, times in [(10, 1), (20, 2), (30, 3)]:
+        for _ in range(times):
+            counter.add(key)
+
+    assert sorted(counter.items()) == [(10, 1), (20, 2), (30, 3)]
+    assert sorted(counter.items(2)) == [(20, 2), (30, 3)]
+    assert sorted(counter.items(0)) == sorted(counter.items())
+
+
+def test_position_hashing_to_empty_is_kept(monkeypatch):
+    monkeypatch.setattr(chess.polyglot, "zobrist_hash", lambda board: positions.EMPTY)
+    key = position_key(chess.Board())
+    assert key == 1
+
+    counter = PositionCounter()
+    assert counter.add(key) == 1
+    assert counter.add(key) == 2
+    assert list(counter.items()) == [(1, 2)]
+
+
+def test_position_key_ignores_move_counters():
+    board = chess.Board()
+    for san in ["Nf3", "Nf6", "Ng1", "Ng8"]:
+        board.push_san(san)
+
+    assert position_key(board) == position_key(chess.Board())
+
+
+def test_prefilter_holds_positions_back_until_admitted():
+    counter = PositionCounter(prefilter=CountMinSketch(width=1 << 10), admit=3)
+    assert counter.add(42) == 0
+    assert counter.add(42) == 0
+    assert len(counter) == 0 and counter[42] == 0
+
+    # admitted with the sketch's count, then counted exactly
+    assert counter.add(42) == 3
+    assert counter.add(42) == 4
+    assert len(counter) == 1 and list(counter.items()) == [(42, 4)]
+
+
+def test_sketch_never_underestimates():
+    random.seed(2)
+    sketch = CountMinSketch(width=1 << 8, depth=4)
+    keys = [random.getrandbits(64) for _ in range(2000)]
+    counts = {key: random.randint(1, 5) for key in keys}
+    for key, count in counts.items():
+        for _ in range(count):
+            sketch.add(key)
+
+    assert all(sketch.estimate(key) >= count for key, count in counts.items())
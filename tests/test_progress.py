@@ -0,0 +1,31 @@
+import io
+
+from script_utils.progress import progress_open, progress_reader
+
+
+def test_counts_every_byte(tmp_path):
+    path = tmp_path / "games.pgn"
+    lines = [f'[Event "{index}"]\n' for index in range(100_000)]
+    path.write_text("".join(lines))
+
+    out = io.StringIO()
+    with open(path, "rb", buffering=0) as raw:
+        reader = progress_reader(raw, interval=0, closefd=False)
+        reader.raw.progress.out = out
+        assert [line.decode() for line in reader] == lines
+        assert reader.raw.progress.consumed == path.stat().st_size
+        reader.close()
+        assert not raw.closed
+
+    assert "100.0%" in out.getvalue()
+
+
+def test_progress_open_closes_the_file(tmp_path):
+    path = tmp_path / "games.pgn"
+    path.write_text("1. e4 e5 *\n")
+
+    reader = progress_open(str(path))
+    raw = reader.buffer.raw.raw
+    assert reader.read() == "1. e4 e5 *\n"
+    reader.close()
+    assert raw.closed
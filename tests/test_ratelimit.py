@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+import random
+
+import pytest
+
+from chesscom.ratelimit import RateLimiter, backoff_delay, is_error_payload, retry_after
+
+
+def test_retry_after_seconds():
+    assert retry_after({"Retry-After": "7"}) == 7
+    assert retry_after({"Retry-After": "-3"}) == 0
+    assert retry_after({}) is None
+    assert retry_after({"Retry-After": "soon"}) is None
+
+
+def test_retry_after_http_date():
+    when = datetime.now(timezone.utc) + timedelta(seconds=30)
+    assert retry_after({"Retry-After": format_datetime(when, usegmt=True)}) == pytest.approx(30, abs=2)
+
+    past = datetime.now(timezone.utc) - timedelta(minutes=5)
+    assert retry_after({"Retry-After": format_datetime(past, usegmt=True)}) == 0
+
+
+def test_backoff_delay_stays_within_its_jitter():
+    random.seed(0)
+    for attempt in range(10):
+        ceiling = min(60.0, 2**attempt)
+        delays = [backoff_delay(attempt) for _ in range(200)]
+        assert all(0 <= delay <= ceiling for delay in delays)
+        # full jitter: spread over the whole range, not bunched at the top
+        assert min(delays) < ceiling / 4 and max(delays) > ceiling * 3 / 4
+
+
+def test_throttle_halves_the_rate_once_per_pause():
+    limiter = RateLimiter(10)
+    limiter.throttle(5)
+    assert limiter.rate == 5
+    # responses that were already in flight don't halve it again
+    limiter.throttle(5)
+    assert limiter.rate == 5
+    assert limiter.throttled == 2
+
+    limiter._paused_until = 0
+    for _ in range(10):
+        limiter.throttle(0)
+    assert limiter.rate == limiter.min_rate
+
+
+def test_success_recovers_the_rate():
+    limiter = RateLimiter(10)
+    limiter.throttle(0)
+    assert limiter.rate == 5
+
+    for _ in range(49):
+        limiter.success()
+    assert limiter.rate < 10
+
+    for _ in range(10):
+        limiter.success()
+    assert limiter.rate == 10
+
+
+def test_is_error_payload():
+    assert is_error_payload(b'{"code": 0, "message": "An internal error has occurred."}')
+    assert not is_error_payload(b'{"games": []}')
+    assert not is_error_payload(b'{"code": 0, "games": []}')
@@ -1,10 +1,11 @@
+import asyncio
+from pathlib import Path
 import re
-from io import StringIO
 import sys
 
-import requests
-from chess.pgn import read_game
-from tqdm import tqdm
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from chesscom.client import run  # noqa: E402
+from pgn_parser.clocks import decode_clocks, remaining_time  # noqa: E402
 
 
 GAME_CODES = {
@@ -20,15 +21,9 @@ GAME_CODES = {
     "50move": "draw",
 }
 
-HEADERS = {
-    "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/117.0.0.0 Safari/537.36"
-}
-
 # https://www.chess.com/tournament/live/late-titled-tuesday-blitz-march-05-2024-4605130
 TT_RE_MATCH = re.compile(r"^.*(late|early)-titled-tuesday-blitz-.*-2024-\d+")
-CLOCK_PATTERN = re.compile(
-    r"(?P<hours>\d+):(?P<minutes>\d+):(?P<seconds>\d+(?:\.\d+)?)"
-)
+RESULT_PATTERN = re.compile(r'\[Result "([^"]+)"\]')
 
 TT_URLS = {
     "https://api.chess.com/pub/tournament/late-titled-tuesday-blitz-february-06-2024-4547612",
@@ -60,64 +55,50 @@ TT_URLS = {
 }
 
 
-def get_blitz_leaderboard():
-    url = "https://api.chess.com/pub/leaderboards"
-    response = requests.get(url, headers=HEADERS)
-    response.raise_for_status()
-    data = response.json()
+async def get_blitz_leaderboard(client):
+    data = await client.leaderboards()
     blitz_leaderboard = data["live_blitz"]
     return [user["username"] for user in blitz_leaderboard]
 
 
-def get_tt_tournament_links(usernames):
-    for user in tqdm(usernames):
-        url = f"https://api.chess.com/pub/player/{user}/tournaments"
-        response = requests.get(url, headers=HEADERS)
-        response.raise_for_status()
-        data = response.json()
-        for tournament in data["finished"]:
-            if TT_RE_MATCH.match(tournament["@id"]):
-                yield tournament["@id"]
+async def get_tt_tournament_links(client, usernames):
+    responses = await asyncio.gather(*[client.get_json(f"/player/{user}/tournaments") for user in usernames])
+    return {
+        tournament["@id"]
+        for data in responses
+        for tournament in data["finished"]
+        if TT_RE_MATCH.match(tournament["@id"])
+    }
 
 
-def get_tt_data():
-    # needs a pandas dataframe with output of white_seconds_left, black_seconds_left, result
-    # result can be 1 for white win, 0 for draw, -1 for black win
+async def fetch_tt_rounds(client):
     global TT_URLS
 
     if TT_URLS is None:
-        usernames = get_blitz_leaderboard()
-        TT_URLS = set(get_tt_tournament_links(usernames))
+        usernames = await get_blitz_leaderboard(client)
+        TT_URLS = await get_tt_tournament_links(client, usernames)
 
         print(TT_URLS, file=sys.stderr)
 
-    for url in tqdm(TT_URLS):
-        response = requests.get(f"{url}/11/1", headers=HEADERS)
-        response.raise_for_status()
-        data = response.json()
+    return await asyncio.gather(*[client.tournament(f"{url}/11/1") for url in TT_URLS])
+
+
+def get_tt_data():
+    # needs a pandas dataframe with output of white_seconds_left, black_seconds_left, result
+    # result can be 1 for white win, 0 for draw, -1 for black win
+    for data in run(fetch_tt_rounds):
         for game in data["games"]:
-            white_seconds = 180
-            black_seconds = 180
-            pgn_game = read_game(StringIO(game["pgn"]))
             result = 0.0
-            if pgn_game.headers["Result"] == "1-0":
+            result_match = RESULT_PATTERN.search(game["pgn"])
+            if result_match and result_match.group(1) == "1-0":
                 result = 1.0
-            elif pgn_game.headers["Result"] == "0-1":
+            elif result_match and result_match.group(1) == "0-1":
                 result = -1.0
 
-            for index, node in enumerate(pgn_game.mainline()):
-                clock_time = str(node.comment)
-                hours, minutes, seconds = CLOCK_PATTERN.search(clock_time).groups()
-
-                if index % 2 == 0:
-                    white_seconds = (
-                        int(hours) * 3600 + int(minutes) * 60 + float(seconds)
-                    )
-                else:
-                    black_seconds = (
-                        int(hours) * 3600 + int(minutes) * 60 + float(seconds)
-                    )
+            # both clocks start at 3 minutes
+            white_clocks, black_clocks = remaining_time(decode_clocks(game["pgn"]), initial=18000)
 
+            for white_seconds, black_seconds in zip((white_clocks / 100).tolist(), (black_clocks / 100).tolist()):
                 yield white_seconds, black_seconds, result
 
 
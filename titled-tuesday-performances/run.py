@@ -1,21 +1,25 @@
+from typing import AsyncIterator
+
+import asyncio
+from collections import defaultdict
+from functools import partial
 import random
-import os
 import json
+import sys
+from pathlib import Path
 
 from tqdm import tqdm
-import requests
 from statistics import median
 from statistics import stdev
 from scipy.stats import pearsonr
 
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from chesscom.client import iter_run  # noqa: E402
+
 # Seed for reproducibility
 # jan 23 2024
 random.seed(1 + 23 + 2024)
 
-HEADERS = {
-    "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/117.0.0.0 Safari/537.36"
-}
-
 TOURNAMENT_ID_CONTAINS = "titled-tuesday"
 TOURNAMENT_URLS = [
     "https://api.chess.com/pub/tournament/early-titled-tuesday-blitz-january-02-2024-4490237/11",
@@ -28,6 +32,7 @@ TOURNAMENT_URLS = [
     "https://api.chess.com/pub/tournament/late-titled-tuesday-blitz-january-23-2024-4518065/11",
 ]
 TIME_CONTROL = "blitz"
+MONTHS = 3
 
 
 GAME_CODES = {
@@ -44,9 +49,6 @@ GAME_CODES = {
 }
 
 
-ARCHIVE_FILES = os.listdir("user_archives")
-
-
 def expected_score(opponent_ratings: list[float], own_rating: float) -> float:
     """How many points we expect to score in games with these opponents"""
     return sum(
@@ -79,59 +81,50 @@ def performance_rating(opponent_ratings: list[float], score: float) -> int:
 print(performance_rating([2216, 1874, 1731], 1.5))
 
 
-def get_tournament_players() -> list[str]:
+async def get_tournament_players(client) -> set[str]:
     players = set()
-    for url in TOURNAMENT_URLS:
-        response = requests.get(url, headers=HEADERS)
-        blitz_players = response.json()["players"]
-        players |= {player["username"] for player in blitz_players}
+    for tournament in await asyncio.gather(*[client.tournament(url) for url in TOURNAMENT_URLS]):
+        players |= {player["username"] for player in tournament["players"]}
 
     return players
 
 
-def get_user_archives(username):
-    url = f"https://api.chess.com/pub/player/{username}/games/archives"
-    archives = requests.get(url, headers=HEADERS)
-    archives = archives.json().get("archives", [])
-    archives.sort()
-
-    return archives
+async def fetch_months(client) -> AsyncIterator[tuple[str, list[dict]]]:
+    """
+    (username, games) for each of the players' last few monthly archives, as they arrive; only a window of months
+    is held at once. Archives are served from the on-disk cache after the first run, and only the metadata is
+    decoded; none of the analysis here needs the PGNs.
+    """
+    players = sorted(await get_tournament_players(client))
+    archives = await asyncio.gather(*[client.archives(username) for username in players])
+    owners = {url: username for username, urls in zip(players, archives) for url in urls[-MONTHS:]}
 
+    async for url, games in client.iter_months(list(owners), fetch_month=partial(client.month_games, pgns=False)):
+        yield owners[url], games
 
-def get_tt_games(username):
-    archives = get_user_archives(username)[-3:]
-    for url in archives:
-        file_name = "_".join(url.split("/")[-6:]) + ".json"
-        if file_name not in os.listdir("user_archives"):
-            response = requests.get(url, headers=HEADERS)
-            with open(f"user_archives/{file_name}", "w") as f:
-                f.write(response.text)
 
+def add_rating_accuracies(
+    games: list[dict], tt_elo_accuracy: list[tuple[int, float]], elo_accuracy: list[tuple[int, float]]
+):
+    for game in games:
+        if "accuracies" not in game:
+            continue
 
-def get_rating_corr():
-    tt_elo_accuracy: list[tuple[int, float]] = []
-    elo_accuracy: list[tuple[int, float]] = []
-    for file_name in tqdm(ARCHIVE_FILES):
-        games = json.load(open(f"user_archives/{file_name}", "r"))["games"]
-        for game in games:
-            if "accuracies" not in game:
-                continue
+        if "tournament" in game and TOURNAMENT_ID_CONTAINS in game["tournament"]:
+            tt_elo_accuracy.append((game["white"]["rating"], game["accuracies"]["white"]))
+            tt_elo_accuracy.append((game["black"]["rating"], game["accuracies"]["black"]))
 
-            if "tournament" in game and TOURNAMENT_ID_CONTAINS in game["tournament"]:
-                tt_elo_accuracy.append((game["white"]["rating"], game["accuracies"]["white"]))
-                tt_elo_accuracy.append((game["black"]["rating"], game["accuracies"]["black"]))
+        else:
+            elo_accuracy.append((game["white"]["rating"], game["accuracies"]["white"]))
+            elo_accuracy.append((game["black"]["rating"], game["accuracies"]["black"]))
 
-            else:
-                elo_accuracy.append((game["white"]["rating"], game["accuracies"]["white"]))
-                elo_accuracy.append((game["black"]["rating"], game["accuracies"]["black"]))
 
+def print_rating_corr(tt_elo_accuracy: list[tuple[int, float]], elo_accuracy: list[tuple[int, float]]):
     print(f"TT ELO ACCURACY CORRELATION: {pearsonr(*zip(*tt_elo_accuracy))}")
     print(f"ELO ACCURACY CORRELATION: {pearsonr(*zip(*elo_accuracy))}")
 
 
-def analyze_data(username):
-    files = [filename for filename in ARCHIVE_FILES if username in filename]
-
+def analyze_data(username, games: list[dict]):
     games_data = {
         "tt_win_accuracies": [],
         "tt_draw_accuracies": [],
@@ -141,43 +134,40 @@ def analyze_data(username):
         "loss_accuracies": [],
     }
 
-    for file_name in files:
-        with open(f"user_archives/{file_name}", "r") as month_data:
-            games = json.load(month_data)["games"]
-            for game in games:
-                if "accuracies" not in game:
-                    continue
-
-                color = (
-                    "white"
-                    if username.lower() == game["white"]["username"].lower()
-                    else "black"
+    for game in games:
+        if "accuracies" not in game:
+            continue
+
+        color = (
+            "white"
+            if username.lower() == game["white"]["username"].lower()
+            else "black"
+        )
+        result = GAME_CODES.get(game[color]["result"], "other")
+
+        if (
+            "tournament" in game
+            and TOURNAMENT_ID_CONTAINS in game["tournament"]
+        ):
+            if result == "win":
+                games_data["tt_win_accuracies"].append(
+                    game["accuracies"][color]
+                )
+            elif result == "lose":
+                games_data["tt_loss_accuracies"].append(
+                    game["accuracies"][color]
                 )
-                result = GAME_CODES.get(game[color]["result"], "other")
-
-                if (
-                    "tournament" in game
-                    and TOURNAMENT_ID_CONTAINS in game["tournament"]
-                ):
-                    if result == "win":
-                        games_data["tt_win_accuracies"].append(
-                            game["accuracies"][color]
-                        )
-                    elif result == "lose":
-                        games_data["tt_loss_accuracies"].append(
-                            game["accuracies"][color]
-                        )
-                    elif result == "draw":
-                        games_data["tt_draw_accuracies"].append(
-                            game["accuracies"][color]
-                        )
-                else:
-                    if result == "win":
-                        games_data["win_accuracies"].append(game["accuracies"][color])
-                    elif result == "lose":
-                        games_data["loss_accuracies"].append(game["accuracies"][color])
-                    elif result == "draw":
-                        games_data["draw_accuracies"].append(game["accuracies"][color])
+            elif result == "draw":
+                games_data["tt_draw_accuracies"].append(
+                    game["accuracies"][color]
+                )
+        else:
+            if result == "win":
+                games_data["win_accuracies"].append(game["accuracies"][color])
+            elif result == "lose":
+                games_data["loss_accuracies"].append(game["accuracies"][color])
+            elif result == "draw":
+                games_data["draw_accuracies"].append(game["accuracies"][color])
 
     return games_data
 
@@ -251,15 +241,19 @@ def summarize_data(player_results: list[dict[str, list]]):
 
 
 def main():
-    players = get_tournament_players()
+    # everything is added up as each month arrives, so no month is kept once it's been looked at
+    player_data: dict[str, dict[str, list]] = defaultdict(lambda: defaultdict(list))
+    tt_elo_accuracy: list[tuple[int, float]] = []
+    elo_accuracy: list[tuple[int, float]] = []
 
-    # for username in tqdm(players):
-    #     get_tt_games(username)
+    for username, games in tqdm(iter_run(fetch_months), unit="month"):
+        for key, accuracies in analyze_data(username, games).items():
+            player_data[username][key].extend(accuracies)
+        add_rating_accuracies(games, tt_elo_accuracy, elo_accuracy)
 
     results: list[dict[str, list]] = []
 
-    for username in tqdm(players):
-        user_games_data = analyze_data(username)
+    for user_games_data in player_data.values():
         enough_games = all(
             [
                 (
@@ -281,7 +275,7 @@ def main():
 
     print(json.dumps(summarize_data(results), indent=2))
 
-    get_rating_corr()
+    print_rating_corr(tt_elo_accuracy, elo_accuracy)
 
 
 if __name__ == "__main__":